@@ -3,9 +3,6 @@ import argparse
 import sys
 from pathlib import Path
 
-import vertexai
-from vertexai.preview.vision_models import Image, ImageGenerationModel
-
 def remove_background_vertex(input_path: str, output_path: str, project_id: str, location: str = "us-central1"):
     import vertexai
     from vertexai.preview.vision_models import Image, ImageGenerationModel
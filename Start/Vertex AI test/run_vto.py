@@ -1,9 +1,8 @@
 from pathlib import Path
-import argparse, os, time, datetime, math, random
-from google import genai
-from google.genai.types import Image, RecontextImageSource, ProductImage
+import argparse, os, sys, time, datetime, math, random
 
 MAX_PER_CALL = 4  # обычно до 4 изображений за вызов
+COMMON_DIR = Path(__file__).resolve().parent.parent / "common"  # image_loader: декод до нужного размера + EXIF
 
 def must_file(p):
     p = Path(p)
@@ -23,6 +22,19 @@ def save_variants(resp, out_dir, ts, start_idx=0):
         saved += 1
     return saved
 
+def load_for_upload(path, max_edge, image_cls):
+    """
+    Картинка для запроса: max_edge=0 — файл как есть; иначе декод сразу в масштабе (JPEG draft),
+    поворот по EXIF и даунскейл — фото с телефона не уходят в API на 12+ Мп.
+    """
+    if not max_edge:
+        return image_cls.from_file(location=path)
+    if str(COMMON_DIR) not in sys.path:
+        sys.path.insert(0, str(COMMON_DIR))
+    from image_loader import encode_for_upload, load_image
+    data, mime = encode_for_upload(load_image(path, max_edge=max_edge, mode=None))
+    return image_cls(image_bytes=data, mime_type=mime)
+
 def main():
     ap = argparse.ArgumentParser(description="Virtual Try-On через Vertex AI (несколько вариантов)")
     ap.add_argument("--person",   required=True, type=must_file)
@@ -33,12 +45,17 @@ def main():
     ap.add_argument("--outdir",   default="results")
     ap.add_argument("--seed",     type=int, default=None, help="Использовать seed (только с --no-watermark)")
     ap.add_argument("--no-watermark", action="store_true", help="Отключить watermark (тогда можно seed)")
+    ap.add_argument("--max-edge", type=int, default=1536,
+                    help="Уменьшить фото до N px по длинной стороне перед отправкой (по умолчанию 1536; 0 — как есть)")
     args = ap.parse_args()
 
     if not args.project:
         raise SystemExit("Не задан GOOGLE_CLOUD_PROJECT (или --project).")
 
     print(f"Vertex config → project={args.project}, location={args.location}")
+    # SDK тянем только после разбора аргументов: --help и ошибки параметров не ждут импорта
+    from google import genai
+    from google.genai.types import Image, RecontextImageSource, ProductImage
     client = genai.Client(vertexai=True, project=args.project, location=args.location)
 
     ts = datetime.datetime.now().strftime("%Y%m%d_%H%M%S")
@@ -51,8 +68,8 @@ def main():
     t0 = time.time()
 
     src = RecontextImageSource(
-        person_image=Image.from_file(location=args.person),
-        product_images=[ProductImage(product_image=Image.from_file(location=args.garment))],
+        person_image=load_for_upload(args.person, args.max_edge, Image),
+        product_images=[ProductImage(product_image=load_for_upload(args.garment, args.max_edge, Image))],
     )
 
     # базовый seed, если понадобится
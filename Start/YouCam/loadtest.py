@@ -0,0 +1,144 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Нагрузочный прогон youcam_tryon.py против локального mock_server.py — полностью офлайн.
+
+Поднимает mock в этом же процессе (или берёт --url уже запущенного), генерирует входные фото,
+гонит N примерок через youcam_tryon.run_batch с заданной параллельностью и печатает
+перцентили задержки по фазам (upload_person, upload_cloth, create_task, wait, download, total),
+пропускную способность (пар в минуту) и счётчики запросов mock-сервера.
+
+    python loadtest.py -n 200 --concurrency 32
+    python loadtest.py -n 100 --concurrency 16 --batch-status --delay 5 --error-rate 0.02 --drop-rate 0.1
+    python loadtest.py -n 50 --max-p95 8          # код выхода 1, если p95 total выше 8 сек
+
+Выходы пар (manifest.json, результаты) пишутся во временную папку и удаляются, если не задан --out-dir.
+"""
+import argparse, contextlib, json, os, sys, tempfile, time
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+from urllib.request import Request, urlopen
+
+import mock_server
+import youcam_tryon as yt
+
+PHASES = ["upload_person", "upload_cloth", "create_task", "wait", "download", "total"]
+
+def percentile(xs: List[float], q: float) -> Optional[float]:
+    """Ближайший ранг; None для пустого списка."""
+    if not xs:
+        return None
+    xs = sorted(xs)
+    return xs[min(len(xs) - 1, max(0, int(round(q / 100 * len(xs) + 0.5)) - 1))]
+
+def make_inputs(out_dir: Path, persons: int, cloths: int) -> List[Path]:
+    """Уникальные «фото» (PNG из шума): разные байты — разные ключи кэша загрузок."""
+    paths = []
+    for base, (kind, n, size) in enumerate((("person", persons, (384, 512)), ("cloth", cloths, (256, 256)))):
+        for i in range(n):
+            path = out_dir / f"{kind}_{i:03d}.png"
+            path.write_bytes(mock_server.make_png(*size, seed=base * 1_000_000 + i))
+            paths.append(path)
+    return paths
+
+def phase_table(results: List[Dict[str, Any]]) -> Dict[str, Dict[str, Optional[float]]]:
+    ok = [r for r in results if r["ok"]]
+    table = {}
+    for phase in PHASES:
+        xs = [r["seconds"] if phase == "total" else r["timings"].get(phase) for r in ok]
+        xs = [x for x in xs if x is not None]
+        table[phase] = {f"p{q}": percentile(xs, q) for q in (50, 90, 95, 99)}
+        table[phase]["max"] = max(xs) if xs else None
+    return table
+
+def main():
+    p = argparse.ArgumentParser(description="Offline load test: N concurrent try-ons against the YouCam mock")
+    p.add_argument("-n", "--pairs", type=int, default=100, help="Сколько примерок (по умолчанию 100)")
+    p.add_argument("--concurrency", type=int, default=16, help="Пар одновременно (по умолчанию 16)")
+    p.add_argument("--max-rps", type=float, default=0.0, help="Лимит запросов в секунду (по умолчанию без лимита)")
+    p.add_argument("--persons", type=int, default=0, help="Разных фото людей (по умолчанию — по одному на пару)")
+    p.add_argument("--cloths", type=int, default=10, help="Разных вещей: повторы попадают в кэш загрузок (по умолчанию 10)")
+    p.add_argument("--no-upload-cache", action="store_true", help="Загружать оба файла на каждую пару")
+    p.add_argument("--batch-status", action="store_true", help="Опрашивать статусы пакетным эндпоинтом")
+    p.add_argument("--url", default=None, help="Уже запущенный mock_server.py (по умолчанию — поднять в процессе)")
+    p.add_argument("--out-dir", type=Path, default=None, help="Оставить выходы пар здесь (по умолчанию — временная папка)")
+    p.add_argument("--max-p95", type=float, default=None, help="Код выхода 1, если p95 total выше N сек")
+    p.add_argument("--verbose", action="store_true", help="Не глушить построчный вывод youcam_tryon (ошибки — в сводке)")
+    mock_server.add_state_args(p)
+    args = p.parse_args()
+
+    server = None
+    if args.url:
+        base_url = args.url.rstrip("/")
+    else:
+        server = mock_server.serve(state=mock_server.state_from_args(args))
+        base_url = server.base_url
+
+    # Всё офлайн: свой URL и фиктивный ключ; окружение настоящего аккаунта не трогаем
+    os.environ["YCE_API_KEY"] = "mock-key"
+    yt.YCE_BASE_URL = base_url
+    if args.batch_status:
+        yt.ENDPOINTS["task_status_batch"] = mock_server.DEFAULT_BATCH_STATUS_PATH
+
+    with tempfile.TemporaryDirectory(prefix="youcam_loadtest_") as tmp:
+        tmp = Path(tmp)
+        persons = args.persons or args.pairs
+        inputs = make_inputs(tmp, persons, args.cloths)
+        person_paths, cloth_paths = inputs[:persons], inputs[persons:]
+        pairs = [(person_paths[i % persons], cloth_paths[i % args.cloths]) for i in range(args.pairs)]
+
+        yt.configure_http(pool_size=args.concurrency * yt.DOWNLOAD_WORKERS + yt.POLL_WORKERS, max_rps=args.max_rps)
+        yt.configure_downloads()
+        yt.configure_uploads(max_edge=0)
+        yt.configure_poller(history_path=None)  # история реального аккаунта не смешивается с mock
+        cache = None if args.no_upload_cache else yt.UploadCache(tmp / "upload_cache.sqlite")
+
+        print(f"-> {args.pairs} пар, {args.concurrency} одновременно, mock {base_url} "
+              f"(задача {args.delay:g}±{args.delay_spread:g} с)", file=sys.stderr)
+        out = sys.stdout if args.verbose else open(os.devnull, "w")
+        t0 = time.perf_counter()
+        try:
+            with contextlib.redirect_stdout(out), contextlib.redirect_stderr(out):
+                summary = yt.run_batch(pairs, args.out_dir or tmp / "out", concurrency=args.concurrency, cache=cache)
+        finally:
+            if out is not sys.stdout:
+                out.close()
+            yt._POLLER["poller"].close()
+        wall = time.perf_counter() - t0
+
+    if server is not None:
+        stats = server.RequestHandlerClass.state.snapshot()
+        server.shutdown()
+    else:
+        with urlopen(Request(base_url + "/_stats", headers={"Authorization": "Bearer mock-key"})) as r:
+            stats = json.loads(r.read())
+
+    table = phase_table(summary["results"])
+    print(f"\nпар: {summary['pairs']}  ok: {summary['ok']}  ошибок: {summary['errors']}  "
+          f"за {wall:.1f} сек -> {summary['pairs_per_min']} пар/мин")
+    print(f"\n{'phase':14s} {'p50':>7s} {'p90':>7s} {'p95':>7s} {'p99':>7s} {'max':>7s}   (сек)")
+    for phase in PHASES:
+        row = table[phase]
+        print(f"{phase:14s} " + " ".join(f"{row[k]:7.3f}" if row[k] is not None else f"{'-':>7s}"
+                                         for k in ("p50", "p90", "p95", "p99", "max")))
+
+    pl, up, dl = summary["polling"], summary["uploads"], summary["downloads"]
+    print(f"\nопрос: {pl['http_calls']} запросов, {pl['status_calls_per_task']} на задачу"
+          f"{' (пакетный)' if pl['batched'] else ''}")
+    print(f"загрузки: {up['count']} отправлено, {up['bytes_sent'] / 1e6:.1f} МБ"
+          + (f"; кэш: hit rate {summary['upload_cache']['hit_rate']}" if "upload_cache" in summary else ""))
+    print(f"скачано: {dl['bytes'] / 1e6:.1f} МБ, повторов {dl['retries']}")
+    print("mock: " + ", ".join(f"{k}={v}" for k, v in sorted(stats["requests"].items())))
+    errors = [r["error"] for r in summary["results"] if not r["ok"]]
+    if errors:
+        print("\nошибки (первые 5):\n  " + "\n  ".join(e[:160] for e in errors[:5]))
+
+    if args.max_p95 is not None:
+        p95 = table["total"]["p95"]
+        if p95 is None or p95 > args.max_p95:
+            print(f"\nFAILED: p95 total {p95} сек > {args.max_p95:g} сек")
+            sys.exit(1)
+        print(f"\nOK: p95 total {p95:.3f} сек <= {args.max_p95:g} сек")
+
+if __name__ == "__main__":
+    main()
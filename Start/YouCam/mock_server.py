@@ -0,0 +1,340 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Локальная замена YouCam API для нагрузочных тестов youcam_tryon.py — без сети и без YCE_API_KEY.
+
+Реализует контракт ENDPOINTS из youcam_tryon.py (upload, create_task, task_status, download_file)
+плюс пакетный статус (POST {"task_ids": [...]}) и отдачу результатов по прямым URL (/files/...).
+Только стандартная библиотека; результаты — сгенерированные PNG заданного размера.
+
+Настраивается:
+  * длительность задачи (--delay ± --delay-spread) и задержка каждого ответа (--latency-ms);
+  * доля упавших задач (--fail-rate), HTTP 500 (--error-rate), оборванных скачиваний (--drop-rate),
+    срок жизни ссылок на загрузки (--ref-ttl: потом create_task отвечает 410);
+  * форма ответов (--shape): все варианты ключей, которые разбирает _collect_result_urls
+    (results[].url, results[].file_id, image_urls, images, urls, url), в data или без;
+    mixed — случайно на каждую задачу, как и варианты ответов upload/create_task.
+
+    python mock_server.py --port 8765 --delay 3 --fail-rate 0.05
+    YCE_BASE_URL=http://127.0.0.1:8765 YCE_API_KEY=mock python youcam_tryon.py person.jpg cloth.jpg
+
+Нагрузочный прогон поверх него — loadtest.py.
+"""
+import argparse, json, random, re, struct, threading, time, uuid, zlib
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Dict, List, Optional, Tuple
+
+from youcam_tryon import ENDPOINTS
+
+DEFAULT_BATCH_STATUS_PATH = "/api/v1.1/task/batch"
+RESULT_SHAPES = ["results_url", "results_file_id", "image_urls", "images", "urls", "url"]
+FILES_PREFIX = "/files/"
+
+def make_png(width: int, height: int, seed: int = 0) -> bytes:
+    """RGB PNG из шума (почти не сжимается — размер ответа честный, ~width*height*3)."""
+    rnd = random.Random(seed)
+    raw = b"".join(b"\x00" + rnd.randbytes(width * 3) for _ in range(height))
+
+    def chunk(tag: bytes, data: bytes) -> bytes:
+        return struct.pack(">I", len(data)) + tag + data + struct.pack(">I", zlib.crc32(tag + data) & 0xFFFFFFFF)
+
+    return (b"\x89PNG\r\n\x1a\n" + chunk(b"IHDR", struct.pack(">IIBBBBB", width, height, 8, 2, 0, 0, 0))
+            + chunk(b"IDAT", zlib.compress(raw, 1)) + chunk(b"IEND", b""))
+
+def _route(template: str) -> "re.Pattern[str]":
+    """"/api/v1.1/task/{task_id}" -> регулярка с именованными группами."""
+    return re.compile("^" + re.sub(r"\\\{(\w+)\\\}", r"(?P<\1>[^/?]+)", re.escape(template)) + "$")
+
+class MockState:
+    """Загрузки, задачи и счётчики запросов; общий для всех потоков сервера (под локом)."""
+
+    def __init__(self, delay: float = 2.0, delay_spread: float = 1.0, latency_ms: float = 0.0,
+                 fail_rate: float = 0.0, error_rate: float = 0.0, drop_rate: float = 0.0,
+                 ref_ttl: float = 0.0, shape: str = "mixed", results: int = 1,
+                 result_size: Tuple[int, int] = (512, 768), seed: int = 0):
+        self.delay = delay
+        self.delay_spread = delay_spread
+        self.latency_ms = latency_ms
+        self.fail_rate = fail_rate
+        self.error_rate = error_rate
+        self.drop_rate = drop_rate
+        self.ref_ttl = ref_ttl
+        self.shape = shape
+        self.results = results
+        self.rnd = random.Random(seed)
+        self.png = make_png(*result_size, seed=seed)
+        self.refs: Dict[str, float] = {}           # file_id или URL загрузки -> когда загружен
+        self.tasks: Dict[str, Dict[str, Any]] = {}
+        self.counts: Dict[str, int] = {}
+        self.bytes_in = 0
+        self.bytes_out = 0
+        self.lock = threading.Lock()
+
+    def count(self, name: str) -> None:
+        with self.lock:
+            self.counts[name] = self.counts.get(name, 0) + 1
+
+    def chance(self, p: float) -> bool:
+        with self.lock:
+            return p > 0 and self.rnd.random() < p
+
+    def pick(self, options: List[Any]) -> Any:
+        with self.lock:
+            return self.rnd.choice(options)
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self.lock:
+            return {"requests": dict(self.counts), "bytes_in": self.bytes_in, "bytes_out": self.bytes_out,
+                    "uploads": len(self.refs), "tasks": len(self.tasks)}
+
+class MockHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"  # keep-alive, как у настоящего API
+    # Буферизованный ответ: заголовки и тело уходят одним send(), иначе Nagle + delayed ACK
+    # добавляют ~40 мс к каждому запросу и мерить становится нечего
+    wbufsize = 1 << 16
+    server_version = "YouCamMock/1.0"
+    state: MockState
+    base_url = ""
+    batch_status_path = DEFAULT_BATCH_STATUS_PATH
+
+    ROUTES = {name: _route(ENDPOINTS[name]) for name in ("upload", "create_task", "task_status", "download_file")}
+
+    def log_message(self, fmt: str, *args: Any) -> None:
+        pass
+
+    # --- ответы ---
+
+    def _send(self, status: int, body: bytes, ctype: str = "application/json",
+              headers: Optional[Dict[str, str]] = None, truncate: bool = False) -> None:
+        self.send_response(status)
+        self.send_header("Content-Type", ctype)
+        self.send_header("Content-Length", str(len(body)))
+        for k, v in (headers or {}).items():
+            self.send_header(k, v)
+        self.end_headers()
+        if truncate:
+            # Обрыв посреди тела: клиент получит меньше Content-Length и должен докачать по Range
+            self.wfile.write(body[:len(body) // 3])
+            self.wfile.flush()
+            self.close_connection = True
+            return
+        self.wfile.write(body)
+        with self.state.lock:
+            self.state.bytes_out += len(body)
+
+    def _json(self, payload: Any, status: int = 200) -> None:
+        self._send(status, json.dumps(payload).encode("utf-8"))
+
+    def _wrap(self, payload: Dict[str, Any]) -> Dict[str, Any]:
+        """Иногда API кладёт всё в data — youcam_tryon разбирает оба варианта."""
+        if self.state.shape == "mixed" and self.state.chance(0.5):
+            return {"data": payload}
+        return payload
+
+    # --- общее для всех запросов ---
+
+    def _prologue(self) -> Optional[bytes]:
+        """Тело запроса, задержка и случайные 500. None — ответ уже отправлен."""
+        length = int(self.headers.get("Content-Length") or 0)
+        body = self.rfile.read(length) if length else b""
+        with self.state.lock:
+            self.state.bytes_in += len(body)
+        if self.state.latency_ms:
+            time.sleep(self.state.latency_ms / 1000)
+        if not self.path.startswith(FILES_PREFIX) and not self.headers.get("Authorization", "").startswith("Bearer "):
+            self.state.count("unauthorized")
+            self._json({"error": "missing bearer token"}, 401)
+            return None
+        if self.path != "/_stats" and self.state.chance(self.state.error_rate):
+            self.state.count("injected_500")
+            self._json({"error": "injected failure"}, 500)
+            return None
+        return body
+
+    def do_POST(self) -> None:
+        body = self._prologue()
+        if body is None:
+            return
+        path = self.path.split("?", 1)[0]
+        if self.ROUTES["upload"].match(path):
+            self._upload(body)
+        elif self.ROUTES["create_task"].match(path):
+            self._create_task(body)
+        elif path == self.batch_status_path:
+            self._batch_status(body)
+        else:
+            self._json({"error": f"no route {path}"}, 404)
+
+    def do_GET(self) -> None:
+        if self._prologue() is None:
+            return
+        path = self.path.split("?", 1)[0]
+        if path == "/_stats":
+            self._json(self.state.snapshot())
+        elif path.startswith(FILES_PREFIX):
+            self.state.count("download_url")
+            self._file()
+        elif self.ROUTES["download_file"].match(path):
+            self.state.count("download_file")
+            self._file()
+        elif (m := self.ROUTES["task_status"].match(path)):
+            self.state.count("task_status")
+            task = self._task_payload(m.group("task_id"))
+            self._json(task if task is not None else {"error": "unknown task"}, 200 if task is not None else 404)
+        else:
+            self._json({"error": f"no route {path}"}, 404)
+
+    # --- эндпоинты ---
+
+    def _upload(self, body: bytes) -> None:
+        self.state.count("upload")
+        if b'name="file"' not in body:
+            self._json({"error": "multipart field 'file' is required"}, 400)
+            return
+        file_id = "f_" + uuid.uuid4().hex[:12]
+        shape = self.state.pick(["file_id", "id", "data", "url"]) if self.state.shape == "mixed" else "file_id"
+        ref = f"{self.base_url}{FILES_PREFIX}upload_{file_id}.jpg" if shape == "url" else file_id
+        with self.state.lock:
+            self.state.refs[ref] = time.monotonic()
+        payload = {"url": ref} if shape == "url" else \
+            {"data": {"file_id": ref}} if shape == "data" else {shape: ref}
+        self._json(payload)
+
+    def _ref_ok(self, ref: str) -> bool:
+        with self.state.lock:
+            uploaded = self.state.refs.get(ref)
+        return uploaded is not None and (not self.state.ref_ttl or time.monotonic() - uploaded <= self.state.ref_ttl)
+
+    def _create_task(self, body: bytes) -> None:
+        self.state.count("create_task")
+        try:
+            inputs = json.loads(body)["inputs"]
+            person, cloth = inputs["person"], inputs["cloth"]
+        except (ValueError, KeyError, TypeError):
+            self._json({"error": "expected {\"inputs\": {\"person\", \"cloth\"}}"}, 400)
+            return
+        for ref in (person, cloth):
+            if not self._ref_ok(ref):
+                self.state.count("rejected_ref")
+                self._json({"error": f"file reference expired or unknown: {ref}"}, 410)
+                return
+        s = self.state
+        with s.lock:
+            duration = max(0.0, s.delay + s.rnd.uniform(-s.delay_spread, s.delay_spread))
+            task_id = "t_" + uuid.uuid4().hex[:12]
+            s.tasks[task_id] = {
+                "done_at": time.monotonic() + duration,
+                "failed": s.fail_rate > 0 and s.rnd.random() < s.fail_rate,
+                "shape": s.rnd.choice(RESULT_SHAPES) if s.shape == "mixed" else s.shape,
+                "status": s.rnd.choice(["succeeded", "completed", "done"]) if s.shape == "mixed" else "succeeded",
+            }
+        shape = self.state.pick(["task_id", "id", "data"]) if self.state.shape == "mixed" else "task_id"
+        self._json({"data": {"task_id": task_id}} if shape == "data" else {shape: task_id})
+
+    def _task_payload(self, task_id: str) -> Optional[Dict[str, Any]]:
+        with self.state.lock:
+            task = self.state.tasks.get(task_id)
+        if task is None:
+            return None
+        if time.monotonic() < task["done_at"]:
+            return self._wrap({"task_id": task_id, "status": "running"})
+        if task["failed"]:
+            return self._wrap({"task_id": task_id, "status": "failed", "error": "injected task failure"})
+        ids = [f"r_{task_id}_{i}" for i in range(1, self.state.results + 1)]
+        urls = [f"{self.base_url}{FILES_PREFIX}{rid}.png" for rid in ids]
+        shape = task["shape"]
+        payload: Dict[str, Any] = {"task_id": task_id, "status": task["status"]}
+        if shape == "results_url":
+            payload["results"] = [{"url": u} for u in urls]
+        elif shape == "results_file_id":
+            payload["results"] = [{"file_id": rid} for rid in ids]
+        elif shape == "url":
+            payload["url"] = urls[0]
+        else:
+            payload[shape] = urls
+        return self._wrap(payload)
+
+    def _batch_status(self, body: bytes) -> None:
+        self.state.count("task_status_batch")
+        try:
+            task_ids = json.loads(body)["task_ids"]
+        except (ValueError, KeyError, TypeError):
+            self._json({"error": "expected {\"task_ids\": [...]}"}, 400)
+            return
+        tasks = []
+        for task_id in task_ids:
+            payload = self._task_payload(task_id)
+            if payload is not None:
+                tasks.append(dict(payload.get("data", payload), task_id=task_id))
+        self._json({"data": {"tasks": tasks}})
+
+    def _file(self) -> None:
+        data = self.state.png
+        rng = re.match(r"bytes=(\d+)-$", self.headers.get("Range", ""))
+        start = int(rng.group(1)) if rng else 0
+        if start >= len(data) and start:
+            self._send(416, b"", headers={"Content-Range": f"bytes */{len(data)}"})
+            return
+        headers = {"Accept-Ranges": "bytes"}
+        if start:
+            headers["Content-Range"] = f"bytes {start}-{len(data) - 1}/{len(data)}"
+        drop = self.state.chance(self.state.drop_rate)
+        if drop:
+            self.state.count("injected_drop")
+        self._send(206 if start else 200, data[start:], ctype="image/png", headers=headers, truncate=drop)
+
+def serve(host: str = "127.0.0.1", port: int = 0, state: Optional[MockState] = None,
+          batch_status_path: str = DEFAULT_BATCH_STATUS_PATH) -> ThreadingHTTPServer:
+    """Запустить в фоновом потоке. port=0 — свободный порт (server.server_address). Остановка — server.shutdown()."""
+    server = ThreadingHTTPServer((host, port), MockHandler)
+    server.daemon_threads = True
+    base_url = f"http://{host}:{server.server_address[1]}"
+    server.RequestHandlerClass = type("BoundMockHandler", (MockHandler,), {
+        "state": state or MockState(), "base_url": base_url, "batch_status_path": batch_status_path})
+    server.base_url = base_url  # type: ignore[attr-defined]
+    threading.Thread(target=server.serve_forever, name="youcam-mock", daemon=True).start()
+    return server
+
+def add_state_args(p: argparse.ArgumentParser) -> None:
+    """Параметры MockState — общие для mock_server.py и loadtest.py."""
+    p.add_argument("--delay", type=float, default=2.0, help="Средняя длительность задачи, сек (по умолчанию 2)")
+    p.add_argument("--delay-spread", type=float, default=1.0, help="Разброс длительности ±, сек (по умолчанию 1)")
+    p.add_argument("--latency-ms", type=float, default=0.0, help="Задержка каждого ответа, мс")
+    p.add_argument("--fail-rate", type=float, default=0.0, help="Доля задач, которые завершатся status=failed")
+    p.add_argument("--error-rate", type=float, default=0.0, help="Доля запросов, на которые ответить HTTP 500")
+    p.add_argument("--drop-rate", type=float, default=0.0, help="Доля скачиваний, оборванных посреди тела")
+    p.add_argument("--ref-ttl", type=float, default=0.0, help="Срок жизни ссылок на загрузки, сек (0 — вечно)")
+    p.add_argument("--shape", choices=["mixed"] + RESULT_SHAPES, default="mixed",
+                   help="Форма ответа с результатами (по умолчанию mixed — случайная на задачу)")
+    p.add_argument("--results", type=int, default=1, help="Результатов на задачу (по умолчанию 1)")
+    p.add_argument("--result-size", default="512x768", help="Размер PNG-результата WxH (по умолчанию 512x768)")
+    p.add_argument("--seed", type=int, default=0)
+
+def state_from_args(args: argparse.Namespace) -> MockState:
+    w, h = (int(x) for x in args.result_size.lower().split("x"))
+    return MockState(delay=args.delay, delay_spread=args.delay_spread, latency_ms=args.latency_ms,
+                     fail_rate=args.fail_rate, error_rate=args.error_rate, drop_rate=args.drop_rate,
+                     ref_ttl=args.ref_ttl, shape=args.shape, results=args.results, result_size=(w, h), seed=args.seed)
+
+def main():
+    p = argparse.ArgumentParser(description="Local mock of the YouCam try-on API (offline)")
+    p.add_argument("--host", default="127.0.0.1")
+    p.add_argument("--port", type=int, default=8765)
+    p.add_argument("--batch-status-path", default=DEFAULT_BATCH_STATUS_PATH,
+                   help=f"Путь пакетного статуса (по умолчанию {DEFAULT_BATCH_STATUS_PATH})")
+    add_state_args(p)
+    args = p.parse_args()
+
+    server = serve(args.host, args.port, state_from_args(args), args.batch_status_path)
+    print(f"YouCam mock on {server.base_url}  (статистика: {server.base_url}/_stats)")
+    print(f"  export YCE_BASE_URL={server.base_url} YCE_API_KEY=mock "
+          f"YCE_BATCH_STATUS_PATH={args.batch_status_path}   # последнее — по желанию")
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        server.shutdown()
+        print(json.dumps(server.RequestHandlerClass.state.snapshot(), indent=2))
+
+if __name__ == "__main__":
+    main()
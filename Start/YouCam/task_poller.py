@@ -0,0 +1,262 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Планировщик опроса статусов задач: один поток ведёт все task_id сразу.
+
+Раньше каждая пара спала фиксированные POLL_INTERVAL_SEC и опрашивала свою задачу отдельным
+запросом: до 2 с лишней задержки после готовности, а при сотне задач — сотня запросов каждые 2 с.
+Здесь:
+  * расписание — по истории длительностей задач (перцентили p10/p50/p90, копятся между запусками):
+    до p10 не спрашиваем вовсе, между p10 и p90 опрашиваем часто (min_interval), после p90 —
+    экспоненциальный backoff до max_interval; пока истории нет — фиксированный first_interval;
+  * опрос видит «готово» не в момент завершения, а на ближайшем шаге сетки опроса, поэтому в историю
+    идёт середина между последним «ещё идёт» и «готово» — иначе расписание, не спрашивающее до p10,
+    кормило бы себя собственной завышенной оценкой; плюс доля probe_rate задач впервые опрашивается
+    на половине p10 — так расписание замечает, что задачи стали быстрее;
+  * jitter ±jitter, чтобы задачи, созданные одновременно, не опрашивались одной пачкой;
+  * если у API есть пакетный статус (fetch_many), все «созревшие» задачи (и те, чей срок
+    наступит в ближайшие min_interval) уходят одним запросом.
+На каждую задачу считаются запросы статуса и время до результата (stats(), info из wait()).
+"""
+import heapq, itertools, json, random, statistics, threading, time
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+DEFAULT_POLL_HISTORY_PATH = Path("outputs") / "poll_history.json"
+HISTORY_SIZE = 200       # сколько последних длительностей помнить
+MIN_HISTORY = 5          # меньше — перцентилям не верим, опрос с first_interval
+
+class _Task:
+    __slots__ = ("task_id", "future", "started", "calls", "errors", "after_p90", "last_pending")
+
+    def __init__(self, task_id: str):
+        self.task_id = task_id
+        self.future: Future = Future()
+        self.started = time.monotonic()
+        self.calls = 0
+        self.errors = 0
+        self.after_p90 = 0
+        self.last_pending = 0.0   # когда опрос последний раз видел «ещё идёт» (сек от старта)
+
+class TaskPoller:
+    """
+    fetch_one(task_id) -> payload; fetch_many(task_ids) -> {task_id: payload} (необязателен);
+    state_of(payload) -> "done" | "failed" | None (ещё идёт).
+    wait(task_id) блокирует вызывающий поток до результата: (payload, info) или исключение
+    (RuntimeError — задача упала, TimeoutError — дольше max_wait).
+    """
+
+    def __init__(self, fetch_one: Callable[[str], Dict[str, Any]],
+                 state_of: Callable[[Dict[str, Any]], Optional[str]],
+                 fetch_many: Optional[Callable[[List[str]], Dict[str, Dict[str, Any]]]] = None,
+                 first_interval: float = 2.0, min_interval: float = 0.5, max_interval: float = 8.0,
+                 factor: float = 1.6, jitter: float = 0.2, max_wait: float = 300.0, max_errors: int = 3,
+                 max_batch: int = 50, workers: int = 4, history_path: Optional[Path] = DEFAULT_POLL_HISTORY_PATH,
+                 probe_rate: float = 0.1):
+        self.fetch_one = fetch_one
+        self.fetch_many = fetch_many
+        self.state_of = state_of
+        self.first_interval = first_interval
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.factor = factor
+        self.jitter = jitter
+        self.max_wait = max_wait
+        self.max_errors = max_errors
+        self.max_batch = max_batch
+        self.probe_rate = probe_rate
+        self.history_path = Path(history_path) if history_path else None
+        self.history: deque = deque(self._load_history(), maxlen=HISTORY_SIZE)
+        self.http_calls = 0
+        self._finished: List[Dict[str, Any]] = []
+        self._heap: List[Tuple[float, int, _Task]] = []
+        self._seq = itertools.count()
+        self._cond = threading.Condition()
+        self._closed = False
+        self._thread: Optional[threading.Thread] = None
+        self._pool = ThreadPoolExecutor(max_workers=max(1, workers), thread_name_prefix="poll")
+
+    def _load_history(self) -> List[float]:
+        if self.history_path is None:
+            return []
+        try:
+            return [float(x) for x in json.loads(self.history_path.read_text(encoding="utf-8"))["durations"]]
+        except (OSError, ValueError, KeyError, TypeError):
+            return []
+
+    def _save_history(self) -> None:
+        if self.history_path is None or not self.history:
+            return
+        self.history_path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = self.history_path.with_name(self.history_path.name + ".tmp")
+        tmp.write_text(json.dumps({"durations": [round(x, 3) for x in self.history]}), encoding="utf-8")
+        tmp.replace(self.history_path)
+
+    def percentiles(self) -> Optional[Tuple[float, float, float]]:
+        """(p10, p50, p90) длительности задачи по истории или None, пока её мало."""
+        with self._cond:
+            hist = list(self.history)
+        if len(hist) < MIN_HISTORY:
+            return None
+        q = statistics.quantiles(hist, n=10, method="inclusive")
+        return q[0], q[4], q[8]
+
+    def _next_delay(self, task: _Task, elapsed: float) -> float:
+        pct = self.percentiles()
+        if pct is None:
+            delay = self.first_interval
+        else:
+            p10, _, p90 = pct
+            if elapsed < p10:
+                delay = p10 - elapsed            # раньше самых быстрых задач спрашивать незачем
+                if task.calls == 0 and random.random() < self.probe_rate:
+                    delay *= 0.5                 # ранняя проба: не стали ли задачи быстрее истории
+            elif elapsed <= p90:
+                delay = self.min_interval        # окно, где задачи обычно и завершаются
+            else:
+                task.after_p90 += 1
+                delay = min(self.max_interval, self.min_interval * self.factor ** task.after_p90)
+        delay *= random.uniform(1 - self.jitter, 1 + self.jitter)
+        return max(0.05, min(delay, self.max_wait - elapsed + 0.05))
+
+    def _censored(self, task: _Task, elapsed: float) -> float:
+        """
+        Оценка длительности задачи: она закончилась между последним «ещё идёт» и этим «готово» — берём середину.
+        Готова с первого же опроса — нижней границы нет; середина [0, elapsed] тянула бы историю вниз,
+        поэтому считаем, что опоздали не больше чем на шаг сетки (min_interval).
+        """
+        if task.last_pending > 0:
+            return (task.last_pending + elapsed) / 2
+        return max(elapsed - self.min_interval / 2, elapsed / 2)
+
+    def submit(self, task_id: str) -> Future:
+        task = _Task(task_id)
+        with self._cond:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._loop, name="task-poller", daemon=True)
+                self._thread.start()
+            self._schedule(task, self._next_delay(task, 0.0))
+        return task.future
+
+    def wait(self, task_id: str) -> Tuple[Dict[str, Any], Dict[str, Any]]:
+        return self.submit(task_id).result()
+
+    def _schedule(self, task: _Task, delay: float) -> None:
+        heapq.heappush(self._heap, (time.monotonic() + delay, next(self._seq), task))
+        self._cond.notify()
+
+    def _loop(self) -> None:
+        while True:
+            with self._cond:
+                while not self._heap and not self._closed:
+                    self._cond.wait()
+                if self._closed and not self._heap:
+                    return
+                wait = self._heap[0][0] - time.monotonic()
+                if wait > 0:
+                    self._cond.wait(wait)
+                    continue
+                # пакетный статус: заодно берём задачи, чей срок наступит в ближайшие min_interval —
+                # иначе из-за jitter они почти никогда не попадают в один запрос
+                horizon = time.monotonic() + (self.min_interval if self.fetch_many is not None else 0.0)
+                due = []
+                while self._heap and self._heap[0][0] <= horizon:
+                    due.append(heapq.heappop(self._heap)[2])
+            self._poll(due)
+
+    def _poll(self, due: List[_Task]) -> None:
+        if self.fetch_many is not None:
+            for i in range(0, len(due), self.max_batch):
+                chunk = due[i:i + self.max_batch]
+                self.http_calls += 1
+                try:
+                    payloads = self.fetch_many([t.task_id for t in chunk])
+                except Exception as e:
+                    for task in chunk:
+                        self._handle(task, None, e)
+                    continue
+                for task in chunk:
+                    payload = payloads.get(task.task_id)
+                    try:
+                        self._handle(task, payload, None if payload is not None else
+                                     RuntimeError(f"пакетный статус без задачи {task.task_id}"))
+                    except Exception as e:
+                        # state_of упал на кривом элементе ответа — поток опроса должен жить,
+                        # иначе все wait() повиснут навсегда
+                        self._handle(task, None, e)
+        else:
+            self.http_calls += len(due)
+            futures = [(task, self._pool.submit(self.fetch_one, task.task_id)) for task in due]
+            for task, fut in futures:
+                try:
+                    self._handle(task, fut.result(), None)
+                except Exception as e:
+                    self._handle(task, None, e)
+
+    def _handle(self, task: _Task, payload: Optional[Dict[str, Any]], error: Optional[Exception]) -> None:
+        task.calls += 1
+        elapsed = time.monotonic() - task.started
+        info = {"status_calls": task.calls, "errors": task.errors, "time_to_result_sec": round(elapsed, 3),
+                "batched": self.fetch_many is not None}
+        if error is not None:
+            task.errors += 1
+            info["errors"] = task.errors
+            if task.errors >= self.max_errors:
+                self._finish(task, info, exc=error)
+                return
+        else:
+            state = self.state_of(payload)   # может упасть на кривом ответе — тогда ошибка не сбрасывается
+            task.errors = 0
+            if state == "done":
+                with self._cond:
+                    self.history.append(self._censored(task, elapsed))
+                self._finish(task, info, payload=payload)
+                return
+            if state == "failed":
+                self._finish(task, info, exc=RuntimeError(f"Задача завершилась с ошибкой: {payload}"))
+                return
+            task.last_pending = elapsed
+        if elapsed > self.max_wait:
+            self._finish(task, info, exc=TimeoutError(
+                f"Ожидание задачи {task.task_id} превысило {self.max_wait:g} сек."))
+            return
+        with self._cond:
+            self._schedule(task, self._next_delay(task, elapsed))
+
+    def _finish(self, task: _Task, info: Dict[str, Any], payload: Optional[Dict[str, Any]] = None,
+                exc: Optional[Exception] = None) -> None:
+        info["ok"] = exc is None
+        with self._cond:
+            self._finished.append(info)
+        if exc is not None:
+            task.future.set_exception(exc)
+        else:
+            task.future.set_result((payload, info))
+
+    def stats(self) -> Dict[str, Any]:
+        with self._cond:
+            done = list(self._finished)
+        ttr = sorted(i["time_to_result_sec"] for i in done if i["ok"])
+        calls = [i["status_calls"] for i in done]
+        pct = self.percentiles()
+        return {
+            "tasks": len(done),
+            "http_calls": self.http_calls,
+            "status_calls_per_task": round(sum(calls) / len(calls), 2) if calls else None,
+            "time_to_result_p50": round(statistics.median(ttr), 3) if ttr else None,
+            "time_to_result_max": ttr[-1] if ttr else None,
+            "batched": self.fetch_many is not None,
+            "history_percentiles": [round(x, 3) for x in pct] if pct else None,
+        }
+
+    def close(self) -> None:
+        """Дождаться задач в работе, остановить поток и сохранить историю длительностей."""
+        with self._cond:
+            self._closed = True
+            self._cond.notify()
+        if self._thread is not None:
+            self._thread.join()
+        self._pool.shutdown(wait=True)
+        self._save_history()
@@ -0,0 +1,178 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Локальный кэш загрузок YouCam (SQLite): sha256 файла + тип загрузки (person/cloth) -> file_id/URL.
+
+Одна и та же вещь из каталога примеряется тысячами пользователей — загружать её каждый раз
+незачем: повторная примерка берёт ссылку из кэша и вообще не ходит в upload.
+Ссылки у провайдера живут не вечно, поэтому:
+  * TTL — запись старше ttl_sec не выдаётся (и удаляется);
+  * если API всё же отклонил ссылку из кэша (create_task вернул 4xx), youcam_tryon зовёт
+    invalidate() и загружает файл заново.
+Счётчики (попадания, промахи, сэкономленные байты) копятся в той же базе между запусками.
+"""
+import hashlib, os, sqlite3, threading, time
+from pathlib import Path
+from typing import Any, Callable, Dict, Optional, Tuple
+
+DEFAULT_UPLOAD_CACHE_PATH = Path("outputs") / "upload_cache.sqlite"
+DEFAULT_TTL_SEC = int(os.getenv("YCE_UPLOAD_TTL_SEC", str(24 * 3600)))
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS uploads (
+    content_hash TEXT NOT NULL,
+    ftype        TEXT NOT NULL,
+    ref          TEXT NOT NULL,
+    size_bytes   INTEGER NOT NULL,
+    created_at   REAL NOT NULL,
+    last_used    REAL NOT NULL,
+    uses         INTEGER NOT NULL DEFAULT 0,
+    PRIMARY KEY (content_hash, ftype)
+);
+CREATE TABLE IF NOT EXISTS counters (
+    name  TEXT PRIMARY KEY,
+    value INTEGER NOT NULL
+);
+"""
+
+def file_hash(path: Path, chunk_size: int = 1 << 20) -> str:
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(chunk_size), b""):
+            h.update(block)
+    return h.hexdigest()
+
+class UploadCache:
+    """
+    Ссылки на загруженные файлы по содержимому. Одно соединение на процесс, потоки batch-режима — под локом.
+    Параллельные загрузки одного и того же файла (несколько пар с одной вещью) не дублируются:
+    get_or_upload держит лок на ключ, остальные ждут и получают попадание.
+    """
+
+    def __init__(self, path: Path = DEFAULT_UPLOAD_CACHE_PATH, ttl_sec: int = DEFAULT_TTL_SEC):
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.ttl_sec = ttl_sec
+        self.hits = 0
+        self.misses = 0
+        self.expired = 0
+        self.invalidated = 0
+        self.bytes_saved = 0
+        self._lock = threading.Lock()
+        self._key_locks: Dict[Tuple[str, str], threading.Lock] = {}
+        self._db = sqlite3.connect(str(self.path), timeout=30, check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.executescript(_SCHEMA)
+        with self._lock, self._db:
+            if self.ttl_sec > 0:
+                self._db.execute("DELETE FROM uploads WHERE created_at < ?", (time.time() - self.ttl_sec,))
+
+    def get(self, content_hash: str, ftype: str) -> Optional[str]:
+        found = self._get(content_hash, ftype)
+        return found[0] if found is not None else None
+
+    def _get(self, content_hash: str, ftype: str) -> Optional[Tuple[str, int]]:
+        """(ref, байт, которые не пришлось отправить) или None."""
+        now = time.time()
+        with self._lock, self._db:
+            row = self._db.execute(
+                "SELECT ref, size_bytes, created_at FROM uploads WHERE content_hash = ? AND ftype = ?",
+                (content_hash, ftype),
+            ).fetchone()
+            if row is not None and self.ttl_sec > 0 and now - row[2] > self.ttl_sec:
+                self._db.execute("DELETE FROM uploads WHERE content_hash = ? AND ftype = ?", (content_hash, ftype))
+                self.expired += 1
+                self._bump("expired")
+                row = None
+            if row is None:
+                self.misses += 1
+                self._bump("misses")
+                return None
+            self.hits += 1
+            self.bytes_saved += row[1]
+            self._bump("hits")
+            self._bump("bytes_saved", row[1])
+            self._db.execute(
+                "UPDATE uploads SET last_used = ?, uses = uses + 1 WHERE content_hash = ? AND ftype = ?",
+                (now, content_hash, ftype),
+            )
+        return row[0], row[1]
+
+    def put(self, content_hash: str, ftype: str, ref: str, size_bytes: int) -> None:
+        """size_bytes — сколько байт ушло при загрузке (после пре-обработки): столько сэкономит каждое попадание."""
+        now = time.time()
+        with self._lock, self._db:
+            self._db.execute(
+                "INSERT OR REPLACE INTO uploads (content_hash, ftype, ref, size_bytes, created_at, last_used, uses) "
+                "VALUES (?, ?, ?, ?, ?, ?, 0)",
+                (content_hash, ftype, ref, size_bytes, now, now),
+            )
+
+    def invalidate(self, content_hash: str, ftype: str, ref: str) -> None:
+        """
+        API отклонил ссылку ref (истекла или удалена у провайдера) — забываем её.
+        Удаляем только если в кэше всё ещё она: параллельный запрос мог уже перезагрузить файл,
+        и свежую ссылку трогать нельзя. Зовётся после попадания, так что байты того попадания
+        не сэкономлены — вычитаем их обратно.
+        """
+        with self._lock, self._db:
+            row = self._db.execute("SELECT size_bytes FROM uploads WHERE content_hash = ? AND ftype = ? AND ref = ?",
+                                   (content_hash, ftype, ref)).fetchone()
+            if row is None:
+                return
+            deleted = self._db.execute("DELETE FROM uploads WHERE content_hash = ? AND ftype = ? AND ref = ?",
+                                       (content_hash, ftype, ref)).rowcount
+            if not deleted:
+                return
+            self.invalidated += 1
+            self.bytes_saved -= row[0]
+            self._bump("invalidated")
+            self._bump("bytes_saved", -row[0])
+
+    def get_or_upload(self, content_hash: str, ftype: str,
+                      upload: Callable[[], Tuple[str, int]]) -> Tuple[str, bool, int]:
+        """
+        Ссылка из кэша или upload() -> (ref, отправлено байт) с запоминанием.
+        Возвращает (ref, попадание ли, байт: сэкономлено при попадании, отправлено при промахе).
+        """
+        with self._lock:
+            key_lock = self._key_locks.setdefault((content_hash, ftype), threading.Lock())
+        with key_lock:
+            found = self._get(content_hash, ftype)
+            if found is not None:
+                return found[0], True, found[1]
+            ref, sent = upload()
+            self.put(content_hash, ftype, ref, sent)
+            return ref, False, sent
+
+    def _bump(self, name: str, amount: int = 1) -> None:
+        self._db.execute(
+            "INSERT INTO counters (name, value) VALUES (?, ?) "
+            "ON CONFLICT(name) DO UPDATE SET value = value + excluded.value",
+            (name, amount),
+        )
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            entries = self._db.execute("SELECT COUNT(*) FROM uploads").fetchone()[0]
+            totals = dict(self._db.execute("SELECT name, value FROM counters").fetchall())
+        lookups = self.hits + self.misses
+        total_lookups = totals.get("hits", 0) + totals.get("misses", 0)
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 3) if lookups else None,
+            "bytes_saved": self.bytes_saved,
+            "expired": self.expired,
+            "invalidated": self.invalidated,
+            "entries": entries,
+            "ttl_sec": self.ttl_sec,
+            "total_hits": totals.get("hits", 0),
+            "total_misses": totals.get("misses", 0),
+            "total_hit_rate": round(totals.get("hits", 0) / total_lookups, 3) if total_lookups else None,
+            "total_bytes_saved": totals.get("bytes_saved", 0),
+        }
+
+    def close(self) -> None:
+        with self._lock:
+            self._db.close()
@@ -5,17 +5,35 @@
 Принимает 2 параметра: путь к фото человека и путь к фото одежды.
 Требуется API-ключ (переменная окружения YCE_API_KEY).
 Эндпоинты заданы константами ниже — при необходимости подправьте их под вашу учетку.
+
+Пакетный режим: список пар человек×одежда (CSV или JSON), пары идут параллельно
+через один keep-alive пул соединений, с общим лимитом запросов в секунду:
+    python youcam_tryon.py --batch pairs.csv --concurrency 8 --max-rps 5
+
+Загрузки кэшируются по содержимому (upload_cache.py): повторная примерка той же вещи
+не загружает её заново. Отключить — --no-upload-cache.
+Тело загрузки читается с диска по кускам (файл целиком в память не попадает); --upload-max-edge
+уменьшает фото перед отправкой — сервис всё равно работает с уменьшенной копией.
 """
 import argparse
+import csv
 import json
+import mimetypes
 import os
 import sys
+import threading
 import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from datetime import datetime
+from io import BytesIO
 from pathlib import Path
-from typing import Dict, Any, List, Optional
+from typing import BinaryIO, Dict, Any, List, Optional, Tuple
+
+from task_poller import DEFAULT_POLL_HISTORY_PATH, TaskPoller
+from upload_cache import DEFAULT_TTL_SEC, DEFAULT_UPLOAD_CACHE_PATH, UploadCache, file_hash
 
-import requests
+# requests импортируется внутри функций, которые ходят в сеть: --help и проверка аргументов без него
 
 # === Настройки API (подредактируйте под вашу среду/аккаунт) ===
 # Базовый URL; у некоторых аккаунтов путь может отличаться (например /api, /v1, и т.п.).
@@ -30,11 +48,36 @@ ENDPOINTS = {
     "task_status": "/api/v1.1/task/{task_id}",
     # Скачивание файла по file_id (если API выдает id вместо URL)
     "download_file": "/api/v1.1/file/{file_id}/download",
+    # Пакетный статус (POST {"task_ids": [...]}), если он есть у вашего аккаунта; пусто — опрос по одной задаче
+    "task_status_batch": os.getenv("YCE_BATCH_STATUS_PATH", ""),
 }
 
-# Таймауты/ретраи
+# Таймауты/ретраи. Опрос статуса — task_poller.TaskPoller: пока нет истории длительностей задач,
+# раз в POLL_INTERVAL_SEC; потом часто (POLL_MIN) в окне p10..p90 и с backoff до POLL_MAX после
 POLL_INTERVAL_SEC = float(os.getenv("YCE_POLL_INTERVAL_SEC", "2.0"))
+POLL_MIN_INTERVAL_SEC = float(os.getenv("YCE_POLL_MIN_SEC", "0.5"))
+POLL_MAX_INTERVAL_SEC = float(os.getenv("YCE_POLL_MAX_SEC", "8.0"))
+POLL_WORKERS = 4  # параллельных запросов статуса, когда пакетного эндпоинта нет
 MAX_WAIT_SEC = int(os.getenv("YCE_MAX_WAIT_SEC", "300"))  # 5 минут по умолчанию
+# Пакетный режим: пар одновременно и общий лимит запросов в секунду (0 — без лимита)
+BATCH_CONCURRENCY = int(os.getenv("YCE_CONCURRENCY", "4"))
+MAX_RPS = float(os.getenv("YCE_MAX_RPS", "5"))
+# Ответы create_task, которыми API отклоняет несуществующую/истёкшую ссылку на файл
+REJECTED_REF_STATUSES = {400, 404, 410, 422}
+# Пре-обработка перед загрузкой: длинная сторона (0 — отправлять файл как есть) и качество JPEG
+UPLOAD_MAX_EDGE = int(os.getenv("YCE_UPLOAD_MAX_EDGE", "0"))
+UPLOAD_QUALITY = int(os.getenv("YCE_UPLOAD_QUALITY", "85"))
+STREAM_UPLOAD_MIN_BYTES = 1 << 20  # тело больше — читается с диска по кускам, меньше — одним bytes
+COMMON_DIR = Path(__file__).resolve().parent.parent / "common"  # image_loader: декод до нужного размера + EXIF
+# Скачивание результатов: параллельно внутри пары, большими кусками, с докачкой .part после обрыва
+DOWNLOAD_WORKERS = int(os.getenv("YCE_DOWNLOAD_WORKERS", "4"))
+DOWNLOAD_CHUNK_BYTES = int(os.getenv("YCE_DOWNLOAD_CHUNK_KB", "1024")) * 1024
+DOWNLOAD_RETRIES = int(os.getenv("YCE_DOWNLOAD_RETRIES", "3"))
+# --transcode: PIL-формат и расширение
+TRANSCODE_FORMATS = {"webp": ("WEBP", ".webp"), "jpeg": ("JPEG", ".jpg")}
+
+class RejectedReferenceError(RuntimeError):
+    """create_task не принял person/cloth ссылку — если она из кэша загрузок, её надо выбросить и загрузить заново."""
 
 def _url(path: str) -> str:
     return (YCE_BASE_URL.rstrip("/") + path)
@@ -48,15 +91,151 @@ def _headers() -> Dict[str, str]:
         "Authorization": f"Bearer {api_key}",
     }
 
-def upload_file(file_path: Path, ftype: str) -> str:
-    """Загрузка файла. Возвращает file_id (или прямой URL, если API его отдает).
-    ftype: 'person' или 'cloth' (проверьте в вашей документации: иногда 'user'/'cloth').
+class RateLimiter:
+    """Не больше rate запросов в секунду на весь процесс (token bucket: до burst запросов подряд, дальше — по rate)."""
+
+    def __init__(self, rate: float, burst: Optional[float] = None):
+        self.rate = rate
+        self.capacity = burst or max(1.0, rate)
+        self._tokens = self.capacity
+        self._last = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self) -> None:
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(self.capacity, self._tokens + (now - self._last) * self.rate)
+                self._last = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                wait = (1 - self._tokens) / self.rate
+            time.sleep(wait)
+
+# Одна requests.Session на процесс: keep-alive вместо нового TCP+TLS на каждый запрос,
+# ключ из окружения читается один раз. Создаётся лениво (configure_http или первый запрос).
+_HTTP: Dict[str, Any] = {}
+_HTTP_LOCK = threading.Lock()
+
+def configure_http(pool_size: int = 10, max_rps: float = 0.0) -> None:
+    """Пул соединений на pool_size параллельных запросов и общий лимит max_rps (0 — без лимита)."""
+    import requests
+    from requests.adapters import HTTPAdapter
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=4, pool_maxsize=max(1, pool_size))
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    session.headers.update(_headers())
+    with _HTTP_LOCK:
+        _HTTP.update(session=session, limiter=RateLimiter(max_rps) if max_rps > 0 else None)
+
+def _request(method: str, url: str, **kwargs: Any) -> Any:
+    """Все запросы к API — через общий пул и лимитер. Проверка статуса — на вызывающем."""
+    if "session" not in _HTTP:
+        configure_http()  # одиночный запуск; пакетный режим настраивает пул заранее в main
+    with _HTTP_LOCK:
+        session, limiter = _HTTP["session"], _HTTP["limiter"]
+    if limiter is not None:
+        limiter.acquire()
+    kwargs.setdefault("timeout", 60)
+    return session.request(method, url, **kwargs)
+
+class _MultipartBody:
+    """
+    multipart/form-data, который читается по кускам: requests отдаёт тело в http.client через read(),
+    а Content-Length берёт из __len__ — файл с диска в память целиком не попадает.
+    """
+
+    def __init__(self, fields: Dict[str, str], file_field: str, filename: str, stream: BinaryIO, size: int):
+        self.boundary = uuid.uuid4().hex
+        ctype = mimetypes.guess_type(filename)[0] or "application/octet-stream"
+        safe_name = filename.replace('"', "%22")
+        head = "".join(f'--{self.boundary}\r\nContent-Disposition: form-data; name="{k}"\r\n\r\n{v}\r\n'
+                       for k, v in fields.items())
+        head += (f'--{self.boundary}\r\nContent-Disposition: form-data; name="{file_field}"; filename="{safe_name}"\r\n'
+                 f"Content-Type: {ctype}\r\n\r\n")
+        tail = f"\r\n--{self.boundary}--\r\n".encode()
+        self._parts = [BytesIO(head.encode("utf-8")), stream, BytesIO(tail)]
+        self._len = len(head.encode("utf-8")) + size + len(tail)
+
+    @property
+    def content_type(self) -> str:
+        return f"multipart/form-data; boundary={self.boundary}"
+
+    def __len__(self) -> int:
+        return self._len
+
+    def read(self, size: int = -1) -> bytes:
+        out = b""
+        while self._parts and (size < 0 or len(out) < size):
+            block = self._parts[0].read(-1 if size < 0 else size - len(out))
+            if not block:
+                self._parts.pop(0).close()
+                continue
+            out += block
+        return out
+
+# Настройки пре-обработки загрузок (configure_uploads из main; по умолчанию — из окружения)
+_UPLOAD: Dict[str, Any] = {"max_edge": UPLOAD_MAX_EDGE, "quality": UPLOAD_QUALITY}
+
+def configure_uploads(max_edge: int = UPLOAD_MAX_EDGE, quality: int = UPLOAD_QUALITY) -> None:
+    """max_edge=0 — файлы уходят как есть."""
+    _UPLOAD.update(max_edge=max_edge, quality=quality)
+
+def _preprocess(file_path: Path) -> Optional[Tuple[bytes, str]]:
     """
+    Уменьшить до max_edge и перекодировать (JPEG, PNG — если есть альфа) в память. Возвращает (bytes, mime).
+    None — отправлять исходный файл: пре-обработка выключена, не уменьшила ни размер, ни байты
+    или PIL не умеет формат (HEIC, AVIF без плагина) — API он может подойти и как есть.
+    """
+    max_edge = _UPLOAD["max_edge"]
+    if not max_edge:
+        return None
+    if str(COMMON_DIR) not in sys.path:
+        sys.path.insert(0, str(COMMON_DIR))
+    from PIL import Image
+    from image_loader import encode_for_upload, load_image, open_image, oriented_size
+    try:
+        with open_image(str(file_path)) as im:
+            resized = max(oriented_size(im)) > max_edge
+            data, mime = encode_for_upload(load_image(im, max_edge=max_edge, mode=None), quality=_UPLOAD["quality"])
+    except (OSError, Image.DecompressionBombError) as e:
+        print(f"[warn] {file_path}: пре-обработка не удалась ({e}) — загружаю как есть", file=sys.stderr)
+        return None
+    if not resized and len(data) >= file_path.stat().st_size:
+        return None
+    return data, mime
+
+def _upload_key_suffix() -> str:
+    """Пре-обработка меняет отправляемые байты — ключ кэша загрузок должен это учитывать."""
+    return f"@{_UPLOAD['max_edge']}q{_UPLOAD['quality']}" if _UPLOAD["max_edge"] else ""
+
+def _upload(file_path: Path, ftype: str) -> Tuple[str, Dict[str, Any]]:
+    """upload_file + статистика: байт до/после пре-обработки и время запроса (для manifest)."""
     url = _url(ENDPOINTS["upload"])
+    original = file_path.stat().st_size
+    t0 = time.perf_counter()
+    prepared = _preprocess(file_path)
+    t_prep = time.perf_counter() - t0
+    if prepared is None:
+        stream, size, name = open(file_path, "rb"), original, file_path.name
+    else:
+        data, mime = prepared
+        stream, size = BytesIO(data), len(data)
+        name = file_path.stem + (".png" if mime == "image/png" else ".jpg")
     # Тип поля и параметров может отличаться в вашей сборке — наиболее частый вариант ниже:
-    files = {"file": (file_path.name, file_path.read_bytes())}
-    data = {"type": ftype}
-    resp = requests.post(url, headers=_headers(), files=files, data=data, timeout=60)
+    body = _MultipartBody({"type": ftype}, "file", name, stream, size)
+    # Маленькое тело — одним куском: http.client шлёт bytes вместе с заголовками, а поток — отдельным send(),
+    # и на мелких запросах это +40 мс (Nagle + delayed ACK). Большое — потоком с диска.
+    data = body.read() if size <= STREAM_UPLOAD_MIN_BYTES else body
+    t1 = time.perf_counter()
+    try:
+        resp = _request("POST", url, data=data, headers={"Content-Type": body.content_type}, timeout=60)
+    finally:
+        stream.close()
+    stats = {"bytes_original": original, "bytes_sent": size, "preprocessed": prepared is not None,
+             "preprocess_sec": round(t_prep, 3), "upload_sec": round(time.perf_counter() - t1, 3)}
     if resp.status_code >= 400:
         raise RuntimeError(f"Upload failed ({resp.status_code}): {resp.text}")
     payload = resp.json()
@@ -64,10 +243,16 @@ def upload_file(file_path: Path, ftype: str) -> str:
     file_id = payload.get("file_id") or payload.get("id") or payload.get("data", {}).get("file_id")
     if not file_id and ("url" in payload or ("data" in payload and "url" in payload["data"])):
         # Некоторые API сразу возвращают прямую ссылку
-        return payload.get("url") or payload["data"]["url"]
+        return payload.get("url") or payload["data"]["url"], stats
     if not file_id:
         raise RuntimeError(f"Не удалось извлечь file_id из ответа: {payload}")
-    return file_id
+    return file_id, stats
+
+def upload_file(file_path: Path, ftype: str) -> str:
+    """Загрузка файла. Возвращает file_id (или прямой URL, если API его отдает).
+    ftype: 'person' или 'cloth' (проверьте в вашей документации: иногда 'user'/'cloth').
+    """
+    return _upload(file_path, ftype)[0]
 
 def create_tryon_task(person_ref: str, cloth_ref: str) -> str:
     """Создает задачу clothes try-on и возвращает task_id."""
@@ -81,7 +266,9 @@ def create_tryon_task(person_ref: str, cloth_ref: str) -> str:
         # Вы можете добавить опции генерации/вариаций здесь, если ваш тариф это поддерживает.
         # "options": {"num_results": 4, "preserve_face": True}
     }
-    resp = requests.post(url, headers={**_headers(), "Content-Type": "application/json"}, json=body, timeout=60)
+    resp = _request("POST", url, json=body, timeout=60)
+    if resp.status_code in REJECTED_REF_STATUSES:
+        raise RejectedReferenceError(f"Create task failed ({resp.status_code}): {resp.text}")
     if resp.status_code >= 400:
         raise RuntimeError(f"Create task failed ({resp.status_code}): {resp.text}")
     payload = resp.json()
@@ -90,24 +277,57 @@ def create_tryon_task(person_ref: str, cloth_ref: str) -> str:
         raise RuntimeError(f"Не удалось извлечь task_id из ответа: {payload}")
     return task_id
 
+def _task_state(payload: Dict[str, Any]) -> Optional[str]:
+    """"done" / "failed" / None — задача ещё идёт."""
+    status = payload.get("status") or payload.get("data", {}).get("status")
+    if status in {"succeeded", "completed", "done"}:
+        return "done"
+    if status in {"failed", "error"}:
+        return "failed"
+    return None
+
+def fetch_task_status(task_id: str) -> Dict[str, Any]:
+    """Один запрос статуса задачи."""
+    resp = _request("GET", _url(ENDPOINTS["task_status"]).format(task_id=task_id), timeout=30)
+    if resp.status_code >= 400:
+        raise RuntimeError(f"Task status failed ({resp.status_code}): {resp.text}")
+    return resp.json()
+
+def fetch_task_statuses(task_ids: List[str]) -> Dict[str, Dict[str, Any]]:
+    """Пакетный статус: {task_id: payload}. Ответ — список задач (в data/tasks/results) или словарь по task_id."""
+    resp = _request("POST", _url(ENDPOINTS["task_status_batch"]), json={"task_ids": task_ids}, timeout=30)
+    if resp.status_code >= 400:
+        raise RuntimeError(f"Batch task status failed ({resp.status_code}): {resp.text}")
+    payload = resp.json()
+    items = payload.get("data", payload)
+    if isinstance(items, dict):
+        items = items.get("tasks") or items.get("results") or items
+    if isinstance(items, list):
+        return {str(it.get("task_id") or it.get("id")): it for it in items if isinstance(it, dict)}
+    return {str(k): v for k, v in items.items() if isinstance(v, dict)}
+
+# Один планировщик опроса на процесс (как и пул соединений): все задачи — в одном цикле
+_POLLER: Dict[str, TaskPoller] = {}
+
+def configure_poller(history_path: Optional[Path] = DEFAULT_POLL_HISTORY_PATH) -> TaskPoller:
+    poller = TaskPoller(
+        fetch_task_status, _task_state,
+        fetch_many=fetch_task_statuses if ENDPOINTS["task_status_batch"] else None,
+        first_interval=POLL_INTERVAL_SEC, min_interval=POLL_MIN_INTERVAL_SEC,
+        max_interval=POLL_MAX_INTERVAL_SEC, max_wait=MAX_WAIT_SEC, workers=POLL_WORKERS, history_path=history_path,
+    )
+    with _HTTP_LOCK:
+        _POLLER["poller"] = poller
+    return poller
+
+def _poller() -> TaskPoller:
+    with _HTTP_LOCK:
+        poller = _POLLER.get("poller")
+    return poller if poller is not None else configure_poller()
+
 def wait_for_task(task_id: str) -> Dict[str, Any]:
-    """Пуллинг статуса задачи до завершения или таймаута. Возвращает финальный payload."""
-    url_tpl = _url(ENDPOINTS["task_status"])
-    deadline = time.time() + MAX_WAIT_SEC
-    while True:
-        url = url_tpl.format(task_id=task_id)
-        resp = requests.get(url, headers=_headers(), timeout=30)
-        if resp.status_code >= 400:
-            raise RuntimeError(f"Task status failed ({resp.status_code}): {resp.text}")
-        payload = resp.json()
-        status = payload.get("status") or payload.get("data", {}).get("status")
-        if status in {"succeeded", "completed", "done"}:
-            return payload
-        if status in {"failed", "error"}:
-            raise RuntimeError(f"Задача завершилась с ошибкой: {payload}")
-        if time.time() > deadline:
-            raise TimeoutError(f"Ожидание задачи {task_id} превысило {MAX_WAIT_SEC} сек.")
-        time.sleep(POLL_INTERVAL_SEC)
+    """Ожидание задачи до завершения или таймаута через общий планировщик. Возвращает финальный payload."""
+    return _poller().wait(task_id)[0]
 
 def _ensure_dir(base_out: Optional[Path]) -> Path:
     ts = datetime.now().strftime("%Y-%m-%d_%H-%M-%S")
@@ -118,13 +338,82 @@ def _ensure_dir(base_out: Optional[Path]) -> Path:
 def _save_manifest(out_dir: Path, manifest: Dict[str, Any]) -> None:
     (out_dir / "manifest.json").write_text(json.dumps(manifest, indent=2, ensure_ascii=False))
 
-def _download_to(path: Path, url: str) -> None:
-    with requests.get(url, headers=_headers(), stream=True, timeout=120) as r:
+# Настройки скачивания (configure_downloads из main; по умолчанию — из окружения)
+_DOWNLOAD: Dict[str, Any] = {"workers": DOWNLOAD_WORKERS, "chunk_bytes": DOWNLOAD_CHUNK_BYTES,
+                             "retries": DOWNLOAD_RETRIES, "transcode": None, "quality": 90}
+
+def configure_downloads(workers: int = DOWNLOAD_WORKERS, chunk_bytes: int = DOWNLOAD_CHUNK_BYTES,
+                        retries: int = DOWNLOAD_RETRIES, transcode: Optional[str] = None, quality: int = 90) -> None:
+    """transcode: None — сохранять как отдал API, иначе ключ TRANSCODE_FORMATS."""
+    _DOWNLOAD.update(workers=max(1, workers), chunk_bytes=chunk_bytes, retries=retries,
+                     transcode=transcode, quality=quality)
+
+def _fetch_part(url: str, part: Path, chunk_size: int) -> int:
+    """
+    Один заход: дописать part с того места, где он оборвался (Range). Возвращает, сколько байт уже было.
+    Сервер без Range (200 вместо 206) — пишем с начала. Обрыв/5xx — исключение requests, 4xx — RuntimeError.
+    При обрыве теряется только недочитанный кусок (до chunk_size) — он будет запрошен заново.
+    """
+    import requests
+    have = part.stat().st_size if part.exists() else 0
+    headers = {"Range": f"bytes={have}-"} if have else {}
+    with _request("GET", url, headers=headers, stream=True, timeout=120) as r:
+        if r.status_code == 416 and have:
+            return have  # .part уже целиком
+        if 400 <= r.status_code < 500:
+            raise RuntimeError(f"Download failed ({r.status_code}): {url}")
         r.raise_for_status()
-        with open(path, "wb") as f:
-            for chunk in r.iter_content(chunk_size=8192):
-                if chunk:
-                    f.write(chunk)
+        resumed = have if r.status_code == 206 else 0
+        length = int(r.headers.get("Content-Length") or 0)
+        with open(part, "ab" if resumed else "wb") as f:
+            for chunk in r.iter_content(chunk_size=chunk_size):
+                f.write(chunk)
+        if length and part.stat().st_size < resumed + length:
+            raise requests.exceptions.ChunkedEncodingError(f"оборвалось на {part.stat().st_size} из {resumed + length} байт")
+    return resumed
+
+def _transcode(path: Path, fmt: str, quality: int) -> Path:
+    """Перекодировать скачанный результат (PNG от API обычно в разы больше WebP/JPEG). Возвращает новый путь."""
+    from PIL import Image
+    pil_format, ext = TRANSCODE_FORMATS[fmt]
+    out = path.with_suffix(ext)
+    tmp = out.with_name(out.name + ".part")
+    with Image.open(path) as im:
+        if pil_format == "JPEG" and im.mode != "RGB":
+            im = im.convert("RGB")
+        im.save(tmp, format=pil_format, quality=quality)
+    os.replace(tmp, out)
+    if out != path:
+        path.unlink()
+    return out
+
+def _download_to(path: Path, url: str) -> Dict[str, Any]:
+    """
+    Скачивание в <path>.part с докачкой после обрыва (до retries повторов); готовый файл — os.replace на место,
+    так что неполный результат никогда не лежит под итоговым именем. Возвращает статистику для manifest.
+    """
+    import requests
+    opts = _DOWNLOAD
+    part = path.with_name(path.name + ".part")
+    t0 = time.perf_counter()
+    retries = resumed = 0
+    while True:
+        try:
+            resumed += _fetch_part(url, part, opts["chunk_bytes"])
+            break
+        except requests.exceptions.RequestException as e:
+            retries += 1
+            if retries > opts["retries"]:
+                raise RuntimeError(f"Download failed after {opts['retries']} retries ({e}): {url}") from e
+            time.sleep(min(8.0, 0.5 * 2 ** retries))
+    os.replace(part, path)
+    size = path.stat().st_size
+    info = {"file": str(path), "bytes": size, "seconds": round(time.perf_counter() - t0, 3),
+            "retries": retries, "resumed_bytes": resumed}
+    if opts["transcode"]:
+        path = _transcode(path, opts["transcode"], opts["quality"])
+        info.update(file=str(path), transcoded_bytes=path.stat().st_size)
+    return info
 
 def _collect_result_urls(final_payload: Dict[str, Any]) -> List[str]:
     # Унифицируем сбор ссылок на изображения из разных ответов
@@ -146,66 +435,273 @@ def _collect_result_urls(final_payload: Dict[str, Any]) -> List[str]:
             candidates.append(data["url"])
     return candidates
 
-def _resolve_and_download_results(urls_or_ids: List, out_dir: Path) -> List[Path]:
-    saved = []
+def _resolve_and_download_results(urls_or_ids: List, out_dir: Path) -> Tuple[List[Path], List[Dict[str, Any]]]:
+    """Все результаты пары параллельно (общий пул соединений). Возвращает (файлы, статистика по каждому)."""
+    jobs = []
     for i, item in enumerate(urls_or_ids, start=1):
         if isinstance(item, tuple) and item and item[0] == "file_id:":
             file_id = item[1]
-            dl = _url(ENDPOINTS["download_file"].format(file_id=file_id))
-            out_path = out_dir / f"result_{i:02d}.png"
-            _download_to(out_path, dl)
-            saved.append(out_path)
+            jobs.append((out_dir / f"result_{i:02d}.png", _url(ENDPOINTS["download_file"].format(file_id=file_id))))
         elif isinstance(item, str) and item.startswith("http"):
-            out_path = out_dir / f"result_{i:02d}.png"
-            _download_to(out_path, item)
-            saved.append(out_path)
+            jobs.append((out_dir / f"result_{i:02d}.png", item))
         else:
             # Если непонятный формат — просто запишем в manifest для ручной дообработки
             pass
-    return saved
+    if not jobs:
+        return [], []
+    with ThreadPoolExecutor(max_workers=min(_DOWNLOAD["workers"], len(jobs)), thread_name_prefix="download") as pool:
+        infos = list(pool.map(lambda job: _download_to(*job), jobs))
+    return [Path(info["file"]) for info in infos], infos
 
-def run(person_image: Path, cloth_image: Path, out_dir: Optional[Path]) -> Path:
-    out = _ensure_dir(out_dir)
-    manifest = {"inputs": {"person": str(person_image), "cloth": str(cloth_image)}, "steps": []}
+def _upload_cached(file_path: Path, ftype: str,
+                   cache: Optional[UploadCache]) -> Tuple[str, Optional[str], str, Dict[str, Any]]:
+    """
+    Загрузка через кэш. Возвращает (ref, ключ кэша или None без кэша, "hit"/"miss"/"off", статистика).
+    Ключ — sha256 файла плюс параметры пре-обработки: с другим max_edge уходят другие байты.
+    """
+    if cache is None:
+        ref, stats = _upload(file_path, ftype)
+        return ref, None, "off", stats
+    digest = file_hash(file_path) + _upload_key_suffix()
+    stats: Dict[str, Any] = {}
+
+    def _do() -> Tuple[str, int]:
+        ref, s = _upload(file_path, ftype)
+        stats.update(s)
+        return ref, s["bytes_sent"]
+
+    t0 = time.perf_counter()
+    ref, hit, nbytes = cache.get_or_upload(digest, ftype, _do)
+    if hit:
+        stats = {"bytes_original": file_path.stat().st_size, "bytes_sent": 0, "bytes_saved": nbytes,
+                 "lookup_sec": round(time.perf_counter() - t0, 3)}
+    return ref, digest, "hit" if hit else "miss", stats
 
-    print("-> Загружаем фото человека...")
-    person_ref = upload_file(person_image, "person")
-    manifest["steps"].append({"upload_person": person_ref})
+def run_pair(person_image: Path, cloth_image: Path, out: Path, label: str = "",
+             cache: Optional[UploadCache] = None) -> Dict[str, Any]:
+    """Одна пара в готовую папку out: загрузки -> задача -> ожидание -> скачивание. Возвращает manifest."""
+    out.mkdir(parents=True, exist_ok=True)
+    manifest = {"inputs": {"person": str(person_image), "cloth": str(cloth_image)}, "steps": [], "timings": {},
+                "uploads": {}}
+    upload_info: Dict[str, Any] = {"bytes_saved": 0, "invalidated": []}
+    t = time.perf_counter()
+
+    def _lap(step: str) -> None:
+        nonlocal t
+        now = time.perf_counter()
+        manifest["timings"][step] = round(now - t, 3)
+        t = now
 
-    print("-> Загружаем фото одежды...")
-    cloth_ref = upload_file(cloth_image, "cloth")
-    manifest["steps"].append({"upload_cloth": cloth_ref})
+    refs: Dict[str, str] = {}
+    digests: Dict[str, Optional[str]] = {}
+    for ftype, image in (("person", person_image), ("cloth", cloth_image)):
+        print(f"{label}-> Загружаем фото {'человека' if ftype == 'person' else 'одежды'}...")
+        refs[ftype], digests[ftype], upload_info[ftype], manifest["uploads"][ftype] = _upload_cached(image, ftype, cache)
+        upload_info["bytes_saved"] += manifest["uploads"][ftype].get("bytes_saved", 0)
+        manifest["steps"].append({f"upload_{ftype}": refs[ftype]})
+        _lap(f"upload_{ftype}")
 
-    print("-> Создаем try-on задачу...")
-    task_id = create_tryon_task(person_ref, cloth_ref)
+    print(f"{label}-> Создаем try-on задачу...")
+    try:
+        task_id = create_tryon_task(refs["person"], refs["cloth"])
+    except RejectedReferenceError as e:
+        # Какую именно ссылку не принял API, из ответа не понять — перезагружаем все, что взяли из кэша
+        stale = [ftype for ftype in refs if upload_info[ftype] == "hit"]
+        if not stale:
+            raise
+        print(f"{label}-> Ссылки из кэша отклонены ({', '.join(stale)}), загружаем заново...")
+        for ftype in stale:
+            image = person_image if ftype == "person" else cloth_image
+            cache.invalidate(digests[ftype], ftype, refs[ftype])
+            upload_info["bytes_saved"] -= manifest["uploads"][ftype].get("bytes_saved", 0)
+            refs[ftype], digests[ftype], upload_info[ftype], manifest["uploads"][ftype] = _upload_cached(image, ftype, cache)
+            upload_info["invalidated"].append({"type": ftype, "error": str(e)})
+            manifest["steps"].append({f"upload_{ftype}": refs[ftype]})
+        task_id = create_tryon_task(refs["person"], refs["cloth"])
     manifest["steps"].append({"task_id": task_id})
+    _lap("create_task")
+    if cache is not None:
+        manifest["upload_cache"] = {**upload_info, "stats": cache.stats()}
 
-    print("-> Ждем завершения задачи...")
-    final_payload = wait_for_task(task_id)
+    print(f"{label}-> Ждем завершения задачи...")
+    final_payload, manifest["polling"] = _poller().wait(task_id)
     manifest["final_payload"] = final_payload
+    _lap("wait")
 
-    print("-> Скачиваем результаты...")
+    print(f"{label}-> Скачиваем результаты...")
     urls_or_ids = _collect_result_urls(final_payload)
-    saved = _resolve_and_download_results(urls_or_ids, out)
+    t_dl = time.perf_counter()
+    saved, downloads = _resolve_and_download_results(urls_or_ids, out)
     manifest["saved_files"] = [str(p) for p in saved]
+    _lap("download")
+    total = sum(d["bytes"] for d in downloads)
+    wall = time.perf_counter() - t_dl
+    manifest["downloads"] = {
+        "bytes": total, "seconds": round(wall, 3), "mb_per_s": round(total / 1e6 / wall, 2) if wall > 0 else None,
+        "retries": sum(d["retries"] for d in downloads), "files": downloads,
+    }
 
     _save_manifest(out, manifest)
-    print(f"Готово. Сохранено {len(saved)} файл(ов) в {out}")
+    print(f"{label}Готово. Сохранено {len(saved)} файл(ов) в {out}")
+    return manifest
+
+def run(person_image: Path, cloth_image: Path, out_dir: Optional[Path], cache: Optional[UploadCache] = None) -> Path:
+    out = _ensure_dir(out_dir)
+    run_pair(person_image, cloth_image, out, cache=cache)
     return out
 
+def load_pairs(list_path: Path) -> List[Tuple[Path, Path]]:
+    """
+    Пары из CSV (колонки person,cloth; заголовок необязателен) или JSON
+    ([{"person": ..., "cloth": ...}] или [[person, cloth]]). Относительные пути — от папки списка.
+    """
+    base = list_path.resolve().parent
+    if list_path.suffix.lower() == ".json":
+        rows = json.loads(list_path.read_text(encoding="utf-8"))
+        raw = [(r["person"], r["cloth"]) if isinstance(r, dict) else (r[0], r[1]) for r in rows]
+    else:
+        with open(list_path, newline="", encoding="utf-8") as f:
+            raw = [(r[0].strip(), r[1].strip()) for r in csv.reader(f) if len(r) >= 2 and r[0].strip()]
+        if raw and raw[0] == ("person", "cloth"):
+            raw = raw[1:]
+    pairs = []
+    for person, cloth in raw:
+        pp, cp = Path(person), Path(cloth)
+        pairs.append((pp if pp.is_absolute() else base / pp, cp if cp.is_absolute() else base / cp))
+    return pairs
+
+def run_batch(pairs: List[Tuple[Path, Path]], out_dir: Optional[Path],
+              concurrency: int = BATCH_CONCURRENCY, cache: Optional[UploadCache] = None) -> Dict[str, Any]:
+    """
+    Пары параллельно (concurrency штук одновременно, каждая — в свою подпапку с manifest.json).
+    Сводка с пропускной способностью (пар в минуту) — в batch.json в корне вывода.
+    """
+    out = _ensure_dir(out_dir)
+    n = len(pairs)
+    rows: List[Dict[str, Any]] = []
+    t0 = time.perf_counter()
+
+    def _one(i: int, person: Path, cloth: Path) -> Dict[str, Any]:
+        pair_dir = out / f"{i:03d}_{person.stem}__{cloth.stem}"
+        t = time.perf_counter()
+        row = {"index": i, "person": str(person), "cloth": str(cloth), "out_dir": str(pair_dir)}
+        try:
+            manifest = run_pair(person, cloth, pair_dir, label=f"[{i}/{n}] ", cache=cache)
+            row.update(ok=True, saved=len(manifest["saved_files"]), timings=manifest["timings"], uploads=manifest["uploads"],
+                       download_bytes=manifest["downloads"]["bytes"], download_retries=manifest["downloads"]["retries"])
+        except Exception as e:
+            print(f"[{i}/{n}] [ОШИБКА] {e}", file=sys.stderr)
+            row.update(ok=False, error=str(e))
+        row["seconds"] = round(time.perf_counter() - t, 3)
+        return row
+
+    with ThreadPoolExecutor(max_workers=max(1, concurrency), thread_name_prefix="tryon") as pool:
+        futures = [pool.submit(_one, i, person, cloth) for i, (person, cloth) in enumerate(pairs, start=1)]
+        for fut in as_completed(futures):
+            rows.append(fut.result())
+    wall = time.perf_counter() - t0
+
+    ok = sum(1 for r in rows if r["ok"])
+    summary = {
+        "pairs": n, "ok": ok, "errors": n - ok, "concurrency": concurrency,
+        "max_rps": _HTTP["limiter"].rate if _HTTP.get("limiter") else 0,
+        "wall_sec": round(wall, 3), "pairs_per_min": round(ok / wall * 60, 2) if wall > 0 else 0.0,
+        "results": sorted(rows, key=lambda r: r["index"]),
+    }
+    if cache is not None:
+        summary["upload_cache"] = cache.stats()
+    summary["polling"] = _poller().stats()
+    sent = [u for r in rows for u in r.get("uploads", {}).values() if u.get("bytes_sent")]
+    latency = sorted(u["upload_sec"] for u in sent)
+    summary["uploads"] = {
+        "count": len(sent), "bytes_original": sum(u["bytes_original"] for u in sent),
+        "bytes_sent": sum(u["bytes_sent"] for u in sent),
+        "upload_sec_p50": latency[len(latency) // 2] if latency else None,
+        "upload_sec_p95": latency[min(len(latency) - 1, int(len(latency) * 0.95))] if latency else None,
+        "mb_per_s": round(sum(u["bytes_sent"] for u in sent) / 1e6 / sum(latency), 2) if sum(latency) > 0 else None,
+    }
+    dl_bytes = sum(r.get("download_bytes", 0) for r in rows)
+    dl_seconds = sum(r["timings"]["download"] for r in rows if r["ok"])
+    summary["downloads"] = {"bytes": dl_bytes, "retries": sum(r.get("download_retries", 0) for r in rows),
+                            "mb_per_s_per_pair": round(dl_bytes / 1e6 / dl_seconds, 2) if dl_seconds > 0 else None}
+    (out / "batch.json").write_text(json.dumps(summary, indent=2, ensure_ascii=False))
+    print(f"\nпар: {n}  ok: {ok}  ошибок: {n - ok}  за {wall:.1f} сек -> {summary['pairs_per_min']} пар/мин  ({out})")
+    if cache is not None:
+        c = summary["upload_cache"]
+        print(f"кэш загрузок: {c['hits']} попаданий / {c['misses']} промахов (hit rate {c['hit_rate']}), "
+              f"не отправлено {c['bytes_saved'] / 1e6:.1f} МБ")
+    u = summary["uploads"]
+    if u["count"]:
+        print(f"загрузки: {u['count']}, {u['bytes_original'] / 1e6:.1f} -> {u['bytes_sent'] / 1e6:.1f} МБ, "
+              f"p50 {u['upload_sec_p50']} сек, p95 {u['upload_sec_p95']} сек")
+    pl = summary["polling"]
+    print(f"опрос статусов: {pl['http_calls']} запросов, {pl['status_calls_per_task']} на задачу, "
+          f"время до результата p50 {pl['time_to_result_p50']} сек")
+    d = summary["downloads"]
+    print(f"скачано: {d['bytes'] / 1e6:.1f} МБ, {d['mb_per_s_per_pair']} МБ/с на пару, повторов: {d['retries']}")
+    return summary
+
 def main():
     p = argparse.ArgumentParser(description="YouCam / Perfect Corp AI Clothes Try-On (demo)")
-    p.add_argument("person", type=Path, help="Путь к фото человека (портрет/полный рост)")
-    p.add_argument("cloth", type=Path, help="Путь к фото одежды (flat-lay/каталог)")
+    p.add_argument("person", type=Path, nargs="?", help="Путь к фото человека (портрет/полный рост)")
+    p.add_argument("cloth", type=Path, nargs="?", help="Путь к фото одежды (flat-lay/каталог)")
     p.add_argument("--out-dir", type=Path, default=None, help="Папка вывода (по умолчанию ./outputs/<timestamp>)")
+    p.add_argument("--batch", type=Path, default=None, metavar="LIST",
+                   help="CSV (person,cloth) или JSON со списком пар — вместо person/cloth")
+    p.add_argument("--concurrency", type=int, default=BATCH_CONCURRENCY,
+                   help=f"Пар одновременно в пакетном режиме (по умолчанию {BATCH_CONCURRENCY}, YCE_CONCURRENCY)")
+    p.add_argument("--max-rps", type=float, default=MAX_RPS,
+                   help=f"Общий лимит запросов к API в секунду (по умолчанию {MAX_RPS:g}, YCE_MAX_RPS; 0 — без лимита)")
+    p.add_argument("--upload-cache", type=Path, default=DEFAULT_UPLOAD_CACHE_PATH,
+                   help=f"SQLite-кэш загрузок по содержимому файла (по умолчанию {DEFAULT_UPLOAD_CACHE_PATH})")
+    p.add_argument("--upload-ttl", type=int, default=DEFAULT_TTL_SEC,
+                   help=f"Сколько секунд доверять ссылке из кэша (по умолчанию {DEFAULT_TTL_SEC}, YCE_UPLOAD_TTL_SEC)")
+    p.add_argument("--no-upload-cache", action="store_true", help="Загружать оба файла каждый раз")
+    p.add_argument("--upload-max-edge", type=int, default=UPLOAD_MAX_EDGE,
+                   help=f"Уменьшить фото до N px по длинной стороне перед загрузкой (по умолчанию {UPLOAD_MAX_EDGE}, "
+                        f"YCE_UPLOAD_MAX_EDGE; 0 — как есть)")
+    p.add_argument("--upload-quality", type=int, default=UPLOAD_QUALITY,
+                   help=f"Качество JPEG для --upload-max-edge (по умолчанию {UPLOAD_QUALITY}, YCE_UPLOAD_QUALITY)")
+    p.add_argument("--download-workers", type=int, default=DOWNLOAD_WORKERS,
+                   help=f"Параллельных скачиваний на пару (по умолчанию {DOWNLOAD_WORKERS}, YCE_DOWNLOAD_WORKERS)")
+    p.add_argument("--chunk-kb", type=int, default=DOWNLOAD_CHUNK_BYTES // 1024,
+                   help=f"Размер куска при скачивании, КБ (по умолчанию {DOWNLOAD_CHUNK_BYTES // 1024}, YCE_DOWNLOAD_CHUNK_KB)")
+    p.add_argument("--transcode", choices=sorted(TRANSCODE_FORMATS), default=None,
+                   help="Перекодировать результаты после скачивания (по умолчанию — как отдал API)")
+    p.add_argument("--transcode-quality", type=int, default=90, help="Качество для --transcode (по умолчанию 90)")
+    p.add_argument("--poll-history", type=Path, default=DEFAULT_POLL_HISTORY_PATH,
+                   help=f"Где копить длительности задач для расписания опроса (по умолчанию {DEFAULT_POLL_HISTORY_PATH})")
     args = p.parse_args()
+    if args.batch is None and (args.person is None or args.cloth is None):
+        p.error("укажите person и cloth или --batch LIST")
+    if args.batch is not None and args.person is not None:
+        p.error("--batch заменяет person/cloth")
 
     return_code = 0
     try:
-        run(args.person, args.cloth, args.out_dir)
+        # пара делает по одному запросу за раз, кроме скачивания (до download_workers сразу),
+        # плюс потоки опроса статусов
+        configure_http(pool_size=(args.concurrency if args.batch else 1) * args.download_workers + POLL_WORKERS,
+                       max_rps=args.max_rps)
+        configure_uploads(max_edge=args.upload_max_edge, quality=args.upload_quality)
+        configure_downloads(workers=args.download_workers, chunk_bytes=args.chunk_kb * 1024,
+                            transcode=args.transcode, quality=args.transcode_quality)
+        cache = None if args.no_upload_cache else UploadCache(args.upload_cache, ttl_sec=args.upload_ttl)
+        configure_poller(args.poll_history)
+        if args.batch is not None:
+            pairs = load_pairs(args.batch)
+            if not pairs:
+                raise RuntimeError(f"В {args.batch} нет пар")
+            summary = run_batch(pairs, args.out_dir, concurrency=args.concurrency, cache=cache)
+            return_code = 1 if summary["errors"] else 0
+        else:
+            run(args.person, args.cloth, args.out_dir, cache=cache)
     except Exception as e:
         print(f"[ОШИБКА] {e}", file=sys.stderr)
         return_code = 1
+    finally:
+        if "poller" in _POLLER:
+            _POLLER["poller"].close()  # история длительностей — для расписания следующих запусков
     sys.exit(return_code)
 
 if __name__ == "__main__":
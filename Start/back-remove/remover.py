@@ -1,8 +1,12 @@
 # remover.py
 # pip install backgroundremover
-from backgroundremover.bg import remove
 from pathlib import Path
 import argparse
+import os
+import sys
+
+# Модель, загруженная один раз, пул, сервис и манифест живут в remover_resize/
+REMOVER_DIR = Path(__file__).resolve().parent.parent / "remover_resize"
 
 def remove_bg(input_path: str) -> str:
     """Удаляет фон у изображения и сохраняет PNG в results/<stem>_no_bg.png."""
@@ -14,20 +18,71 @@ def remove_bg(input_path: str) -> str:
     out_dir.mkdir(parents=True, exist_ok=True)
     out_path = out_dir / f"{inp.stem}_no_bg.png"
 
-    # ВАЖНО: передаём байты (совместимо с вашей версией библиотеки)
     with open(inp, "rb") as f:
         img_bytes = f.read()
 
-    png_bytes = remove(img_bytes)  # без file_path/path — просто байты
-    with open(out_path, "wb") as f:
-        f.write(png_bytes)
+    # Тот же segment, что у папки/пула/сервиса (--raw): naive_cutout как в backgroundremover.bg.remove(),
+    # но с поворотом по EXIF — иначе один и тот же снимок с телефона выходил бы по-разному повёрнутым
+    if str(REMOVER_DIR) not in sys.path:
+        sys.path.insert(0, str(REMOVER_DIR))
+    from remover_resize import segment  # torch + модель — только когда реально режем фон
+    segment(img_bytes).save(out_path, format="PNG")
 
     return str(out_path)
 
 if __name__ == "__main__":
     parser = argparse.ArgumentParser(description="Remove image background and save to results/")
-    parser.add_argument("image", help="Path to input image (jpg/png/webp...)")
+    parser.add_argument("image", help="Path to input image (jpg/png/webp...), a directory, or '-' for a list of paths on stdin")
+    parser.add_argument("--workers", type=int, default=None,
+                        help="Directory/stdin mode: worker processes with a preloaded model (default: CPU cores)")
+    parser.add_argument("--service", default=os.environ.get("REMOVER_SERVICE"),
+                        help="Send work to a running remover_resize/remover_service.py (http://host:port or unix:/path.sock)")
+    parser.add_argument("--incremental", action="store_true",
+                        help="Skip inputs whose content matches the manifest (remover_resize/manifest.py); process only new/changed")
+    parser.add_argument("--watch", action="store_true",
+                        help="Keep polling the directory and process files as they land (implies --incremental; Ctrl+C to stop)")
+    parser.add_argument("--watch-interval", type=float, default=2.0, help="Seconds between polls in --watch (default: 2)")
+    parser.add_argument("--manifest", type=Path, default=None, help="Manifest file (default: results/.manifest.json)")
     args = parser.parse_args()
 
+    sys.path.insert(0, str(REMOVER_DIR))
+    from remover_pool import collect_paths, run  # без torch: модель грузят воркеры
+
+    if args.incremental or args.watch:
+        from manifest import DEFAULT_MANIFEST_PATH, Manifest, run_incremental, watch
+        if args.watch and not Path(args.image).is_dir():
+            parser.error("--watch needs a directory")
+        manifest = Manifest(args.manifest or DEFAULT_MANIFEST_PATH, params=dict(raw=True, model="u2net"))
+
+        def process(paths):
+            if args.service:
+                from remover_service import run_via_service
+                return run_via_service(paths, args.service, concurrency=args.workers or 4, manifest=manifest,
+                                       raw=True, profile="png-fast", bg="none")
+            return run(paths, args.workers, inline=args.watch or len(paths) == 1, manifest=manifest, raw=True)
+
+        if args.watch:
+            watch(lambda: collect_paths(args.image), manifest, process, interval=args.watch_interval)
+            raise SystemExit(0)
+        summary = run_incremental(lambda: collect_paths(args.image), manifest, process)
+        print(f"\nok: {summary['ok']}  errors: {summary['errors']}  {summary['images_per_sec']:.2f} img/s")
+        raise SystemExit(1 if summary["errors"] else 0)
+
+    if args.service:
+        from remover_service import remove_bg_via_service, run_via_service
+        if args.image == "-" or Path(args.image).is_dir():
+            summary = run_via_service(collect_paths(args.image), args.service, concurrency=args.workers or 4,
+                                      raw=True, profile="png-fast", bg="none")
+            print(f"\nok: {summary['ok']}  errors: {summary['errors']}  {summary['images_per_sec']:.2f} img/s")
+            raise SystemExit(1 if summary["errors"] else 0)
+        saved_to = remove_bg_via_service(args.service, args.image, raw=True, profile="png-fast", bg="none")
+        print(f"✅ Saved: {saved_to}")
+        raise SystemExit(0)
+
+    if args.image == "-" or Path(args.image).is_dir():
+        summary = run(collect_paths(args.image), args.workers, raw=True)
+        print(f"\nok: {summary['ok']}  errors: {summary['errors']}  {summary['images_per_sec']:.2f} img/s")
+        raise SystemExit(1 if summary["errors"] else 0)
+
     saved_to = remove_bg(args.image)
     print(f"✅ Saved: {saved_to}")
@@ -0,0 +1,162 @@
+# bench_startup.py
+"""
+Бенчмарк старта CLI из Start/: сколько проходит от запуска интерпретатора до конца argparse.
+
+Job runner запускает эти скрипты тысячи раз в день, поэтому --help и ошибка аргументов
+не должны тянуть тяжёлые SDK (torch/backgroundremover, google.genai, vertexai, requests) —
+они импортируются лениво, в той ветке кода, где реально нужны.
+
+Для каждой точки входа:
+    help ms    медиана wall-времени `script --help` (argparse печатает справку и выходит)
+    error ms   то же для неизвестного флага (argparse падает с кодом 2)
+    import ms  сумма импортов по `python -X importtime script --help` (отдельный прогон)
+    heavy      какие тяжёлые модули всё-таки импортировались до конца argparse
+Строка `python -c pass` — голый старт интерпретатора, его из времени скриптов не вычитаем.
+
+    python bench_startup.py
+    python bench_startup.py --repeat 10 --budget-ms 150 --top 5
+    python bench_startup.py --python ../.venv/bin/python --only gemini/classify_garment.py
+
+Код выхода 1, если хоть одна точка входа импортировала тяжёлый модуль или не уложилась в --budget-ms.
+"""
+
+import argparse, statistics, subprocess, sys, time
+from pathlib import Path
+from typing import Dict, List, Tuple
+
+ROOT = Path(__file__).resolve().parent
+
+ENTRY_POINTS: List[str] = [
+    "gemini/classify_garment.py",
+    "gemini/results_store.py",
+    "gemini/metrics.py",
+    "pipeline/garment_pipeline.py",
+    "remover_resize/remover_resize.py",
+    "remover_resize/remover_pool.py",
+    "remover_resize/remover_service.py",
+    "back-remove/remover.py",
+    "Vertex AI test/remove_bg.py",
+    "Vertex AI test/run_vto.py",
+    "YouCam/youcam_tryon.py",
+]
+
+# Модуль (или пакет целиком), которого не должно быть в импортах до конца argparse
+HEAVY_MODULES: Tuple[str, ...] = (
+    "torch", "backgroundremover", "skimage", "numpy",
+    "google.genai", "vertexai", "google.cloud.aiplatform", "requests",
+)
+
+BAD_FLAG = "--no-such-flag-bench-startup"
+
+
+def _wall_ms(cmd: List[str], repeat: int) -> Tuple[float, int]:
+    """Медиана wall-времени процесса, мс, и код выхода последнего запуска."""
+    samples = []
+    rc = 0
+    for _ in range(max(1, repeat)):
+        t = time.perf_counter()
+        rc = subprocess.run(cmd, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL).returncode
+        samples.append((time.perf_counter() - t) * 1000)
+    return statistics.median(samples), rc
+
+
+def parse_importtime(stderr: str) -> Tuple[Dict[str, int], Dict[str, int]]:
+    """
+    Разбор вывода -X importtime.
+    Возвращает (cumulative мкс по всем модулям, cumulative мкс только верхнего уровня).
+    Вложенность в выводе — отступ имени после второго '|'.
+    """
+    every: Dict[str, int] = {}
+    top: Dict[str, int] = {}
+    for line in stderr.splitlines():
+        if not line.startswith("import time:"):
+            continue
+        parts = line[len("import time:"):].split("|", 2)
+        if len(parts) != 3 or not parts[1].strip().isdigit():
+            continue  # строка-заголовок
+        cumulative = int(parts[1])
+        raw_name = parts[2]
+        name = raw_name.strip()
+        every[name] = max(every.get(name, 0), cumulative)
+        if len(raw_name) - len(raw_name.lstrip()) <= 1:
+            top[name] = top.get(name, 0) + cumulative
+    return every, top
+
+
+def heavy_loaded(modules: Dict[str, int]) -> List[str]:
+    """Тяжёлые пакеты из HEAVY_MODULES, которые встретились среди импортов."""
+    found = []
+    for heavy in HEAVY_MODULES:
+        if any(m == heavy or m.startswith(heavy + ".") for m in modules):
+            found.append(heavy)
+    return found
+
+
+def measure(python: str, script: Path, repeat: int) -> Dict:
+    help_ms, _ = _wall_ms([python, str(script), "--help"], repeat)
+    error_ms, _ = _wall_ms([python, str(script), BAD_FLAG], repeat)
+    proc = subprocess.run([python, "-X", "importtime", str(script), "--help"],
+                          stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, text=True)
+    every, top = parse_importtime(proc.stderr)
+    return {
+        "help_ms": help_ms,
+        "error_ms": error_ms,
+        "import_ms": sum(top.values()) / 1000,
+        "modules": len(every),
+        "heavy": heavy_loaded(every),
+        "top": sorted(top.items(), key=lambda kv: kv[1], reverse=True),
+        # --help при рабочем окружении всегда 0; иначе — хвост traceback (нет зависимости и т.п.)
+        "error": "" if proc.returncode == 0 else (proc.stderr.strip().splitlines() or ["?"])[-1],
+    }
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Startup time of the Start/ CLIs up to the end of argparse.")
+    ap.add_argument("--python", default=sys.executable, help="Interpreter to run the scripts with (default: this one)")
+    ap.add_argument("--repeat", type=int, default=5, help="Runs per entry point, median is reported (default: 5)")
+    ap.add_argument("--only", action="append", default=None, metavar="SCRIPT",
+                    help="Measure only this entry point (path relative to Start/); can be repeated")
+    ap.add_argument("--budget-ms", type=float, default=None,
+                    help="Fail if median --help time of any entry point exceeds this")
+    ap.add_argument("--top", type=int, default=3, help="Show N heaviest top-level imports per entry point (default: 3)")
+    args = ap.parse_args()
+
+    scripts = args.only or ENTRY_POINTS
+    base_ms, _ = _wall_ms([args.python, "-c", "pass"], args.repeat)
+
+    print(f"{'entry point':36s} {'help ms':>8s} {'error ms':>8s} {'import ms':>9s} {'modules':>7s}  heavy")
+    print(f"{'python -c pass':36s} {base_ms:>8.1f} {'-':>8s} {'-':>9s} {'-':>7s}  -")
+    failed = []
+    for rel in scripts:
+        script = ROOT / rel
+        if not script.exists():
+            raise SystemExit(f"Not found: {script}")
+        r = measure(args.python, script, args.repeat)
+        heavy = ", ".join(r["heavy"]) or "-"
+        print(f"{rel:36s} {r['help_ms']:>8.1f} {r['error_ms']:>8.1f} {r['import_ms']:>9.1f} {r['modules']:>7d}  {heavy}")
+        for name, us in r["top"][:args.top]:
+            print(f"{'':4s}{name:32s} {us / 1000:>8.1f} ms")
+        if r["error"]:
+            print(f"{'':4s}[error] {r['error']}")
+
+        reasons = []
+        if r["heavy"]:
+            reasons.append(f"heavy imports before argparse: {heavy}")
+        if args.budget_ms is not None and r["help_ms"] > args.budget_ms:
+            reasons.append(f"--help {r['help_ms']:.1f} ms > budget {args.budget_ms:.1f} ms")
+        if r["error"]:
+            reasons.append(r["error"])
+        if reasons:
+            failed.append((rel, reasons))
+
+    if failed:
+        print("\nFAILED:")
+        for rel, reasons in failed:
+            for reason in reasons:
+                print(f"  {rel}: {reason}")
+        sys.exit(1)
+    print("\nOK")
+
+
+if __name__ == "__main__":
+    main()
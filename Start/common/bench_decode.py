@@ -0,0 +1,170 @@
+# bench_decode.py
+# pip install pillow numpy
+"""
+Время и пик памяти декода по форматам: полный декод против image_loader.load_image(max_edge=N).
+
+    полный   Image.open -> exif_transpose -> convert("RGB") -> LANCZOS до max_edge
+             (как было в remover_resize / classify_garment до image_loader)
+    loader   load_image(path, max_edge=N): JPEG — draft (1/2, 1/4, 1/8), остальное — полный декод + reduce()
+
+Каждый файл — в отдельном процессе (свежий аллокатор), «peak MB» — прирост VmHWM над RSS до декода
+(сброс через /proc/self/clear_refs). Колонка draft — сработал ли scaled decode у формата.
+
+    python bench_decode.py                          # фото из ../Vertex AI test
+    python bench_decode.py photos/ --max-edge 1024
+    python bench_decode.py --synthetic 12           # 12 Мп в jpg/webp/avif/png
+"""
+
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from typing import Dict, List
+import argparse
+import statistics
+import sys
+import tempfile
+import time
+
+HERE = Path(__file__).resolve().parent
+IMAGE_EXTS = {".jpg", ".jpeg", ".png", ".webp", ".avif", ".heic", ".bmp", ".tif", ".tiff"}
+SYNTHETIC_FORMATS = {"jpg": ("JPEG", {"quality": 92}), "webp": ("WEBP", {"quality": 90}),
+                     "avif": ("AVIF", {"quality": 80}), "png": ("PNG", {"compress_level": 6})}
+
+
+def _rss_kb(field: str) -> int:
+    with open("/proc/self/status") as f:
+        for line in f:
+            if line.startswith(field + ":"):
+                return int(line.split()[1])
+    return 0
+
+
+def _reset_peak() -> bool:
+    try:
+        with open("/proc/self/clear_refs", "w") as f:
+            f.write("5")
+        return True
+    except OSError:
+        return False
+
+
+def _decode_full(path: str, max_edge: int):
+    from PIL import Image, ImageOps
+    from image_loader import target_size
+
+    im = ImageOps.exif_transpose(Image.open(path)).convert("RGB")
+    if max(im.size) > max_edge:
+        im = im.resize(target_size(im.size, max_edge), resample=Image.LANCZOS)
+    return im
+
+
+def _decode_loader(path: str, max_edge: int):
+    from image_loader import load_image
+
+    return load_image(path, max_edge=max_edge)
+
+
+def _measure(path: str, max_edge: int, repeat: int) -> Dict:
+    """В отдельном процессе: оба способа по repeat раз, медиана времени и максимум прироста пика."""
+    if str(HERE) not in sys.path:
+        sys.path.insert(0, str(HERE))
+    from image_loader import draft_to_edge, open_image, probe
+
+    info = probe(path)
+    row = {"path": path, "format": info["format"], "size": info["size"], "reset": True}
+    with open_image(path) as im:
+        row["draft"] = draft_to_edge(im, max_edge)
+    for name, fn in (("full", _decode_full), ("loader", _decode_loader)):
+        times, peaks = [], []
+        for _ in range(repeat):
+            row["reset"] &= _reset_peak()
+            base = _rss_kb("VmRSS")
+            t = time.perf_counter()
+            im = fn(path, max_edge)
+            times.append(time.perf_counter() - t)
+            peaks.append((_rss_kb("VmHWM") - base) / 1024)
+            row[name + "_out"] = im.size
+            del im
+        row[name + "_ms"] = statistics.median(times) * 1000
+        row[name + "_mb"] = max(peaks)
+    return row
+
+
+def make_synthetic(out_dir: Path, megapixels: float) -> List[str]:
+    """Одно «фото» 4:3 в каждом формате из SYNTHETIC_FORMATS, который умеет этот Pillow."""
+    import numpy as np
+    from PIL import Image, ImageDraw, features
+
+    w = int((megapixels * 1e6 * 4 / 3) ** 0.5)
+    h = int(w * 3 / 4)
+    im = Image.new("RGB", (w, h), (235, 235, 230))
+    ImageDraw.Draw(im).ellipse((w // 4, h // 6, 3 * w // 4, 5 * h // 6), fill=(40, 60, 150))
+    noise = Image.fromarray(np.random.default_rng(0).integers(0, 24, (h // 8, w // 8, 3), dtype=np.uint8))
+    im = Image.blend(im, noise.resize((w, h)), 0.15)
+
+    paths = []
+    for ext, (fmt, kwargs) in SYNTHETIC_FORMATS.items():
+        if fmt in ("WEBP", "AVIF") and not features.check(fmt.lower()):
+            print(f"[skip] {ext}: Pillow собран без {fmt}", file=sys.stderr)
+            continue
+        path = out_dir / f"synthetic_{megapixels:g}mp.{ext}"
+        im.save(path, format=fmt, **kwargs)
+        paths.append(str(path))
+    return paths
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Decode time and peak memory per format: full decode vs image_loader.")
+    parser.add_argument("source", type=Path, nargs="?", default=HERE.parent / "Vertex AI test",
+                        help="Directory with photos or one photo (default: ../Vertex AI test)")
+    parser.add_argument("--synthetic", type=float, metavar="MP", help="Also encode an MP-megapixel photo in each format")
+    parser.add_argument("--no-source", action="store_true", help="Only --synthetic images")
+    parser.add_argument("--max-edge", type=int, default=1536, help="Target long edge (default: 1536)")
+    parser.add_argument("--repeat", type=int, default=3, help="Runs per image and mode (default: 3)")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory(prefix="bench_decode_") as tmp:
+        paths = []
+        if not args.no_source and args.source.exists():
+            src = args.source
+            paths += [str(p) for p in (sorted(src.iterdir()) if src.is_dir() else [src])
+                      if p.suffix.lower() in IMAGE_EXTS]
+        if args.synthetic:
+            print("-> encoding synthetic photos ...", file=sys.stderr)
+            paths += make_synthetic(Path(tmp), args.synthetic)
+        if not paths:
+            raise SystemExit("No images")
+
+        rows = []
+        for path in paths:
+            with ProcessPoolExecutor(max_workers=1) as pool:  # новый процесс на файл
+                try:
+                    rows.append(pool.submit(_measure, path, args.max_edge, args.repeat).result())
+                except Exception as e:
+                    print(f"[error] {Path(path).name}: {e}", file=sys.stderr)
+
+    if not all(r["reset"] for r in rows):
+        print("[warn] /proc/self/clear_refs unavailable: peak is per process, not per decode", file=sys.stderr)
+
+    print(f"\nmax edge: {args.max_edge}  repeat: {args.repeat}")
+    print(f"{'image':30s} {'fmt':5s} {'size':>11s} {'draft':>5s} {'full ms':>8s} {'loader ms':>9s} "
+          f"{'full MB':>8s} {'loader MB':>9s} {'out':>11s}")
+    by_format: Dict[str, List[Dict]] = {}
+    for r in rows:
+        by_format.setdefault(r["format"], []).append(r)
+        size = "x".join(map(str, r["size"]))
+        out = "x".join(map(str, r["loader_out"]))
+        print(f"{Path(r['path']).name[:30]:30s} {r['format']:5s} {size:>11s} {'yes' if r['draft'] else 'no':>5s} "
+              f"{r['full_ms']:>8.1f} {r['loader_ms']:>9.1f} {r['full_mb']:>8.0f} {r['loader_mb']:>9.0f} {out:>11s}")
+
+    print("\n--- per format (median) ---")
+    for fmt, rs in sorted(by_format.items()):
+        full_ms = statistics.median(r["full_ms"] for r in rs)
+        loader_ms = statistics.median(r["loader_ms"] for r in rs)
+        full_mb = statistics.median(r["full_mb"] for r in rs)
+        loader_mb = statistics.median(r["loader_mb"] for r in rs)
+        print(f"{fmt:5s} n={len(rs):<3d} time {full_ms:7.1f} -> {loader_ms:7.1f} ms ({full_ms / max(loader_ms, 1e-6):4.1f}x)  "
+              f"peak {full_mb:6.0f} -> {loader_mb:6.0f} MB")
+
+
+if __name__ == "__main__":
+    main()
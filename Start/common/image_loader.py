@@ -0,0 +1,153 @@
+# image_loader.py
+# pip install pillow          (AVIF: Pillow >= 11.3 читает сам; на старых — pip install pillow-avif-plugin)
+#                             (HEIC под видом .jpg из телефонов: pip install pillow-heif — по желанию)
+"""
+Общий декод картинок для remover_resize.py, gemini/classify_garment.py и Vertex AI test/run_vto.py.
+
+load_image(source, max_edge=N) сразу целится в нужный размер, а не раскладывает полный кадр:
+    JPEG        draft(): libjpeg декодирует в масштабе 1/2, 1/4, 1/8 — ближайшем, что не меньше N;
+    WebP, AVIF  если плагин умеет scaled decode (draft) — так же; в Pillow сейчас не умеет,
+                тогда полный декод и reduce() целым шагом (быстрый box-фильтр) перед финальным LANCZOS;
+    остальное   (PNG, HEIC, ...) — как WebP.
+Поворот по EXIF Orientation и белый (или любой) фон вместо альфы — здесь же.
+Итоговый размер при exact=True — как у remover_resize.downscale_pil_to_max_edge.
+
+    from image_loader import load_image
+    im = load_image("photo.avif", max_edge=1536, bg_color=(255, 255, 255))
+
+Замер времени и памяти по форматам — bench_decode.py рядом.
+"""
+
+from io import BytesIO
+import importlib
+from typing import Any, Dict, Optional, Tuple
+import math
+
+from PIL import Image, ImageOps
+
+_PLUGINS_CHECKED = False
+
+
+def _register_optional_plugins() -> None:
+    """AVIF на старом Pillow (pillow-avif-plugin) и HEIC (pillow-heif) — если установлены; нет — не беда."""
+    global _PLUGINS_CHECKED
+    if _PLUGINS_CHECKED:
+        return
+    _PLUGINS_CHECKED = True
+    if ".avif" not in Image.registered_extensions():
+        try:
+            importlib.import_module("pillow_avif")  # регистрирует плагин при импорте
+        except ImportError:
+            pass
+    try:
+        from pillow_heif import register_heif_opener
+        register_heif_opener()
+    except ImportError:
+        pass
+
+
+def open_image(source: Any) -> Image.Image:
+    """Ленивое открытие: путь, bytes, файловый объект или уже открытая PIL-картинка. Пиксели не декодируются."""
+    if isinstance(source, Image.Image):
+        return source
+    _register_optional_plugins()
+    if isinstance(source, (bytes, bytearray, memoryview)):
+        source = BytesIO(source)
+    return Image.open(source)
+
+
+def oriented_size(im: Image.Image) -> Tuple[int, int]:
+    """Размер после поворота по EXIF (Orientation 5–8 — поворот на 90°, стороны меняются местами)."""
+    w, h = im.size
+    return (h, w) if im.getexif().get(0x0112, 1) in (5, 6, 7, 8) else (w, h)
+
+
+def supports_scaled_decode(im: Image.Image) -> bool:
+    """Умеет ли плагин формата декодировать сразу уменьшенным (свой draft(), а не заглушка Image.draft)."""
+    return type(im).draft is not Image.Image.draft
+
+
+def target_size(size: Tuple[int, int], max_edge: int) -> Tuple[int, int]:
+    """Размер после даунскейла до max_edge по длинной стороне — та же арифметика, что в downscale_pil_to_max_edge."""
+    w, h = size
+    if max(w, h) <= max_edge:
+        return w, h
+    if w >= h:
+        return max_edge, int(h * (max_edge / w))
+    return int(w * (max_edge / h)), max_edge
+
+
+def draft_to_edge(im: Image.Image, max_edge: int) -> bool:
+    """
+    Scaled decode до ближайшего масштаба, где длинная сторона ещё не меньше max_edge.
+    Только для ещё не декодированной картинки; True — плагин уменьшил декод.
+    """
+    if not max_edge or not supports_scaled_decode(im):
+        return False
+    w, h = im.size
+    scale = max_edge / max(w, h)
+    if scale >= 1:
+        return False
+    before = im.size
+    im.draft("RGB", (max(1, math.ceil(w * scale)), max(1, math.ceil(h * scale))))
+    return im.size != before
+
+
+def _has_alpha(im: Image.Image) -> bool:
+    return im.mode in ("RGBA", "LA", "PA") or (im.mode == "P" and "transparency" in im.info)
+
+
+def load_image(source: Any, max_edge: Optional[int] = None, mode: Optional[str] = "RGB",
+               bg_color: Optional[Tuple[int, int, int]] = None, exact: bool = True) -> Image.Image:
+    """
+    Декод с прицелом на max_edge (по длинной стороне после поворота) -> поворот по EXIF -> фон/режим -> размер.
+    Открытую PIL-картинку можно передать как source — она декодируется и поворачивается на месте.
+    mode:     "RGB" (по умолчанию), None — RGB или RGBA, смотря есть ли альфа; любой другой режим PIL.
+    bg_color: композит альфы на сплошной фон (результат RGB), как remover_resize.flatten_alpha.
+    exact:    True — ровно target_size (LANCZOS; при шаге от 3x сначала reduce() — reducing_gap=3, на глаз неотличимо);
+              False — только целочисленное уменьшение (draft/reduce), длинная сторона остаётся >= max_edge.
+    """
+    im = open_image(source)
+    if max_edge:
+        draft_to_edge(im, max_edge)
+    # in_place: без Orientation обычный exif_transpose отдаёт copy() — лишний кадр полного размера
+    ImageOps.exif_transpose(im, in_place=True)
+
+    if bg_color is not None and _has_alpha(im):
+        im = im.convert("RGBA")
+        bg = Image.new("RGB", im.size, bg_color)
+        bg.paste(im, mask=im)
+        im = bg
+    elif mode is None:
+        want = "RGBA" if _has_alpha(im) else "RGB"
+        if im.mode != want:
+            im = im.convert(want)
+    elif im.mode != mode:
+        im = im.convert(mode)
+
+    if max_edge and max(im.size) > max_edge:
+        if exact:
+            im = im.resize(target_size(im.size, max_edge), resample=Image.LANCZOS, reducing_gap=3.0)
+        else:
+            factor = max(im.size) // max_edge
+            if factor >= 2:
+                im = im.reduce(factor)
+    return im
+
+
+def probe(source: Any) -> Dict[str, Any]:
+    """Формат, размер (сырой и после поворота) и есть ли scaled decode — без декода пикселей."""
+    im = open_image(source)
+    return {"format": im.format, "mode": im.mode, "size": im.size, "oriented_size": oriented_size(im),
+            "scaled_decode": supports_scaled_decode(im)}
+
+
+def encode_for_upload(im: Image.Image, quality: int = 92) -> Tuple[bytes, str]:
+    """В память для API: PNG, если есть альфа (прозрачность не теряем), иначе JPEG. Возвращает (bytes, mime)."""
+    buf = BytesIO()
+    if _has_alpha(im):
+        im.save(buf, format="PNG", compress_level=6)
+        return buf.getvalue(), "image/png"
+    im.convert("RGB").save(buf, format="JPEG", quality=quality)
+    return buf.getvalue(), "image/jpeg"
+
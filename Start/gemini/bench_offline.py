@@ -0,0 +1,297 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Офлайн-бенчмарк classify_garment: без сети и без Vertex AI.
+
+Вместо genai.Client подставляется детерминированный FakeGenaiClient
+(models.generate_content + caches.create) с заданной задержкой, долей ошибок
+и числом токенов. Ответ (метки) зависит только от содержимого картинки и --seed,
+поэтому прогоны повторяемы.
+
+Этапы меряются по очереди, для каждого — wall, CPU (process_time), пик памяти
+(tracemalloc) и пропускная способность:
+    read      чтение файлов
+    analyze   analyze_with_gemini (через фейк, --concurrency потоков)
+    validate  validate_and_fix
+    write     build_result + save_result во временную папку
+    batch@N   run_batch целиком при concurrency=N (--batch-concurrency)
+
+google.genai импортируется в classify_garment лениво (при первом запросе); здесь он импортируется
+до начала замеров, иначе первый этап (analyze) заплатил бы за импорт SDK под tracemalloc.
+
+Для защиты от регрессий:
+    python bench_offline.py --save baseline.json
+    python bench_offline.py --baseline baseline.json --tolerance 0.2   # exit 1, если этап медленнее
+
+Пример:
+    python bench_offline.py "../Vertex AI test" --repeat 10 --latency-ms 300 --error-rate 0.05
+"""
+import argparse, contextlib, hashlib, importlib, io, json, random, sys, tempfile, threading, time, tracemalloc
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from types import SimpleNamespace
+from typing import Any, Callable, Dict, List
+
+import classify_garment as cg
+
+DEFAULT_CORPUS = Path(__file__).resolve().parent.parent / "Vertex AI test"
+
+# =======================
+# Фейковый клиент
+# =======================
+class FakeApiError(RuntimeError):
+    pass
+
+class _FakeModels:
+    def __init__(self, owner: "FakeGenaiClient"):
+        self._owner = owner
+
+    def generate_content(self, model: str, contents: List[Any], config: Any = None) -> Any:
+        return self._owner._generate(model, contents, config)
+
+class _FakeCaches:
+    def __init__(self, owner: "FakeGenaiClient"):
+        self._owner = owner
+
+    def create(self, model: str, config: Any = None) -> Any:
+        return self._owner._create_cache(model, config)
+
+class FakeGenaiClient:
+    """
+    Повторяет ту часть genai.Client, которой пользуется classify_garment.
+    latency_ms ± jitter_ms — «время модели» на запрос (+ per_image_ms за каждую картинку в пакете),
+    error_rate — доля запросов, падающих с FakeApiError,
+    image_tokens / output_tokens — токены на картинку; текст считаем как 1 токен на 4 символа.
+    """
+
+    def __init__(self, latency_ms: float = 0.0, jitter_ms: float = 0.0, per_image_ms: float = 0.0,
+                 error_rate: float = 0.0, image_tokens: int = 258, output_tokens: int = 60, seed: int = 0):
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self.per_image_ms = per_image_ms
+        self.error_rate = error_rate
+        self.image_tokens = image_tokens
+        self.output_tokens = output_tokens
+        self.seed = seed
+        self.models = _FakeModels(self)
+        self.caches = _FakeCaches(self)
+        self._cached: Dict[str, int] = {}   # имя кэша -> токенов в нём
+        self._lock = threading.Lock()
+        self.calls = 0
+        self.errors = 0
+
+    @staticmethod
+    def _text_tokens(text: str) -> int:
+        return max(1, len(text) // 4)
+
+    def _create_cache(self, model: str, config: Any) -> Any:
+        text = "".join(c for c in getattr(config, "contents", None) or [] if isinstance(c, str))
+        name = "cachedContents/fake-" + hashlib.sha256(text.encode("utf-8")).hexdigest()[:12]
+        with self._lock:
+            self._cached[name] = self._text_tokens(text)
+        return SimpleNamespace(name=name)
+
+    def _generate(self, model: str, contents: List[Any], config: Any) -> Any:
+        images: List[bytes] = []
+        text_tokens = 0
+        for part in contents:
+            if isinstance(part, str):
+                text_tokens += self._text_tokens(part)
+                continue
+            inline = getattr(part, "inline_data", None)
+            if inline is not None and inline.data is not None:
+                images.append(inline.data)
+
+        # Всё случайное в ответе — от содержимого запроса, а не от порядка потоков
+        digest = hashlib.sha256(b"".join(hashlib.sha256(b).digest() for b in images)).hexdigest()
+        rnd = random.Random(f"{self.seed}:{digest}")
+
+        with self._lock:
+            self.calls += 1
+        delay = self.latency_ms + self.per_image_ms * len(images) + rnd.uniform(-self.jitter_ms, self.jitter_ms)
+        if delay > 0:
+            time.sleep(delay / 1000)
+        if rnd.random() < self.error_rate:
+            with self._lock:
+                self.errors += 1
+            raise FakeApiError("503 UNAVAILABLE (fake)")
+
+        cached_name = getattr(config, "cached_content", None)
+        cached_tokens = None
+        if cached_name:
+            with self._lock:
+                cached_tokens = self._cached.get(cached_name)
+            if cached_tokens is None:
+                raise FakeApiError(f"404 NOT_FOUND: {cached_name} (fake)")
+
+        schema = getattr(config, "response_json_schema", None) or {}
+        labels = [self._labels(b) for b in images]
+        if schema.get("type") == "array":
+            parsed: Any = [dict(attrs, image_index=i) for i, attrs in enumerate(labels)]
+        else:
+            parsed = labels[0] if labels else {}
+
+        input_tokens = text_tokens + (cached_tokens or 0) + self.image_tokens * len(images)
+        output_tokens = self.output_tokens * max(1, len(images))
+        usage = SimpleNamespace(
+            prompt_token_count=input_tokens,
+            candidates_token_count=output_tokens,
+            total_token_count=input_tokens + output_tokens,
+            cached_content_token_count=cached_tokens,
+        )
+        return SimpleNamespace(parsed=parsed, text=json.dumps(parsed, ensure_ascii=False), usage_metadata=usage)
+
+    def _labels(self, image_bytes: bytes) -> Dict[str, Any]:
+        rnd = random.Random(f"{self.seed}:labels:{hashlib.sha256(image_bytes).hexdigest()}")
+        fine = rnd.choice(cg.ALL_FINE)
+        return {
+            "coarse_category": cg.FINE_TO_COARSE[fine],
+            "fine_category": fine,
+            "pattern": rnd.choice(cg.PATTERN_ENUM),
+            "sleeve_length": rnd.choice(cg.SLEEVE_ENUM),
+            "neckline": rnd.choice(cg.NECKLINE_ENUM),
+            "material_guess": "cotton",
+            "notes": "fake",
+        }
+
+# =======================
+# Замеры
+# =======================
+def _measure(name: str, n: int, fn: Callable[[], Any]) -> Dict[str, Any]:
+    """wall, CPU процесса (все потоки) и пик памяти Python-аллокаций сверх уровня до этапа."""
+    tracemalloc.reset_peak()
+    mem0, _ = tracemalloc.get_traced_memory()
+    c0, t0 = time.process_time(), time.perf_counter()
+    fn()
+    wall = time.perf_counter() - t0
+    cpu = time.process_time() - c0
+    _, peak = tracemalloc.get_traced_memory()
+    return {
+        "stage": name, "items": n,
+        "wall_seconds": round(wall, 4),
+        "cpu_seconds": round(cpu, 4),
+        "cpu_ms_per_item": round(1000 * cpu / n, 3) if n else None,
+        "peak_kb": round((peak - mem0) / 1024, 1),
+        "throughput": round(n / wall, 2) if wall > 0 else None,
+    }
+
+def run_stages(images: List[str], client: FakeGenaiClient, concurrency: int,
+               batch_concurrency: List[int], out_dir: Path) -> List[Dict[str, Any]]:
+    stages = []
+    n = len(images)
+
+    blobs: List[bytes] = []
+    stages.append(_measure("read", n, lambda: blobs.extend(Path(p).read_bytes() for p in images)))
+
+    analyzed: List[Any] = [None] * n
+    def _analyze_one(i: int) -> None:
+        try:
+            analyzed[i] = cg.analyze_with_gemini(images[i], cg.guess_mime(images[i]), project="", location="",
+                                                 client=client, image_bytes=blobs[i])
+        except FakeApiError as e:
+            analyzed[i] = e
+    def _analyze() -> None:
+        with ThreadPoolExecutor(max_workers=max(1, concurrency)) as pool:
+            list(pool.map(_analyze_one, range(n)))
+    stages.append(_measure("analyze", n, _analyze))
+    stages[-1]["errors"] = sum(isinstance(a, Exception) for a in analyzed)
+
+    ok = [(images[i], a) for i, a in enumerate(analyzed) if not isinstance(a, Exception)]
+    validated: List[Any] = []
+    stages.append(_measure("validate", len(ok), lambda: validated.extend(
+        (path, cg.validate_and_fix(dict(attrs)), dbg) for path, (attrs, dbg) in ok)))
+
+    write_dir = out_dir / "write"
+    def _write() -> None:
+        for path, attrs, _ in validated:
+            cg.save_result(cg.build_result(path, attrs, 0.0), path, out_dir=write_dir)
+    stages.append(_measure("write", len(validated), _write))
+
+    for conc in batch_concurrency:
+        store = cg.ResultsStore(out_dir / f"batch_{conc}.sqlite")
+        errors: List[int] = []
+        def _batch() -> None:
+            # Построчный вывод run_batch здесь не нужен; [error]/[warn] идут в stderr как обычно
+            with contextlib.redirect_stdout(io.StringIO()):
+                errors.append(cg.run_batch(images, "", "", conc, "time", store=store, client=client))
+        stages.append(_measure(f"batch@{conc}", n, _batch))
+        stages[-1]["errors"] = errors[0]
+        store.close()
+    return stages
+
+def print_stages(stages: List[Dict[str, Any]]) -> None:
+    print(f"{'stage':10s} {'items':>6s} {'wall s':>8s} {'cpu s':>7s} {'cpu ms/it':>9s} {'peak KB':>9s} {'items/s':>9s} {'err':>4s}")
+    for s in stages:
+        thr = f"{s['throughput']:.1f}" if s["throughput"] is not None else "-"
+        cpi = f"{s['cpu_ms_per_item']:.2f}" if s["cpu_ms_per_item"] is not None else "-"
+        print(f"{s['stage']:10s} {s['items']:>6d} {s['wall_seconds']:>8.3f} {s['cpu_seconds']:>7.3f} {cpi:>9s} "
+              f"{s['peak_kb']:>9.1f} {thr:>9s} {s.get('errors', ''):>4}")
+
+def compare(stages: List[Dict[str, Any]], baseline: Dict[str, Any], tolerance: float) -> List[str]:
+    """Этапы, у которых пропускная способность упала больше чем на tolerance относительно baseline."""
+    before = {s["stage"]: s for s in baseline.get("stages", [])}
+    problems = []
+    for s in stages:
+        b = before.get(s["stage"])
+        if not b or not b.get("throughput") or not s.get("throughput"):
+            continue
+        if s["throughput"] < b["throughput"] * (1 - tolerance):
+            problems.append(f"{s['stage']}: {s['throughput']:.1f} items/s, было {b['throughput']:.1f}")
+    return problems
+
+def main():
+    ap = argparse.ArgumentParser(description="Офлайн-бенчмарк classify_garment с фейковым genai-клиентом (без сети)")
+    ap.add_argument("source", nargs="?", default=str(DEFAULT_CORPUS),
+                    help=f"Папка, glob-шаблон или манифест (по умолчанию {DEFAULT_CORPUS})")
+    ap.add_argument("--repeat", type=int, default=1, help="Повторить корпус N раз (для стабильных цифр)")
+    ap.add_argument("--concurrency", type=int, default=8, help="Потоков на этапе analyze (по умолчанию 8)")
+    ap.add_argument("--batch-concurrency", default="1,4,8",
+                    help="Прогоны run_batch целиком, concurrency через запятую ('' — не запускать)")
+    ap.add_argument("--latency-ms", type=float, default=50.0, help="Задержка фейковой модели на запрос")
+    ap.add_argument("--jitter-ms", type=float, default=0.0, help="± к задержке (детерминированно от картинки)")
+    ap.add_argument("--per-image-ms", type=float, default=0.0, help="Доп. задержка на каждую картинку в запросе")
+    ap.add_argument("--error-rate", type=float, default=0.0, help="Доля запросов, падающих с ошибкой (0..1)")
+    ap.add_argument("--image-tokens", type=int, default=258, help="Входных токенов на картинку")
+    ap.add_argument("--output-tokens", type=int, default=60, help="Выходных токенов на картинку")
+    ap.add_argument("--seed", type=int, default=0)
+    ap.add_argument("--save", type=Path, help="Записать результаты в JSON (как baseline)")
+    ap.add_argument("--baseline", type=Path, help="Сравнить с сохранённым JSON; при регрессии — exit 1")
+    ap.add_argument("--tolerance", type=float, default=0.2, help="Допустимое падение items/s (по умолчанию 0.2 = 20%%)")
+    args = ap.parse_args()
+
+    images = cg.collect_images(args.source) * max(1, args.repeat)
+    if not images:
+        raise SystemExit("Нет изображений для бенчмарка")
+    batch_conc = [int(x) for x in args.batch_concurrency.split(",") if x.strip()]
+
+    client = FakeGenaiClient(latency_ms=args.latency_ms, jitter_ms=args.jitter_ms, per_image_ms=args.per_image_ms,
+                             error_rate=args.error_rate, image_tokens=args.image_tokens,
+                             output_tokens=args.output_tokens, seed=args.seed)
+
+    # Импорт SDK — не часть этапа: без этого analyze меряет его под tracemalloc (секунды на корпус)
+    importlib.import_module("google.genai.types")
+    tracemalloc.start()
+    with tempfile.TemporaryDirectory(prefix="bench_offline_") as tmp:
+        stages = run_stages(images, client, args.concurrency, batch_conc, Path(tmp))
+    tracemalloc.stop()
+
+    print(f"\nimages: {len(images)}  latency: {args.latency_ms}±{args.jitter_ms} ms  "
+          f"error_rate: {args.error_rate}  fake calls: {client.calls}  fake errors: {client.errors}")
+    print_stages(stages)
+
+    report = {"params": {k: v for k, v in vars(args).items() if k not in ("save", "baseline")},
+              "images": len(images), "stages": stages}
+    if args.save:
+        args.save.write_text(json.dumps(report, ensure_ascii=False, indent=2, default=str), encoding="utf-8")
+        print(f"\nsaved: {args.save}")
+    if args.baseline:
+        problems = compare(stages, json.loads(args.baseline.read_text(encoding="utf-8")), args.tolerance)
+        if problems:
+            print("\nРегрессия относительно baseline:", file=sys.stderr)
+            for p in problems:
+                print(f"  {p}", file=sys.stderr)
+            raise SystemExit(1)
+        print(f"\nbaseline OK (допуск {args.tolerance:.0%})")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,87 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Бенчмарк упакованного режима: сколько картинок K класть в один generate_content.
+Для каждого K прогоняем один и тот же набор без кэша и меряем токены и время
+на картинку, плюс совпадение fine_category с K=1 (чтобы видеть, не «путается» ли модель).
+
+Пример:
+    python bench_packing.py "../Vertex AI test" --ks 1,2,4,8 --limit 16
+"""
+import argparse, os, sys, time
+from pathlib import Path
+from typing import Dict, Any, List
+
+from classify_garment import (
+    analyze_packed_with_gemini, collect_images, guess_mime, make_client, validate_and_fix,
+)
+
+def _run_k(client, images: List[str], k: int) -> Dict[str, Any]:
+    labels: Dict[str, str] = {}
+    input_tokens = output_tokens = 0
+    requests = missing = 0
+    req_latencies: List[float] = []
+    t0 = time.time()
+    for i in range(0, len(images), k):
+        chunk = images[i:i + k]
+        payload = [(guess_mime(p), Path(p).read_bytes()) for p in chunk]
+        tr = time.time()
+        items, dbg = analyze_packed_with_gemini(payload, client)
+        req_latencies.append(time.time() - tr)
+        requests += 1
+        input_tokens += dbg.get("input_tokens") or 0
+        output_tokens += dbg.get("output_tokens") or 0
+        for path, attrs in zip(chunk, items):
+            if attrs is None:
+                missing += 1
+                continue
+            labels[path] = validate_and_fix(attrs).get("fine_category")
+    wall = time.time() - t0
+    n = len(images)
+    return {
+        "k": k, "requests": requests, "missing": missing, "labels": labels,
+        "input_tokens_per_image": input_tokens / n,
+        "output_tokens_per_image": output_tokens / n,
+        "latency_per_request": sum(req_latencies) / requests,
+        "wall_per_image": wall / n,
+    }
+
+def main():
+    ap = argparse.ArgumentParser(description="Подбор размера пакета K для упакованного режима classify_garment")
+    ap.add_argument("source", help="Папка, glob-шаблон или манифест (.txt/.json)")
+    ap.add_argument("--ks", default="1,2,4,8", help="Список K через запятую (по умолчанию 1,2,4,8)")
+    ap.add_argument("--limit", type=int, default=0, help="Взять только первые N картинок (0 — все)")
+    ap.add_argument("--project",  default=os.getenv("GOOGLE_CLOUD_PROJECT"), help="GCP project id")
+    ap.add_argument("--location", default=os.getenv("GOOGLE_CLOUD_LOCATION", "us-central1"), help="Vertex AI location")
+    args = ap.parse_args()
+
+    if not args.project:
+        raise SystemExit("Не задан project. Передайте --project или установите переменную GOOGLE_CLOUD_PROJECT.")
+
+    ks = sorted({int(x) for x in args.ks.split(",") if x.strip()})
+    if 1 not in ks:
+        ks.insert(0, 1)  # K=1 — эталон для сравнения меток
+    images = collect_images(args.source)
+    if args.limit > 0:
+        images = images[:args.limit]
+    if not images:
+        raise SystemExit("Нет изображений для бенчмарка")
+    client = make_client(args.project, args.location)
+
+    runs = []
+    for k in ks:
+        print(f"-> K={k} ...", file=sys.stderr)
+        runs.append(_run_k(client, images, k))
+
+    base = runs[0]["labels"]
+    print(f"\nimages: {len(images)}")
+    print(f"{'K':>3s} {'req':>4s} {'in tok/img':>10s} {'out tok/img':>11s} {'s/request':>9s} {'s/img':>7s} {'agree':>6s} {'miss':>4s}")
+    for r in runs:
+        common = [p for p in r["labels"] if p in base]
+        agree = sum(r["labels"][p] == base[p] for p in common)
+        agree_pct = 100 * agree / len(common) if common else 0
+        print(f"{r['k']:>3d} {r['requests']:>4d} {r['input_tokens_per_image']:>10.0f} {r['output_tokens_per_image']:>11.0f} "
+              f"{r['latency_per_request']:>9.2f} {r['wall_per_image']:>7.2f} {agree_pct:>5.0f}% {r['missing']:>4d}")
+
+if __name__ == "__main__":
+    main()
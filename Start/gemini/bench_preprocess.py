@@ -0,0 +1,91 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Бенчмарк пре-обработки: одна и та же картинка отправляется в Gemini дважды —
+как есть и после normalize_image(). Сравниваем латентность, байты, входные токены
+и совпадение меток (coarse/fine).
+
+Пример:
+    python bench_preprocess.py "../Vertex AI test" --max-edge 1024 --format webp --limit 20
+"""
+import argparse, os, time
+from pathlib import Path
+from typing import Dict, Any, List
+
+from classify_garment import (
+    PREPROCESS_FORMATS, analyze_with_gemini, collect_images, guess_mime,
+    make_client, normalize_image, validate_and_fix,
+)
+
+def _avg(xs: List[float]) -> float:
+    xs = [x for x in xs if x is not None]
+    return sum(xs) / len(xs) if xs else float("nan")
+
+def _run(client, image_path: str, image_bytes: bytes, mime: str) -> Dict[str, Any]:
+    t0 = time.time()
+    attrs, dbg = analyze_with_gemini(image_path, mime, project="", location="", client=client, image_bytes=image_bytes)
+    attrs = validate_and_fix(attrs)
+    return {"seconds": time.time() - t0, "bytes": len(image_bytes),
+            "input_tokens": dbg.get("input_tokens"), "attrs": attrs}
+
+def main():
+    ap = argparse.ArgumentParser(description="Сравнение: исходная картинка vs normalize_image() перед отправкой в Gemini")
+    ap.add_argument("source", help="Папка, glob-шаблон или манифест (.txt/.json)")
+    ap.add_argument("--max-edge", type=int, default=1536)
+    ap.add_argument("--format", dest="fmt", choices=sorted(PREPROCESS_FORMATS), default="jpeg")
+    ap.add_argument("--quality", type=int, default=85)
+    ap.add_argument("--limit", type=int, default=0, help="Взять только первые N картинок (0 — все)")
+    ap.add_argument("--project",  default=os.getenv("GOOGLE_CLOUD_PROJECT"), help="GCP project id")
+    ap.add_argument("--location", default=os.getenv("GOOGLE_CLOUD_LOCATION", "us-central1"), help="Vertex AI location")
+    args = ap.parse_args()
+
+    if not args.project:
+        raise SystemExit("Не задан project. Передайте --project или установите переменную GOOGLE_CLOUD_PROJECT.")
+
+    images = collect_images(args.source)
+    if args.limit > 0:
+        images = images[:args.limit]
+    client = make_client(args.project, args.location)
+
+    raw_runs, prep_runs, prep_secs = [], [], []
+    coarse_same = fine_same = 0
+    print(f"{'image':40s} {'raw KB':>8s} {'prep KB':>8s} {'raw s':>6s} {'prep s':>6s} {'raw tok':>7s} {'prep tok':>8s}  labels")
+    for path in images:
+        image_bytes = Path(path).read_bytes()
+        tp = time.time()
+        try:
+            small, mime = normalize_image(image_bytes, max_edge=args.max_edge, fmt=args.fmt, quality=args.quality)
+        except OSError as e:
+            print(f"[skip] {path}: PIL не смог декодировать ({e})")
+            continue
+        prep_secs.append(time.time() - tp)
+
+        raw = _run(client, path, image_bytes, guess_mime(path))
+        prep = _run(client, path, small, mime)
+
+        raw_runs.append(raw)
+        prep_runs.append(prep)
+        same_c = raw["attrs"].get("coarse_category") == prep["attrs"].get("coarse_category")
+        same_f = raw["attrs"].get("fine_category") == prep["attrs"].get("fine_category")
+        coarse_same += same_c
+        fine_same += same_f
+        label = "same" if same_f else f"{raw['attrs'].get('fine_category')} -> {prep['attrs'].get('fine_category')}"
+        print(f"{Path(path).name[:40]:40s} {raw['bytes']/1024:8.1f} {prep['bytes']/1024:8.1f} "
+              f"{raw['seconds']:6.2f} {prep['seconds']:6.2f} {str(raw['input_tokens']):>7s} {str(prep['input_tokens']):>8s}  {label}")
+
+    n = len(raw_runs)
+    if not n:
+        raise SystemExit("Нет изображений для бенчмарка")
+    raw_bytes = sum(r["bytes"] for r in raw_runs)
+    prep_bytes = sum(r["bytes"] for r in prep_runs)
+    print("\n--- Summary ---")
+    print(f"images: {n}  preprocess: max_edge={args.max_edge} format={args.fmt} quality={args.quality}")
+    print(f"bytes:        raw {raw_bytes/1024:.1f} KB  ->  prep {prep_bytes/1024:.1f} KB  "
+          f"({100 * (1 - prep_bytes / raw_bytes):.1f}% меньше)" if raw_bytes else "bytes: -")
+    print(f"latency avg:  raw {_avg([r['seconds'] for r in raw_runs]):.3f}s  ->  prep {_avg([r['seconds'] for r in prep_runs]):.3f}s"
+          f"  (+ preprocess {_avg(prep_secs):.3f}s)")
+    print(f"input tokens: raw {_avg([r['input_tokens'] for r in raw_runs]):.0f}  ->  prep {_avg([r['input_tokens'] for r in prep_runs]):.0f}")
+    print(f"agreement:    coarse {coarse_same}/{n} ({100 * coarse_same / n:.0f}%)  fine {fine_same}/{n} ({100 * fine_same / n:.0f}%)")
+
+if __name__ == "__main__":
+    main()
@@ -1,13 +1,20 @@
 #!/usr/bin/env python3
 # -*- coding: utf-8 -*-
 
-import argparse, json, mimetypes, os, sys, time, datetime
+import argparse, json, mimetypes, os, sys, time, datetime, glob
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from pathlib import Path
-from typing import Dict, Any, List, Tuple
+from typing import TYPE_CHECKING, Dict, Any, List, Tuple, Optional
 
-# --- Gemini (Vertex AI) ---
-from google import genai
-from google.genai import types as gx
+# google.genai (Gemini / Vertex AI) импортируется лениво — в make_client/analyze_*/_generate:
+# --help, ошибки аргументов и ответы из кэша обходятся без тяжёлого SDK.
+if TYPE_CHECKING:
+    from google import genai
+
+from result_cache import ResultCache, content_hash, version_hash, DEFAULT_CACHE_PATH
+from prompt_cache import InlinePrefix, PREFIX_MODES, make_prefix
+from results_store import ResultsStore, DEFAULT_STORE_PATH
+from metrics import MetricsSink, DEFAULT_METRICS_PATH
 
 # =======================
 # Таксономия (2 уровня)
@@ -70,6 +77,16 @@ NECKLINE_ENUM = ["crew","v_neck","scoop","turtleneck","polo","button_down","stra
 PANT_LENGTH_ENUM = ["floor_sweeping", "full", "ankle", "cropped", "capri", "unknown"]
 HEM_FINISH_ENUM  = ["clean", "raw", "rolled_cuff", "elastic_cuff", "frayed", "other"]
 
+# Пре-обработка перед отправкой: formats -> (PIL format, mime)
+PREPROCESS_FORMATS = {
+    "jpeg": ("JPEG", "image/jpeg"),
+    "webp": ("WEBP", "image/webp"),
+    "png":  ("PNG",  "image/png"),
+}
+
+# Декод до нужного размера (JPEG draft), EXIF, альфа -> фон — общий слой Start/common/image_loader.py
+COMMON_DIR = Path(__file__).resolve().parent.parent / "common"
+
 def must_file(p: str) -> str:
     path = Path(p)
     if not path.exists():
@@ -179,11 +196,13 @@ GLOSSARY = (
     "* If the item clearly does not fit any enum — use 'other' within the relevant group.\n"
 )
 
-def analyze_with_gemini(image_path: str, mime_type: str, project: str, location: str) -> Tuple[Dict[str, Any], Dict[str, Any]]:
-    client = genai.Client(vertexai=True, project=project, location=location)
+MODEL_NAME = "gemini-2.5-flash"
 
-    schema = build_schema()
-    instruction = (
+# Расширения, которые берём при обходе папки в batch-режиме
+IMAGE_EXTS = {".jpg", ".jpeg", ".png", ".webp", ".avif", ".bmp", ".gif", ".tif", ".tiff"}
+
+def build_instruction() -> str:
+    return (
         "You are a fashion tagger. Look at ONE garment on plain background.\n"
         "Step 1: choose coarse_category from enum strictly.\n"
         "Step 2: choose fine_category from enum that belongs to the chosen coarse_category only.\n"
@@ -191,53 +210,256 @@ def analyze_with_gemini(image_path: str, mime_type: str, project: str, location:
         f"{GLOSSARY}"
     )
 
+def build_packed_schema(k: int) -> Dict[str, Any]:
+    """Массив GarmentAttributesV2, у каждого элемента — image_index (номер картинки в запросе)."""
+    item = build_schema()
+    item["properties"] = {"image_index": {"type": "integer", "minimum": 0, "maximum": k - 1}, **item["properties"]}
+    item["required"] = ["image_index", *item["required"]]
+    return {
+        "type": "array",
+        "title": "GarmentAttributesV2List",
+        "minItems": k,
+        "maxItems": k,
+        "items": item,
+    }
+
+def build_packed_instruction(k: int) -> str:
+    return (
+        f"You are a fashion tagger. You will get {k} images, each preceded by its image_index.\n"
+        "Each image shows ONE garment on plain background. Tag EVERY image independently;\n"
+        "never let one image influence another.\n"
+        "Return a JSON array with exactly one object per image and set image_index on each.\n"
+        "Step 1: choose coarse_category from enum strictly.\n"
+        "Step 2: choose fine_category from enum that belongs to the chosen coarse_category only.\n"
+        "If unsure, choose the closest enum; do NOT invent values. Do NOT infer color.\n\n"
+        f"{GLOSSARY}"
+    )
+
+def taxonomy_version(preprocess: Optional[Dict[str, Any]] = None) -> str:
+    """
+    Версия для ключа кэша: меняется при любой правке схемы, глоссария, инструкции или модели.
+    Параметры пре-обработки тоже входят — модель видит другую картинку.
+    Без preprocess — «таксономия» для ResultCache: по её смене чистятся старые записи.
+    """
+    # decoder: декод через image_loader (draft до max_edge) даёт чуть другие пиксели, чем полный декод
+    preprocess = dict(preprocess, decoder="image_loader") if preprocess else {}
+    return version_hash(build_schema(), GLOSSARY, build_instruction(), MODEL_NAME, preprocess)
+
+def normalize_image(image_bytes: bytes, max_edge: int = 1536, fmt: str = "jpeg",
+                    quality: int = 85) -> Tuple[bytes, str]:
+    """
+    Декод сразу в уменьшенном масштабе (image_loader: JPEG draft) -> поворот по EXIF -> белый фон вместо альфы ->
+    даунскейл до max_edge -> перекодирование в памяти.
+    Возвращает (bytes, mime). Если перекодированный файл не меньше исходного и
+    уменьшать было нечего — отдаём исходные байты как есть.
+    """
+    from io import BytesIO
+    from PIL import Image
+    if str(COMMON_DIR) not in sys.path:
+        sys.path.insert(0, str(COMMON_DIR))
+    from image_loader import load_image, open_image, oriented_size
+
+    pil_format, mime = PREPROCESS_FORMATS[fmt]
+    im = open_image(image_bytes)
+    src_format = im.format
+    resized = max(oriented_size(im)) > max_edge
+    im = load_image(im, max_edge=max_edge, bg_color=(255, 255, 255))
+
+    buf = BytesIO()
+    if pil_format == "PNG":
+        im.save(buf, format="PNG", compress_level=6)
+    else:
+        im.save(buf, format=pil_format, quality=quality)
+    out = buf.getvalue()
+
+    if not resized and len(out) >= len(image_bytes):
+        src_mime = Image.MIME.get(src_format or "", "image/jpeg")
+        return image_bytes, src_mime
+    return out, mime
+
+def make_client(project: str, location: str) -> "genai.Client":
+    """Один клиент на процесс: в batch-режиме он общий для всех потоков."""
+    from google import genai
+    return genai.Client(vertexai=True, project=project, location=location)
+
+def _usage_value(usage: Any, *names: str) -> Optional[int]:
+    """Первое непустое поле usage из перечисленных (объект SDK или dict)."""
+    for name in names:
+        value = usage.get(name) if isinstance(usage, dict) else getattr(usage, name, None)
+        if value is not None:
+            return value
+    return None
+
+def analyze_with_gemini(image_path: str, mime_type: str, project: str, location: str,
+                        client: Optional["genai.Client"] = None,
+                        image_bytes: Optional[bytes] = None,
+                        prefix: Any = None) -> Tuple[Dict[str, Any], Dict[str, Any]]:
+    if client is None:
+        client = make_client(project, location)
+    tb = time.perf_counter()
+
+    schema = build_schema()
+    instruction = build_instruction()
+
     # Рассчитываем «вес» запроса
     instruction_bytes = len(instruction.encode("utf-8"))
     schema_bytes = len(json.dumps(schema, ensure_ascii=False).encode("utf-8"))
 
-    with open(image_path, "rb") as f:
-        image_bytes = f.read()
+    if image_bytes is None:
+        with open(image_path, "rb") as f:
+            image_bytes = f.read()
     image_size = len(image_bytes)
 
-    resp = client.models.generate_content(
-        model="gemini-2.5-flash",
-        contents=[instruction, gx.Part.from_bytes(data=image_bytes, mime_type=mime_type)],
-        config=gx.GenerateContentConfig(
+    from google.genai import types as gx
+    resp, prefix_mode, generate_seconds = _generate(
+        client, instruction, [gx.Part.from_bytes(data=image_bytes, mime_type=mime_type)], schema, prefix)
+    if prefix_mode == "cached":
+        instruction_bytes = 0  # инструкция лежит в кэше на стороне API и в запрос не идёт
+
+    tp = time.perf_counter()
+    attrs, response_bytes, tokens = _parse_response(resp)
+    attrs = dict(attrs)
+
+    debug = {
+        "prefix_mode": prefix_mode,
+        "instruction_bytes": instruction_bytes,
+        "schema_bytes": schema_bytes,
+        "image_bytes": image_size,
+        "request_bytes_total": instruction_bytes + schema_bytes + image_size,
+        "response_bytes": response_bytes,
+        **tokens,
+        "model": MODEL_NAME,
+        **_timings(tb, tp, generate_seconds),
+    }
+
+    return attrs, debug
+
+def analyze_packed_with_gemini(images: List[Tuple[str, bytes]], client: "genai.Client",
+                               prefix: Any = None) -> Tuple[List[Optional[Dict[str, Any]]], Dict[str, Any]]:
+    """
+    Упакованный режим: K картинок в одном generate_content.
+    images — список (mime, bytes). Инструкция и схема отправляются один раз на весь пакет.
+    Возвращает attrs в порядке images (None, если модель пропустила картинку) и debug на весь запрос.
+    """
+    k = len(images)
+    tb = time.perf_counter()
+    schema = build_packed_schema(k)
+    instruction = build_packed_instruction(k)
+
+    instruction_bytes = len(instruction.encode("utf-8"))
+    schema_bytes = len(json.dumps(schema, ensure_ascii=False).encode("utf-8"))
+    image_size = sum(len(b) for _, b in images)
+
+    from google.genai import types as gx
+
+    # Каждой картинке предшествует её номер — по нему модель заполняет image_index
+    parts: List[Any] = []
+    for i, (mime_type, image_bytes) in enumerate(images):
+        parts.append(f"image_index={i}")
+        parts.append(gx.Part.from_bytes(data=image_bytes, mime_type=mime_type))
+
+    resp, prefix_mode, generate_seconds = _generate(client, instruction, parts, schema, prefix)
+    if prefix_mode == "cached":
+        instruction_bytes = 0
+
+    tp = time.perf_counter()
+    items, response_bytes, tokens = _parse_response(resp)
+    by_index: Dict[int, Dict[str, Any]] = {}
+    for item in items or []:
+        item = dict(item)
+        idx = item.pop("image_index", None)
+        if isinstance(idx, int) and 0 <= idx < k and idx not in by_index:
+            by_index[idx] = item
+
+    debug = {
+        "prefix_mode": prefix_mode,
+        "instruction_bytes": instruction_bytes,
+        "schema_bytes": schema_bytes,
+        "image_bytes": image_size,
+        "request_bytes_total": instruction_bytes + schema_bytes + image_size,
+        "response_bytes": response_bytes,
+        **tokens,
+        "model": MODEL_NAME,
+        "pack_size": k,
+        **_timings(tb, tp, generate_seconds),
+    }
+    return [by_index.get(i) for i in range(k)], debug
+
+def _timings(tb: float, tp: float, generate_seconds: float) -> Dict[str, float]:
+    """
+    Разбивка запроса: build — сборка запроса на клиенте (схема, инструкция, Part, префикс),
+    generate — блокирующий generate_content, parse — разбор ответа. Отправку картинки и
+    ожидание модели SDK не разделяет (один HTTP round trip), поэтому они вместе в generate.
+    """
+    return {
+        "build_seconds": round(tp - tb - generate_seconds, 4),
+        "generate_seconds": round(generate_seconds, 3),
+        "parse_seconds": round(time.perf_counter() - tp, 4),
+    }
+
+def _generate(client: "genai.Client", instruction: str, parts: List[Any], schema: Dict[str, Any],
+              prefix: Any = None) -> Tuple[Any, str, float]:
+    """
+    generate_content со статичным префиксом через выбранный бэкенд (inline / cached).
+    Если запрос со ссылкой на кэш упал (кэш истёк/удалён) — один повтор inline.
+    Возвращает (ответ, режим, которым он реально получен, секунды в generate_content с повтором).
+    """
+    from google.genai import types as gx
+
+    prefix = prefix or InlinePrefix()
+    head, extra = prefix.prepare(client, instruction)
+
+    spent = [0.0]
+
+    def _call(contents, extra_config):
+        config = gx.GenerateContentConfig(
             response_mime_type="application/json",
             response_json_schema=schema,
             temperature=0.2,
-        ),
-    )
-
+            **extra_config,
+        )
+        tc = time.perf_counter()
+        try:
+            return client.models.generate_content(model=MODEL_NAME, contents=contents, config=config)
+        finally:
+            spent[0] += time.perf_counter() - tc
+
+    if not extra:
+        return _call(head + parts, {}), "inline", spent[0]
+    try:
+        resp = _call(head + parts, extra)
+        return resp, prefix.mode, spent[0]
+    except Exception as e:
+        print(f"[warn] запрос с cached_content не прошёл ({e}) — повторяю inline", file=sys.stderr)
+        prefix.invalidate(instruction)
+        resp = _call([instruction] + parts, {})
+        return resp, "inline", spent[0]
+
+def _parse_response(resp: Any) -> Tuple[Any, int, Dict[str, Optional[int]]]:
+    """JSON из ответа (parsed или text), его размер в байтах и токены, если SDK их вернул."""
     # Текст/объём ответа
     if hasattr(resp, "parsed") and resp.parsed:
-        attrs = dict(resp.parsed)
-        resp_text_for_size = json.dumps(attrs, ensure_ascii=False)
+        parsed = resp.parsed
+        resp_text_for_size = json.dumps(parsed, ensure_ascii=False, default=str)
     else:
-        attrs = json.loads(resp.text)
+        parsed = json.loads(resp.text)
         resp_text_for_size = resp.text
 
     response_bytes = len(resp_text_for_size.encode("utf-8"))
 
     # Токены: берём, если SDK их вернул
     usage = getattr(resp, "usage", None) or getattr(resp, "usage_metadata", None) or {}
-    input_tokens  = getattr(usage, "input_tokens",  None) if hasattr(usage, "input_tokens")  else usage.get("input_tokens")  if isinstance(usage, dict) else None
-    output_tokens = getattr(usage, "output_tokens", None) if hasattr(usage, "output_tokens") else usage.get("output_tokens") if isinstance(usage, dict) else None
-    total_tokens  = getattr(usage, "total_tokens",  None) if hasattr(usage, "total_tokens")  else usage.get("total_tokens")  if isinstance(usage, dict) else None
-
-    debug = {
-        "instruction_bytes": instruction_bytes,
-        "schema_bytes": schema_bytes,
-        "image_bytes": image_size,
-        "request_bytes_total": instruction_bytes + schema_bytes + image_size,
-        "response_bytes": response_bytes,
-        "input_tokens": input_tokens,
-        "output_tokens": output_tokens,
-        "total_tokens": total_tokens,
-        "model": "gemini-2.5-flash",
+    # google-genai отдаёт prompt_/candidates_/total_token_count, старые обёртки — input_/output_/total_tokens
+    tokens = {
+        "input_tokens":  _usage_value(usage, "input_tokens",  "prompt_token_count"),
+        "output_tokens": _usage_value(usage, "output_tokens", "candidates_token_count"),
+        "total_tokens":  _usage_value(usage, "total_tokens",  "total_token_count"),
+        # Сколько входных токенов пришло из cached content (в input_tokens они тоже входят)
+        "cached_tokens": _usage_value(usage, "cached_tokens", "cached_content_token_count"),
     }
-
-    return attrs, debug
+    if tokens["input_tokens"] is not None:
+        tokens["new_input_tokens"] = tokens["input_tokens"] - (tokens["cached_tokens"] or 0)
+    return parsed, response_bytes, tokens
 
 def validate_and_fix(categories: Dict[str, Any]) -> Dict[str, Any]:
     coarse = categories.get("coarse_category")
@@ -257,40 +479,20 @@ def validate_and_fix(categories: Dict[str, Any]) -> Dict[str, Any]:
     return categories
 
 # =======================
-# CLI
+# Один снимок
 # =======================
-def main():
-    ap = argparse.ArgumentParser(description="Gemini: 2-уровневая классификация одежды (без цвета)")
-    ap.add_argument("image", type=must_file, help="Путь к изображению (можно UNC)")
-    ap.add_argument("--project",  default=os.getenv("GOOGLE_CLOUD_PROJECT"), help="GCP project id")
-    ap.add_argument("--location", default=os.getenv("GOOGLE_CLOUD_LOCATION", "us-central1"), help="Vertex AI location")
-    ap.add_argument("--print",    dest="print_mode", choices=["all","time"], default="all",
-                    help="Что печатать в консоль: all — весь JSON, time — только время и путь")
-    args = ap.parse_args()
-
-    if not args.project:
-        raise SystemExit("Не задан project. Передайте --project или установите переменную GOOGLE_CLOUD_PROJECT.")
-
-    t0 = time.time()
-
-    mime_type, _ = mimetypes.guess_type(args.image)
+def guess_mime(image_path: str) -> str:
+    mime_type, _ = mimetypes.guess_type(image_path)
     if mime_type is None:
-        ext = Path(args.image).suffix.lower()
+        ext = Path(image_path).suffix.lower()
         mime_type = "image/png" if ext == ".png" else "image/jpeg"
+    return mime_type
 
-    # 1) Модель + расчёт «веса» запроса
-    attrs, dbg = analyze_with_gemini(args.image, mime_type, project=args.project, location=args.location)
-
-    # 2) Валидируем согласованность
-    attrs = validate_and_fix(attrs)
-
-    elapsed = round(time.time() - t0, 3)
-    analysis_date = datetime.date.today().isoformat()
-
-    # 3) Итоговый JSON (без метаданных)
-    result = {
-        "analysis_date": analysis_date,
-        "input_image_path": str(Path(args.image).resolve()),
+def build_result(image_path: str, attrs: Dict[str, Any], elapsed: float) -> Dict[str, Any]:
+    """Итоговый JSON (без метаданных)."""
+    return {
+        "analysis_date": datetime.date.today().isoformat(),
+        "input_image_path": str(Path(image_path).resolve()),
         "coarse_category": attrs.get("coarse_category", "other"),
         "fine_category":   attrs.get("fine_category", "other"),
         "pattern":         attrs.get("pattern"),
@@ -303,32 +505,478 @@ def main():
         "elapsed_seconds": elapsed,
     }
 
-    # 4) Сохранение: results/<stem>_<YYYYmmdd_HHMMSS>.json
-    out_dir = Path("results")
+def save_result(result: Dict[str, Any], image_path: str, out_dir: Path = Path("results")) -> Path:
+    """Сохранение: results/<stem>_<YYYYmmdd_HHMMSS>.json (при коллизии имени — суффикс _2, _3, ...)."""
     out_dir.mkdir(parents=True, exist_ok=True)
     ts = datetime.datetime.now().strftime("%Y%m%d_%H%M%S")
-    out_path = out_dir / f"{Path(args.image).stem}_{ts}.json"
-    with open(out_path, "w", encoding="utf-8") as f:
-        json.dump(result, f, ensure_ascii=False, indent=2)
+    base = f"{Path(image_path).stem}_{ts}"
+    n = 1
+    while True:
+        out_path = out_dir / (f"{base}.json" if n == 1 else f"{base}_{n}.json")
+        try:
+            # "x" — атомарно, чтобы параллельные потоки не перезаписали друг друга
+            with open(out_path, "x", encoding="utf-8") as f:
+                json.dump(result, f, ensure_ascii=False, indent=2)
+            return out_path
+        except FileExistsError:
+            n += 1
+
+def _prepare_upload(image_path: str, image_bytes: bytes,
+                    preprocess: Optional[Dict[str, Any]]) -> Tuple[bytes, str, Dict[str, Any]]:
+    """Опционально уменьшаем картинку перед отправкой. Возвращает (bytes, mime, debug-поля)."""
+    mime_type = guess_mime(image_path)
+    if not preprocess:
+        return image_bytes, mime_type, {}
+    tp = time.time()
+    upload_bytes = image_bytes
+    try:
+        upload_bytes, mime_type = normalize_image(image_bytes, **preprocess)
+    except OSError as e:
+        # PIL не умеет формат (например HEIC под видом .jpg) — пусть модель разбирается с исходником
+        print(f"[warn] {image_path}: пре-обработка не удалась ({e}) — отправляю как есть", file=sys.stderr)
+    return upload_bytes, mime_type, {
+        "image_bytes_original": len(image_bytes),
+        "preprocess_seconds": round(time.time() - tp, 3),
+    }
 
-    # 5) Вывод результата
-    if args.print_mode == "all":
-        print(json.dumps(result, ensure_ascii=False, indent=2))
-        print(f"\n✅ Saved: {out_path.resolve()}")
-    else:
-        print(f"elapsed_seconds={elapsed}  saved_to={out_path.resolve()}")
+def _finish(image_path: str, attrs: Dict[str, Any], dbg: Dict[str, Any], t0: float,
+            cache: Optional[ResultCache], image_hash: Optional[str],
+            knn: Any = None, knn_state: Optional[Tuple[Any, Optional[Dict[str, Any]]]] = None,
+            gemini_seconds: float = 0.0,
+            store: Optional[ResultsStore] = None) -> Tuple[Dict[str, Any], Dict[str, Any], str]:
+    """Валидация свежего ответа, запись в кэш и kNN-индекс, итоговый JSON и сохранение."""
+    # Валидируем согласованность
+    attrs = validate_and_fix(attrs)
 
-    # 6) Детальный «вес» запроса (всегда выводим ниже)
+    if cache is not None:
+        cache.put(image_hash, {"attrs": attrs, "debug": dbg})
+        dbg["cache"] = "miss"
+
+    if knn is not None and knn_state is not None and knn_state[0] is not None:
+        vec, pred = knn_state
+        knn.record(gemini_seconds=gemini_seconds, gemini_calls=1)
+        if pred is not None:
+            # audit-режим: kNN был уверен, но мы всё равно спросили модель
+            agree = pred["fine_category"] == attrs["fine_category"]
+            knn.record(audits=1, disagreements=0 if agree else 1)
+            dbg["knn_audit"] = "agree" if agree else f"{pred['fine_category']} != {attrs['fine_category']}"
+        knn.add(vec, attrs["coarse_category"], attrs["fine_category"], image_hash)
+
+    return _save(image_path, attrs, dbg, t0, store)
+
+def _knn_lookup(image_path: str, image_bytes: bytes, knn: Any) -> Tuple[Any, Optional[Dict[str, Any]]]:
+    """Вектор признаков и (если соседи уверены) их метки. Без индекса/при ошибке декода — (None, None)."""
+    if knn is None:
+        return None, None
+    tk = time.time()
+    try:
+        from knn_index import embed_image
+        vec = embed_image(image_bytes)
+    except OSError as e:
+        print(f"[warn] {image_path}: kNN пропущен, PIL не смог декодировать ({e})", file=sys.stderr)
+        return None, None
+    pred = knn.predict(vec)
+    knn.record(knn_seconds=time.time() - tk)
+    return vec, pred
+
+def _knn_result(pred: Dict[str, Any]) -> Tuple[Dict[str, Any], Dict[str, Any]]:
+    """attrs/debug для ответа локального kNN (только coarse/fine — остальные атрибуты не угадываем)."""
+    attrs = {
+        "coarse_category": pred["coarse_category"],
+        "fine_category": pred["fine_category"],
+        "notes": f"knn: similarity {pred['similarity']}",
+    }
+    dbg = {"model": "knn-local", "knn": "hit",
+           "knn_similarity": pred["similarity"], "knn_neighbours": pred["neighbours"]}
+    return attrs, dbg
+
+def _save(image_path: str, attrs: Dict[str, Any], dbg: Dict[str, Any], t0: float,
+          store: Optional[ResultsStore] = None) -> Tuple[Dict[str, Any], Dict[str, Any], str]:
+    """Итоговый JSON -> в хранилище (или, без него, отдельным файлом). Третий элемент — куда сохранено."""
+    elapsed = round(time.time() - t0, 3)
+    result = build_result(image_path, attrs, elapsed)
+    if store is not None:
+        return result, dbg, store.location(store.add(result))
+    return result, dbg, str(save_result(result, image_path).resolve())
+
+def _lookup(image_path: str, cache: Optional[ResultCache]) -> Tuple[bytes, str, Optional[Dict[str, Any]], float]:
+    """
+    Читаем файл и ищем его в кэше по содержимому: та же картинка + та же таксономия -> без запроса к API.
+    Последний элемент — время чтения файла (для телеметрии).
+    """
+    tr = time.time()
+    with open(image_path, "rb") as f:
+        image_bytes = f.read()
+    read_seconds = round(time.time() - tr, 4)
+    image_hash = content_hash(image_bytes)
+    cached = cache.get(image_hash) if cache is not None else None
+    return image_bytes, image_hash, cached, read_seconds
+
+def classify_one(image_path: str, project: str, location: str,
+                 client: Optional["genai.Client"] = None,
+                 cache: Optional[ResultCache] = None,
+                 preprocess: Optional[Dict[str, Any]] = None,
+                 prefix: Any = None,
+                 knn: Any = None,
+                 store: Optional[ResultsStore] = None) -> Tuple[Dict[str, Any], Dict[str, Any], str]:
+    """Полный цикл для одного файла: (кэш) -> (kNN) -> модель -> валидация -> сохранение."""
+    t0 = time.time()
+
+    image_bytes, image_hash, cached, read_seconds = _lookup(image_path, cache)
+    if cached is not None:
+        return _save(image_path, cached["attrs"], dict(cached["debug"], cache="hit"), t0, store)
+
+    vec, pred = _knn_lookup(image_path, image_bytes, knn)
+    if pred is not None and not knn.audit:
+        attrs, dbg = _knn_result(pred)
+        return _save(image_path, attrs, dbg, t0, store)
+
+    upload_bytes, mime_type, prep_dbg = _prepare_upload(image_path, image_bytes, preprocess)
+
+    # Модель + расчёт «веса» запроса
+    tg = time.time()
+    attrs, dbg = analyze_with_gemini(image_path, mime_type,
+                                     project=project, location=location,
+                                     client=client, image_bytes=upload_bytes, prefix=prefix)
+    request_seconds = time.time() - tg
+    dbg.update(prep_dbg, read_seconds=read_seconds, request_seconds=round(request_seconds, 3))
+    return _finish(image_path, attrs, dbg, t0, cache, image_hash,
+                   knn=knn, knn_state=(vec, pred), gemini_seconds=request_seconds, store=store)
+
+def classify_packed(image_paths: List[str], client: "genai.Client",
+                    cache: Optional[ResultCache] = None,
+                    preprocess: Optional[Dict[str, Any]] = None,
+                    prefix: Any = None,
+                    knn: Any = None,
+                    store: Optional[ResultsStore] = None) -> List[Any]:
+    """
+    Пакет из K файлов одним запросом. Закэшированные и уверенно найденные kNN картинки в запрос не попадают.
+    Возвращает по элементу на файл: (result, dbg, saved_to) или Exception.
+    Токены, байты и время в dbg каждой картинки — доля от общего запроса
+    (request_*_pack, request_input/output_tokens — весь запрос целиком).
+    """
+    t0 = time.time()
+    out: List[Any] = [None] * len(image_paths)
+    pending = []  # (позиция, путь, hash, mime, bytes, prep_dbg, knn_state)
+    for pos, path in enumerate(image_paths):
+        try:
+            image_bytes, image_hash, cached, read_seconds = _lookup(path, cache)
+            if cached is not None:
+                out[pos] = _save(path, cached["attrs"], dict(cached["debug"], cache="hit"), t0, store)
+                continue
+            vec, pred = _knn_lookup(path, image_bytes, knn)
+            if pred is not None and not knn.audit:
+                attrs, dbg = _knn_result(pred)
+                out[pos] = _save(path, attrs, dbg, t0, store)
+                continue
+            upload_bytes, mime_type, prep_dbg = _prepare_upload(path, image_bytes, preprocess)
+            prep_dbg["read_seconds"] = read_seconds
+            pending.append((pos, path, image_hash, mime_type, upload_bytes, prep_dbg, (vec, pred)))
+        except Exception as e:
+            out[pos] = e
+
+    if pending:
+        tg = time.time()
+        try:
+            items, req_dbg = analyze_packed_with_gemini([(m, b) for _, _, _, m, b, _, _ in pending], client, prefix)
+        except Exception as e:
+            for pos, *_ in pending:
+                out[pos] = e
+            return out
+
+        k = len(pending)
+        request_seconds = time.time() - tg
+        gemini_seconds = request_seconds / k
+        def _share(v): return round(v / k, 1) if v is not None else None
+        def _share_s(v): return round(v / k, 4) if v is not None else None
+        for idx, ((pos, path, image_hash, _, upload_bytes, prep_dbg, knn_state), attrs) in enumerate(zip(pending, items)):
+            if attrs is None:
+                out[pos] = RuntimeError(f"модель не вернула ответ для image_index={idx}")
+                continue
+            dbg = {
+                "prefix_mode": req_dbg["prefix_mode"],
+                "instruction_bytes": _share(req_dbg["instruction_bytes"]),
+                "schema_bytes": _share(req_dbg["schema_bytes"]),
+                "image_bytes": len(upload_bytes),
+                "request_bytes_total": _share(req_dbg["request_bytes_total"]),
+                "request_bytes_pack": req_dbg["request_bytes_total"],  # весь пакет целиком
+                "response_bytes": _share(req_dbg["response_bytes"]),
+                "input_tokens": _share(req_dbg["input_tokens"]),
+                "output_tokens": _share(req_dbg["output_tokens"]),
+                "total_tokens": _share(req_dbg["total_tokens"]),
+                "cached_tokens": _share(req_dbg["cached_tokens"]),
+                "new_input_tokens": _share(req_dbg.get("new_input_tokens")),
+                "request_input_tokens": req_dbg["input_tokens"],
+                "request_output_tokens": req_dbg["output_tokens"],
+                "model": MODEL_NAME,
+                "pack_size": k,
+                # Время — тоже доля на картинку, чтобы request_p50/p95 не смешивали пакеты с одиночными вызовами
+                "request_seconds": _share_s(request_seconds),
+                "request_seconds_pack": round(request_seconds, 3),
+                "build_seconds": _share_s(req_dbg["build_seconds"]),
+                "generate_seconds": _share_s(req_dbg["generate_seconds"]),
+                "parse_seconds": _share_s(req_dbg["parse_seconds"]),
+                **prep_dbg,
+            }
+            try:
+                out[pos] = _finish(path, attrs, dbg, t0, cache, image_hash,
+                                   knn=knn, knn_state=knn_state, gemini_seconds=gemini_seconds, store=store)
+            except Exception as e:
+                out[pos] = e
+    return out
+
+def print_weight(dbg: Dict[str, Any]) -> None:
+    """Детальный «вес» запроса."""
     def _kb(n): return f"{n/1024:.2f} KB"
     print("\n--- Request/Response weight ---")
     print(f"model: {dbg.get('model')}")
+    if dbg.get("knn") == "hit":
+        print(f"kNN: запрос к API не отправлялся (similarity={dbg['knn_similarity']}, соседей={dbg['knn_neighbours']})")
+        return
     print(f"instruction_bytes: {dbg['instruction_bytes']} ({_kb(dbg['instruction_bytes'])})")
     print(f"schema_bytes:      {dbg['schema_bytes']} ({_kb(dbg['schema_bytes'])})")
+    if dbg.get("image_bytes_original") is not None:
+        print(f"image_original:    {dbg['image_bytes_original']} ({_kb(dbg['image_bytes_original'])}), "
+              f"preprocess {dbg.get('preprocess_seconds')}s")
     print(f"image_bytes:       {dbg['image_bytes']} ({_kb(dbg['image_bytes'])})")
     print(f"request_total:     {dbg['request_bytes_total']} ({_kb(dbg['request_bytes_total'])})")
+    if dbg.get("request_bytes_pack") is not None:
+        print(f"request_pack:      {dbg['request_bytes_pack']} ({_kb(dbg['request_bytes_pack'])}), "
+              f"{dbg.get('request_seconds_pack')}s на пакет из {dbg.get('pack_size')}")
     print(f"response_bytes:    {dbg['response_bytes']} ({_kb(dbg['response_bytes'])})")
     if dbg.get("total_tokens") is not None or dbg.get("input_tokens") is not None:
         print(f"tokens: input={dbg.get('input_tokens')} output={dbg.get('output_tokens')} total={dbg.get('total_tokens')}")
+    if dbg.get("prefix_mode"):
+        print(f"prefix: {dbg['prefix_mode']}  cached_tokens={dbg.get('cached_tokens')} new_input_tokens={dbg.get('new_input_tokens')}")
+    if dbg.get("request_seconds") is not None:
+        print(f"time: read={dbg.get('read_seconds')}s preprocess={dbg.get('preprocess_seconds', 0)}s "
+              f"request={dbg['request_seconds']}s = build {dbg.get('build_seconds')}s + "
+              f"generate {dbg.get('generate_seconds')}s (отправка + ожидание модели) + parse {dbg.get('parse_seconds')}s")
+    if dbg.get("cache"):
+        print(f"cache: {dbg['cache']} (при hit — вес и токены из исходного запроса)")
+    if dbg.get("knn_audit"):
+        print(f"kNN audit: {dbg['knn_audit']}")
+
+def print_knn_stats(knn: Any) -> None:
+    st = knn.report()
+    print("\n--- kNN ---")
+    print(f"entries: {st['entries']}  lookups: {st['lookups']}  hits: {st['hits']}  hit_rate: {st['hit_rate']}")
+    print(f"avg gemini: {st['avg_gemini_seconds']}s  avg knn: {st['avg_knn_seconds']}s  saved (оценка): {st['saved_seconds_est']}s")
+    if st["audits"]:
+        print(f"audit: {st['audits']}  disagreements: {st['disagreements']}  rate: {st['disagreement_rate']}")
+
+def print_cache_stats(cache: ResultCache) -> None:
+    st = cache.stats()
+    print("\n--- Cache ---")
+    print(f"hits: {st['hits']}  misses: {st['misses']}  hit_rate: {st['hit_rate']}  evictions: {st['evictions']}")
+    print(f"entries: {st['entries']}  size: {st['size_bytes']/1024:.1f} KB / {st['max_bytes']/1024/1024:.1f} MB")
+    print(f"all-time: hits={st['total_hits']} misses={st['total_misses']} evictions={st['total_evictions']}")
+
+# =======================
+# Batch-режим
+# =======================
+def collect_images(source: str) -> List[str]:
+    """
+    Источник для batch-режима:
+    - папка            -> все изображения в ней (по IMAGE_EXTS, без рекурсии)
+    - glob-шаблон      -> например "photos/**/*.jpg"
+    - манифест .txt    -> один путь на строку (# — комментарий), относительные пути — от папки манифеста
+    - манифест .json   -> список путей или {"images": [...]}
+    """
+    src = Path(source)
+    if src.is_dir():
+        paths = [str(p) for p in sorted(src.iterdir()) if p.is_file() and p.suffix.lower() in IMAGE_EXTS]
+    elif src.is_file() and src.suffix.lower() in (".txt", ".json"):
+        if src.suffix.lower() == ".json":
+            data = json.loads(src.read_text(encoding="utf-8"))
+            items = data.get("images", []) if isinstance(data, dict) else data
+        else:
+            items = [ln.strip() for ln in src.read_text(encoding="utf-8").splitlines()]
+            items = [ln for ln in items if ln and not ln.startswith("#")]
+        paths = [str(p if Path(p).is_absolute() else src.parent / p) for p in items]
+    elif glob.has_magic(source):
+        paths = sorted(p for p in glob.glob(source, recursive=True) if Path(p).is_file())
+    else:
+        raise SystemExit(f"Не понял источник для --batch (папка, glob или манифест .txt/.json): {source}")
+
+    missing = [p for p in paths if not Path(p).exists()]
+    if missing:
+        raise SystemExit(f"Файлы из манифеста не найдены ({len(missing)}), например: {missing[0]}")
+    return paths
+
+def run_batch(images: List[str], project: str, location: str, concurrency: int, print_mode: str,
+              cache: Optional[ResultCache] = None, preprocess: Optional[Dict[str, Any]] = None,
+              pack: int = 1, prefix: Any = None, knn: Any = None,
+              store: Optional[ResultsStore] = None, metrics: Optional[MetricsSink] = None,
+              client: Optional["genai.Client"] = None) -> int:
+    """
+    Классифицирует список файлов, держа до `concurrency` запросов в полёте.
+    При pack > 1 в каждом запросе по `pack` картинок (см. classify_packed).
+    Клиент один на всех (genai.Client потокобезопасен для generate_content);
+    client можно передать готовый (например, фейк из bench_offline.py).
+    Возвращает число ошибок.
+    """
+    if client is None:
+        client = make_client(project, location)
+    errors = 0
+    latencies: List[float] = []
+    input_tokens: List[float] = []
+    cached_tokens: List[float] = []
+
+    def _single(path):
+        try:
+            return [classify_one(path, project, location, client, cache=cache, preprocess=preprocess,
+                                 prefix=prefix, knn=knn, store=store)]
+        except Exception as e:
+            return [e]
+
+    pack = max(1, pack)
+    chunks = [images[i:i + pack] for i in range(0, len(images), pack)]
+
+    t0 = time.time()
+    with ThreadPoolExecutor(max_workers=max(1, concurrency)) as pool:
+        if pack == 1:
+            futures = {pool.submit(_single, c[0]): c for c in chunks}
+        else:
+            futures = {pool.submit(classify_packed, c, client, cache, preprocess, prefix, knn, store): c for c in chunks}
+        for fut in as_completed(futures):
+            for path, outcome in zip(futures[fut], fut.result()):
+                if isinstance(outcome, Exception):
+                    errors += 1
+                    print(f"[error] {path}: {outcome}", file=sys.stderr)
+                    continue
+                result, dbg, saved_to = outcome
+                if metrics is not None:
+                    metrics.record(path, result, dbg)
+                latencies.append(result["elapsed_seconds"])
+                if dbg.get("cache") != "hit" and dbg.get("input_tokens") is not None:
+                    input_tokens.append(dbg["input_tokens"])
+                    cached_tokens.append(dbg.get("cached_tokens") or 0)
+                if print_mode == "all":
+                    print(f"{result['coarse_category']}/{result['fine_category']}  "
+                          f"{result['elapsed_seconds']}s  {path} -> {saved_to}")
+                else:
+                    print(f"elapsed_seconds={result['elapsed_seconds']}  saved_to={saved_to}")
+    wall = time.time() - t0
+
+    done = len(latencies)
+    print("\n--- Batch summary ---")
+    print(f"images: {len(images)}  ok: {done}  errors: {errors}  concurrency: {concurrency}  pack: {pack}")
+    print(f"wall_seconds: {wall:.3f}")
+    if wall > 0:
+        print(f"throughput: {done / wall:.2f} images/sec")
+    if latencies:
+        print(f"latency avg: {sum(latencies) / done:.3f}s  max: {max(latencies):.3f}s")
+    if input_tokens:
+        n_tok = len(input_tokens)
+        print(f"input tokens per image (без кэша): {sum(input_tokens) / n_tok:.0f}  "
+              f"из них cached: {sum(cached_tokens) / n_tok:.0f}  новые: {(sum(input_tokens) - sum(cached_tokens)) / n_tok:.0f}")
+    if cache is not None:
+        print_cache_stats(cache)
+    if knn is not None:
+        print_knn_stats(knn)
+    return errors
+
+# =======================
+# CLI
+# =======================
+def main():
+    ap = argparse.ArgumentParser(description="Gemini: 2-уровневая классификация одежды (без цвета)")
+    ap.add_argument("image", nargs="?", type=must_file, help="Путь к изображению (можно UNC)")
+    ap.add_argument("--batch", metavar="SOURCE",
+                    help="Batch-режим: папка, glob-шаблон или манифест (.txt/.json) со списком файлов")
+    ap.add_argument("--concurrency", type=int, default=4,
+                    help="Сколько запросов держать в полёте в batch-режиме (по умолчанию 4)")
+    ap.add_argument("--pack", type=int, default=1,
+                    help="Batch-режим: сколько картинок отправлять в одном запросе (инструкция и схема — одна на пакет)")
+    ap.add_argument("--prefix-mode", choices=PREFIX_MODES, default="inline",
+                    help="inline — инструкция в каждом запросе; cached — один раз как cached content, дальше ссылка "
+                         "(если кэш создать не удалось — автоматически inline)")
+    ap.add_argument("--prefix-ttl", type=int, default=3600, help="TTL cached content, сек (по умолчанию 3600)")
+    ap.add_argument("--store", type=Path, default=DEFAULT_STORE_PATH,
+                    help=f"SQLite-хранилище результатов (по умолчанию {DEFAULT_STORE_PATH}); "
+                         "запросы и импорт старых *.json — results_store.py")
+    ap.add_argument("--no-store", action="store_true",
+                    help="Как раньше: каждый результат в отдельный results/<stem>_<ts>.json")
+    ap.add_argument("--metrics", type=Path, default=DEFAULT_METRICS_PATH,
+                    help=f"Куда дописывать телеметрию (JSONL, по умолчанию {DEFAULT_METRICS_PATH}); отчёт — metrics.py report")
+    ap.add_argument("--no-metrics", action="store_true", help="Не писать телеметрию")
+    ap.add_argument("--cache", type=Path, default=DEFAULT_CACHE_PATH,
+                    help=f"SQLite-кэш результатов по содержимому картинки (по умолчанию {DEFAULT_CACHE_PATH})")
+    ap.add_argument("--no-cache", action="store_true", help="Не читать и не писать кэш")
+    ap.add_argument("--cache-max-mb", type=float, default=256,
+                    help="Лимит размера кэша, МБ; при превышении удаляются давно не читанные записи")
+    ap.add_argument("--resize-max-edge", type=int, default=0,
+                    help="Перед отправкой уменьшить картинку до N px по длинной стороне (0 — слать как есть)")
+    ap.add_argument("--resize-format", choices=sorted(PREPROCESS_FORMATS), default="jpeg",
+                    help="Формат перекодирования при --resize-max-edge (по умолчанию jpeg)")
+    ap.add_argument("--resize-quality", type=int, default=85, help="Качество jpeg/webp (по умолчанию 85)")
+    ap.add_argument("--knn", type=Path, default=None, metavar="INDEX",
+                    help="Локальный kNN перед Gemini: путь к индексу .npz (например results/knn_index.npz); "
+                         "уверенные совпадения не идут в API, новые ответы Gemini дописываются в индекс")
+    ap.add_argument("--knn-threshold", type=float, default=0.95,
+                    help="Минимальная косинусная близость соседа для ответа без API (по умолчанию 0.95)")
+    ap.add_argument("--knn-audit", action="store_true",
+                    help="На kNN-совпадении всё равно спрашивать Gemini и считать расхождения")
+    ap.add_argument("--project",  default=os.getenv("GOOGLE_CLOUD_PROJECT"), help="GCP project id")
+    ap.add_argument("--location", default=os.getenv("GOOGLE_CLOUD_LOCATION", "us-central1"), help="Vertex AI location")
+    ap.add_argument("--print",    dest="print_mode", choices=["all","time"], default="all",
+                    help="Что печатать в консоль: all — весь JSON, time — только время и путь")
+    args = ap.parse_args()
+
+    if bool(args.image) == bool(args.batch):
+        ap.error("укажите либо путь к изображению, либо --batch SOURCE")
+    if not args.project:
+        raise SystemExit("Не задан project. Передайте --project или установите переменную GOOGLE_CLOUD_PROJECT.")
+
+    preprocess = None
+    if args.resize_max_edge > 0:
+        preprocess = {"max_edge": args.resize_max_edge, "fmt": args.resize_format, "quality": args.resize_quality}
+
+    prefix = make_prefix(args.prefix_mode, MODEL_NAME, ttl_seconds=args.prefix_ttl)
+
+    store = None if args.no_store else ResultsStore(args.store)
+    metrics = None if args.no_metrics else MetricsSink(args.metrics)
+
+    knn = None
+    if args.knn:
+        from knn_index import KnnIndex  # numpy нужен только с --knn
+        knn = KnnIndex(args.knn, threshold=args.knn_threshold, audit=args.knn_audit)
+
+    cache = None
+    if not args.no_cache:
+        cache = ResultCache(args.cache, version=taxonomy_version(preprocess), taxonomy=taxonomy_version(),
+                            max_bytes=int(args.cache_max_mb * 1024 * 1024))
+
+    if args.batch:
+        images = collect_images(args.batch)
+        if not images:
+            raise SystemExit(f"В источнике нет изображений: {args.batch}")
+        try:
+            errors = run_batch(images, args.project, args.location, args.concurrency, args.print_mode,
+                               cache=cache, preprocess=preprocess, pack=args.pack, prefix=prefix, knn=knn,
+                               store=store, metrics=metrics)
+        finally:
+            if knn is not None:
+                knn.save()
+        sys.exit(1 if errors else 0)
+
+    result, dbg, saved_to = classify_one(args.image, project=args.project, location=args.location,
+                                         cache=cache, preprocess=preprocess, prefix=prefix, knn=knn, store=store)
+    if metrics is not None:
+        metrics.record(args.image, result, dbg)
+    if knn is not None:
+        knn.save()
+
+    # 5) Вывод результата
+    if args.print_mode == "all":
+        print(json.dumps(result, ensure_ascii=False, indent=2))
+        print(f"\n✅ Saved: {saved_to}")
+    else:
+        print(f"elapsed_seconds={result['elapsed_seconds']}  saved_to={saved_to}")
+
+    # 6) Детальный «вес» запроса (всегда выводим ниже)
+    print_weight(dbg)
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,193 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Локальный kNN-предклассификатор (только CPU, NumPy).
+
+Для картинки считаем компактный вектор признаков:
+- форма: 16x16 в оттенках серого по обрезке до вещи (фон белый/прозрачный), zero-mean + L2;
+- цвет: гистограмма HSV 8x4x4 только по пикселям вещи (корень + L2).
+Ищем ближайших соседей (косинус) среди уже проверенных ответов Gemini.
+Если соседи достаточно близки и согласны между собой — отдаём их coarse/fine без запроса к API.
+Каждый свежий ответ Gemini добавляется в индекс.
+"""
+import json, os, threading
+from io import BytesIO
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+
+DEFAULT_INDEX_PATH = Path("results") / "knn_index.npz"
+
+SHAPE_SIDE = 16
+HSV_BINS = (8, 4, 4)
+SHAPE_WEIGHT = 0.6   # вклад формы; цвет — остальное
+WHITE_TOL = 18       # насколько пиксель может отличаться от белого, чтобы считаться фоном
+
+EMBED_DIM = SHAPE_SIDE * SHAPE_SIDE + HSV_BINS[0] * HSV_BINS[1] * HSV_BINS[2]
+
+def embed_image(image_bytes: bytes) -> np.ndarray:
+    """Вектор признаков (float32, L2-норма = 1). PIL не смог открыть — OSError."""
+    from PIL import Image, ImageOps
+
+    im = Image.open(BytesIO(image_bytes))
+    im.draft("RGB", (256, 256))  # JPEG: декодируем сразу уменьшенным, точность тут не нужна
+    im = ImageOps.exif_transpose(im)
+    im.thumbnail((256, 256))
+    if im.mode in ("RGBA", "LA") or (im.mode == "P" and "transparency" in im.info):
+        im = im.convert("RGBA")
+        bg = Image.new("RGB", im.size, (255, 255, 255))
+        bg.paste(im, mask=im.split()[-1])
+        im = bg
+    im = im.convert("RGB")
+
+    rgb = np.asarray(im, dtype=np.int16)
+    fg = (255 - rgb).max(axis=2) > WHITE_TOL
+    if fg.any():
+        ys, xs = np.nonzero(fg)
+        y0, y1, x0, x1 = ys.min(), ys.max() + 1, xs.min(), xs.max() + 1
+    else:
+        y0, y1, x0, x1 = 0, rgb.shape[0], 0, rgb.shape[1]
+
+    # Форма: силуэт вещи, приведённый к квадрату
+    crop = im.crop((int(x0), int(y0), int(x1), int(y1)))
+    gray = np.asarray(crop.convert("L").resize((SHAPE_SIDE, SHAPE_SIDE), Image.BILINEAR), dtype=np.float32).ravel()
+    gray -= gray.mean()
+    gray /= np.linalg.norm(gray) or 1.0
+
+    # Цвет: HSV-гистограмма только по пикселям вещи
+    hsv = np.asarray(im.convert("HSV"), dtype=np.int32)[fg] if fg.any() else np.asarray(im.convert("HSV"), dtype=np.int32).reshape(-1, 3)
+    bins = np.array(HSV_BINS)
+    idx = (hsv * bins // 256)
+    flat = (idx[:, 0] * bins[1] + idx[:, 1]) * bins[2] + idx[:, 2]
+    hist = np.bincount(flat, minlength=int(bins.prod())).astype(np.float32)
+    hist = np.sqrt(hist / (hist.sum() or 1.0))
+    hist /= np.linalg.norm(hist) or 1.0
+
+    vec = np.concatenate([gray * np.sqrt(SHAPE_WEIGHT), hist * np.sqrt(1.0 - SHAPE_WEIGHT)]).astype(np.float32)
+    return vec / (np.linalg.norm(vec) or 1.0)
+
+class KnnIndex:
+    """
+    Индекс в памяти + .npz на диске: vectors (N, D), labels (coarse, fine), hashes картинок.
+    Доступ из потоков batch-режима — под локом.
+    """
+
+    def __init__(self, path: Path = DEFAULT_INDEX_PATH, threshold: float = 0.95, k: int = 5, audit: bool = False):
+        self.path = Path(path)
+        self.threshold = threshold
+        self.k = k
+        # audit: на hit всё равно спрашиваем Gemini и считаем расхождения (цена — никакой экономии)
+        self.audit = audit
+        self._lock = threading.Lock()
+        self._vectors = np.zeros((0, EMBED_DIM), dtype=np.float32)
+        self._n = 0
+        self._labels: List[Tuple[str, str]] = []
+        self._hashes: Dict[str, int] = {}
+        self._dirty = False
+        self.stats: Dict[str, float] = {
+            "lookups": 0, "hits": 0, "added": 0,
+            "audits": 0, "disagreements": 0,
+            "gemini_seconds": 0.0, "gemini_calls": 0, "knn_seconds": 0.0,
+        }
+        if self.path.exists():
+            self._load()
+
+    def __len__(self) -> int:
+        return self._n
+
+    def _load(self) -> None:
+        with np.load(self.path, allow_pickle=False) as data:
+            vectors = data["vectors"].astype(np.float32)
+            meta = json.loads(str(data["meta"]))
+        if vectors.shape[1:] != (EMBED_DIM,):
+            # Поменялся состав признаков — старый индекс несовместим, начинаем с нуля
+            return
+        self._vectors = vectors
+        self._n = len(vectors)
+        self._labels = [tuple(x) for x in meta["labels"]]
+        self._hashes = {h: i for i, h in enumerate(meta["hashes"])}
+
+    def save(self) -> None:
+        """Атомарно: пишем во временный файл и подменяем."""
+        with self._lock:
+            if not self._dirty:
+                return
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            hashes = [""] * self._n
+            for h, i in self._hashes.items():
+                hashes[i] = h
+            meta = json.dumps({"labels": self._labels, "hashes": hashes}, ensure_ascii=False)
+            tmp = self.path.with_name(self.path.name + ".tmp.npz")
+            np.savez(tmp, vectors=self._vectors[:self._n], meta=np.array(meta))
+            os.replace(tmp, self.path)
+            self._dirty = False
+
+    def predict(self, vec: np.ndarray) -> Optional[Dict[str, Any]]:
+        """
+        Метки ближайших соседей, если им можно верить:
+        ближайший сосед не дальше порога и среди соседей выше порога его fine — большинство.
+        """
+        with self._lock:
+            self.stats["lookups"] += 1
+            if self._n == 0:
+                return None
+            sims = self._vectors[:self._n] @ vec
+            k = min(self.k, self._n)
+            top = np.argpartition(-sims, k - 1)[:k]
+            top = top[np.argsort(-sims[top])]
+            best = int(top[0])
+            if sims[best] < self.threshold:
+                return None
+            close = [int(i) for i in top if sims[i] >= self.threshold]
+            votes = sum(1 for i in close if self._labels[i][1] == self._labels[best][1])
+            if votes * 2 <= len(close):
+                return None
+            self.stats["hits"] += 1
+            coarse, fine = self._labels[best]
+            return {"coarse_category": coarse, "fine_category": fine,
+                    "similarity": round(float(sims[best]), 4), "neighbours": len(close)}
+
+    def add(self, vec: np.ndarray, coarse: str, fine: str, image_hash: str) -> None:
+        """Добавить проверенный ответ. Та же картинка (по hash) — обновляем метки, а не дублируем."""
+        with self._lock:
+            if image_hash in self._hashes:
+                i = self._hashes[image_hash]
+                self._vectors[i] = vec
+                self._labels[i] = (coarse, fine)
+            else:
+                if self._n == len(self._vectors):
+                    grown = np.zeros((max(64, 2 * len(self._vectors)), EMBED_DIM), dtype=np.float32)
+                    grown[:self._n] = self._vectors[:self._n]
+                    self._vectors = grown
+                self._vectors[self._n] = vec
+                self._labels.append((coarse, fine))
+                self._hashes[image_hash] = self._n
+                self._n += 1
+            self.stats["added"] += 1
+            self._dirty = True
+
+    def record(self, **deltas: float) -> None:
+        with self._lock:
+            for key, value in deltas.items():
+                self.stats[key] += value
+
+    def report(self) -> Dict[str, Any]:
+        with self._lock:
+            st = dict(self.stats)
+        avg_gemini = st["gemini_seconds"] / st["gemini_calls"] if st["gemini_calls"] else None
+        avg_knn = st["knn_seconds"] / st["lookups"] if st["lookups"] else None
+        return {
+            "entries": self._n,
+            "lookups": int(st["lookups"]),
+            "hits": int(st["hits"]),
+            "hit_rate": round(st["hits"] / st["lookups"], 3) if st["lookups"] else None,
+            "avg_gemini_seconds": round(avg_gemini, 3) if avg_gemini is not None else None,
+            "avg_knn_seconds": round(avg_knn, 4) if avg_knn is not None else None,
+            # Оценка: каждый hit сэкономил средний запрос к Gemini этого прогона
+            "saved_seconds_est": round((st["hits"] - st["audits"]) * (avg_gemini - (avg_knn or 0)), 2)
+                                 if avg_gemini is not None else None,
+            "audits": int(st["audits"]),
+            "disagreements": int(st["disagreements"]),
+            "disagreement_rate": round(st["disagreements"] / st["audits"], 3) if st["audits"] else None,
+        }
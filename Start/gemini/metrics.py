@@ -0,0 +1,215 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Телеметрия classify_garment: одна строка JSONL на классифицированную картинку.
+
+Что пишем: время (всего / чтение файла / пре-обработка / запрос к API),
+байты, токены, модель, источник ответа (gemini / cache / knn).
+Запрос к API (request_seconds) разбит на сборку запроса на клиенте (build_seconds),
+блокирующий generate_content (generate_seconds) и разбор ответа (parse_seconds).
+generate_content — один HTTP round trip: отправку картинки и ожидание модели
+SDK снаружи не различает, поэтому они вместе в generate_seconds.
+В упакованном режиме (--pack) байты и время — доля картинки (весь запрос / K), целиком — в *_pack,
+так что «на картинку» сравнимо между режимами.
+
+Отчёт:
+    python metrics.py report                          # p50/p95/p99 по дням
+    python metrics.py report --by model --since 2025-11-01
+    python metrics.py report --prometheus results/classify.prom
+"""
+import argparse, datetime, json, math, os, sys, threading
+from collections import defaultdict
+from pathlib import Path
+from typing import Any, Dict, Iterable, List, Optional
+
+DEFAULT_METRICS_PATH = Path("results") / "metrics.jsonl"
+
+_DEBUG_FIELDS = [
+    "model", "prefix_mode", "pack_size",
+    "image_bytes", "image_bytes_original", "request_bytes_total", "response_bytes",
+    "input_tokens", "output_tokens", "cached_tokens", "new_input_tokens",
+    "request_bytes_pack", "request_seconds_pack",
+    "read_seconds", "preprocess_seconds", "request_seconds",
+    "build_seconds", "generate_seconds", "parse_seconds",
+]
+
+def new_run_id() -> str:
+    return datetime.datetime.now().strftime("%Y%m%d_%H%M%S") + f"_{os.getpid()}"
+
+def _source(dbg: Dict[str, Any]) -> str:
+    if dbg.get("cache") == "hit":
+        return "cache"
+    if dbg.get("knn") == "hit":
+        return "knn"
+    return "gemini"
+
+class MetricsSink:
+    """
+    Дописывает строки в JSONL. Каждая строка — один write() в файл, открытый на append,
+    так что параллельные процессы не перемешивают записи; потоки — под локом.
+    """
+
+    def __init__(self, path: Path = DEFAULT_METRICS_PATH, run_id: Optional[str] = None):
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.run_id = run_id or new_run_id()
+        self._lock = threading.Lock()
+
+    def record(self, image_path: str, result: Dict[str, Any], dbg: Dict[str, Any]) -> None:
+        row = {
+            "ts": datetime.datetime.now().isoformat(timespec="seconds"),
+            "run_id": self.run_id,
+            "image": str(image_path),
+            "source": _source(dbg),
+            "elapsed_seconds": result.get("elapsed_seconds"),
+            **{k: dbg.get(k) for k in _DEBUG_FIELDS if dbg.get(k) is not None},
+        }
+        line = json.dumps(row, ensure_ascii=False) + "\n"
+        with self._lock:
+            with open(self.path, "a", encoding="utf-8") as f:
+                f.write(line)
+
+# =======================
+# Отчёт
+# =======================
+def load_rows(path: Path, since: Optional[str] = None, until: Optional[str] = None) -> List[Dict[str, Any]]:
+    rows = []
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                row = json.loads(line)
+            except ValueError:
+                continue  # недописанная строка упавшего процесса
+            day = row.get("ts", "")[:10]
+            if (since and day < since) or (until and day > until):
+                continue
+            rows.append(row)
+    return rows
+
+def percentile(values: List[float], q: float) -> Optional[float]:
+    """Nearest-rank: q в [0, 100]."""
+    if not values:
+        return None
+    xs = sorted(values)
+    rank = max(1, math.ceil(q / 100 * len(xs)))
+    return xs[rank - 1]
+
+def _mean(values: Iterable[Optional[float]]) -> Optional[float]:
+    xs = [v for v in values if v is not None]
+    return sum(xs) / len(xs) if xs else None
+
+def summarize(rows: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """Латентность считаем только по реальным запросам к модели, кэш/kNN — отдельными счётчиками."""
+    api = [r for r in rows if r.get("source") == "gemini"]
+    lat = [r["elapsed_seconds"] for r in api if r.get("elapsed_seconds") is not None]
+    req = [r["request_seconds"] for r in api if r.get("request_seconds") is not None]
+    gen = [r["generate_seconds"] for r in api if r.get("generate_seconds") is not None]
+    return {
+        "images": len(rows),
+        "api_calls": len(api),
+        "cache_hits": sum(1 for r in rows if r.get("source") == "cache"),
+        "knn_hits": sum(1 for r in rows if r.get("source") == "knn"),
+        "p50": percentile(lat, 50), "p95": percentile(lat, 95), "p99": percentile(lat, 99),
+        "request_p50": percentile(req, 50), "request_p95": percentile(req, 95),
+        "generate_p50": percentile(gen, 50), "generate_p95": percentile(gen, 95),
+        "read_avg": _mean(r.get("read_seconds") for r in api),
+        "preprocess_avg": _mean(r.get("preprocess_seconds") for r in api),
+        "build_avg": _mean(r.get("build_seconds") for r in api),
+        "parse_avg": _mean(r.get("parse_seconds") for r in api),
+        "input_tokens_per_image": _mean(r.get("input_tokens") for r in api),
+        "output_tokens_per_image": _mean(r.get("output_tokens") for r in api),
+        "cached_tokens_per_image": _mean(r.get("cached_tokens") for r in api),
+        "request_bytes_per_image": _mean(r.get("request_bytes_total") for r in api),
+        "image_bytes_per_image": _mean(r.get("image_bytes") for r in api),
+    }
+
+def group_rows(rows: List[Dict[str, Any]], by: str) -> Dict[str, List[Dict[str, Any]]]:
+    groups: Dict[str, List[Dict[str, Any]]] = defaultdict(list)
+    for r in rows:
+        key = r.get("ts", "")[:10] if by == "day" else str(r.get(by))
+        groups[key].append(r)
+    return dict(sorted(groups.items()))
+
+def _fmt(v: Optional[float], nd: int = 2) -> str:
+    return "-" if v is None else f"{v:.{nd}f}"
+
+def print_report(groups: Dict[str, List[Dict[str, Any]]], by: str) -> None:
+    print(f"{by:20s} {'images':>6s} {'api':>5s} {'cache':>5s} {'knn':>4s} {'p50 s':>6s} {'p95 s':>6s} {'p99 s':>6s} "
+          f"{'req p50':>7s} {'gen p50':>7s} {'build':>6s} {'in tok':>7s} {'out tok':>7s} {'cached':>6s} {'req KB':>7s}")
+    for key, rows in groups.items():
+        s = summarize(rows)
+        kb = s["request_bytes_per_image"] / 1024 if s["request_bytes_per_image"] is not None else None
+        print(f"{key[:20]:20s} {s['images']:>6d} {s['api_calls']:>5d} {s['cache_hits']:>5d} {s['knn_hits']:>4d} "
+              f"{_fmt(s['p50']):>6s} {_fmt(s['p95']):>6s} {_fmt(s['p99']):>6s} {_fmt(s['request_p50']):>7s} "
+              f"{_fmt(s['generate_p50']):>7s} {_fmt(s['build_avg'], 3):>6s} "
+              f"{_fmt(s['input_tokens_per_image'], 0):>7s} {_fmt(s['output_tokens_per_image'], 0):>7s} "
+              f"{_fmt(s['cached_tokens_per_image'], 0):>6s} {_fmt(kb, 1):>7s}")
+
+def prometheus_text(rows: List[Dict[str, Any]]) -> str:
+    """Prometheus text exposition (например, для textfile collector у node_exporter)."""
+    out = [
+        "# HELP classify_garment_latency_seconds End-to-end latency of API-backed classifications.",
+        "# TYPE classify_garment_latency_seconds summary",
+    ]
+    by_model = group_rows([r for r in rows if r.get("source") == "gemini"], "model")
+    for model, mrows in by_model.items():
+        s = summarize(mrows)
+        lat = [r["elapsed_seconds"] for r in mrows if r.get("elapsed_seconds") is not None]
+        for q, v in (("0.5", s["p50"]), ("0.95", s["p95"]), ("0.99", s["p99"])):
+            if v is not None:
+                out.append(f'classify_garment_latency_seconds{{model="{model}",quantile="{q}"}} {v}')
+        out.append(f'classify_garment_latency_seconds_sum{{model="{model}"}} {round(sum(lat), 3)}')
+        out.append(f'classify_garment_latency_seconds_count{{model="{model}"}} {len(lat)}')
+    for name, key, help_text in (
+        ("classify_garment_input_tokens_per_image", "input_tokens_per_image", "Mean input tokens per API call."),
+        ("classify_garment_output_tokens_per_image", "output_tokens_per_image", "Mean output tokens per API call."),
+        ("classify_garment_request_bytes_per_image", "request_bytes_per_image", "Mean request bytes per API call."),
+    ):
+        out += [f"# HELP {name} {help_text}", f"# TYPE {name} gauge"]
+        for model, mrows in by_model.items():
+            v = summarize(mrows)[key]
+            if v is not None:
+                out.append(f'{name}{{model="{model}"}} {v:.1f}')
+    out += ["# HELP classify_garment_images_total Classified images by answer source.",
+            "# TYPE classify_garment_images_total counter"]
+    counts: Dict[str, int] = defaultdict(int)
+    for r in rows:
+        counts[r.get("source", "gemini")] += 1
+    for source, n in sorted(counts.items()):
+        out.append(f'classify_garment_images_total{{source="{source}"}} {n}')
+    return "\n".join(out) + "\n"
+
+def main():
+    ap = argparse.ArgumentParser(description="Отчёт по телеметрии classify_garment (metrics.jsonl)")
+    sub = ap.add_subparsers(dest="cmd", required=True)
+    rep = sub.add_parser("report", help="p50/p95/p99, токены и байты на картинку")
+    rep.add_argument("--metrics", type=Path, default=DEFAULT_METRICS_PATH, help=f"JSONL (по умолчанию {DEFAULT_METRICS_PATH})")
+    rep.add_argument("--by", choices=["day", "run_id", "model", "prefix_mode", "pack_size"], default="day")
+    rep.add_argument("--since", help="YYYY-MM-DD")
+    rep.add_argument("--until", help="YYYY-MM-DD")
+    rep.add_argument("--prometheus", type=Path, help="Дополнительно записать Prometheus text format в файл ('-' — stdout)")
+    args = ap.parse_args()
+
+    if not args.metrics.exists():
+        raise SystemExit(f"Нет файла метрик: {args.metrics}")
+    rows = load_rows(args.metrics, since=args.since, until=args.until)
+    if not rows:
+        raise SystemExit("Нет записей за выбранный период")
+
+    print_report(group_rows(rows, args.by), args.by)
+
+    if args.prometheus:
+        text = prometheus_text(rows)
+        if str(args.prometheus) == "-":
+            sys.stdout.write("\n" + text)
+        else:
+            tmp = args.prometheus.with_name(args.prometheus.name + ".tmp")
+            tmp.write_text(text, encoding="utf-8")
+            os.replace(tmp, args.prometheus)  # textfile collector не должен увидеть полфайла
+            print(f"\nPrometheus: {args.prometheus}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,96 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Как отправлять статичный префикс запроса (инструкция + GLOSSARY).
+
+- InlinePrefix  — как раньше: текст инструкции в каждом запросе.
+- CachedPrefix  — инструкция один раз регистрируется как cached content
+                  (client.caches.create), дальше запросы ссылаются на неё по имени.
+                  Если кэш создать не удалось (слишком короткий префикс, регион
+                  не поддерживает, сетевой сбой и т.п.) — откатываемся на inline
+                  и пробуем снова через FAILURE_BACKOFF_SEC (удваивается до FAILURE_BACKOFF_MAX_SEC).
+
+Бэкенд работает только через client.caches.create / client.models.generate_content,
+поэтому вместо настоящего genai.Client можно подставить локальный фейк.
+"""
+import hashlib, sys, threading, time
+from typing import Any, Dict, List, Optional, Tuple
+
+FAILURE_BACKOFF_SEC = 60.0
+FAILURE_BACKOFF_MAX_SEC = 900.0
+RENEW_MARGIN_SEC = 60.0   # пересоздаём кэш заранее (но не раньше половины TTL)
+
+class InlinePrefix:
+    mode = "inline"
+
+    def prepare(self, client: Any, instruction: str) -> Tuple[List[Any], Dict[str, Any]]:
+        """Возвращает (начало contents, доп. поля GenerateContentConfig)."""
+        return [instruction], {}
+
+    def invalidate(self, instruction: str) -> None:
+        pass
+
+class CachedPrefix:
+    mode = "cached"
+
+    def __init__(self, model: str, ttl_seconds: int = 3600):
+        self.model = model
+        self.ttl_seconds = ttl_seconds
+        self._names: Dict[str, Tuple[str, float]] = {}   # sha инструкции -> (имя кэша, когда истекает)
+        self._failed: Dict[str, Tuple[int, float]] = {}  # sha инструкции -> (отказов подряд, когда пробовать снова)
+        self._lock = threading.Lock()
+
+    def prepare(self, client: Any, instruction: str) -> Tuple[List[Any], Dict[str, Any]]:
+        name = self._cache_name(client, instruction)
+        if name is None:
+            return [instruction], {}
+        return [], {"cached_content": name}
+
+    def invalidate(self, instruction: str) -> None:
+        """Кэш на стороне API пропал/истёк — при следующем prepare создадим заново."""
+        with self._lock:
+            self._names.pop(self._key(instruction), None)
+
+    @staticmethod
+    def _key(instruction: str) -> str:
+        return hashlib.sha256(instruction.encode("utf-8")).hexdigest()
+
+    def _cache_name(self, client: Any, instruction: str) -> Optional[str]:
+        key = self._key(instruction)
+        with self._lock:
+            failed = self._failed.get(key)
+            if failed and failed[1] > time.time():
+                return None
+            entry = self._names.get(key)
+            # Пересоздаём заранее, чтобы не поймать 404 посреди батча. Запас — не больше половины TTL:
+            # иначе при коротком --prefix-ttl каждый запрос создавал бы кэш заново
+            if entry and entry[1] - min(RENEW_MARGIN_SEC, self.ttl_seconds / 2) > time.time():
+                return entry[0]
+            try:
+                from google.genai import types as gx
+                cached = client.caches.create(
+                    model=self.model,
+                    config=gx.CreateCachedContentConfig(
+                        contents=[instruction],
+                        ttl=f"{self.ttl_seconds}s",
+                        display_name=f"classify-garment-{key[:12]}",
+                    ),
+                )
+            except Exception as e:
+                # Сбой может быть временным: не выключаем кэш навсегда, а пробуем снова с растущей паузой
+                count = failed[0] + 1 if failed else 1
+                backoff = min(FAILURE_BACKOFF_MAX_SEC, FAILURE_BACKOFF_SEC * 2 ** (count - 1))
+                self._failed[key] = (count, time.time() + backoff)
+                print(f"[warn] prompt cache недоступен ({e}) — инструкция идёт inline, "
+                      f"повтор через {backoff:.0f} сек", file=sys.stderr)
+                return None
+            self._failed.pop(key, None)
+            self._names[key] = (cached.name, time.time() + self.ttl_seconds)
+            return cached.name
+
+PREFIX_MODES = ("inline", "cached")
+
+def make_prefix(mode: str, model: str, ttl_seconds: int = 3600):
+    if mode == "cached":
+        return CachedPrefix(model, ttl_seconds=ttl_seconds)
+    return InlinePrefix()
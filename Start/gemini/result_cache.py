@@ -0,0 +1,159 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Локальный кэш результатов классификации (SQLite).
+
+Ключ = sha256 байтов изображения + «версия» (хэш схемы, GLOSSARY, инструкции, имени модели
+и параметров пре-обработки). Отдельно хранится «таксономия» — та же версия без пре-обработки:
+поменяли схему или модель -> старые записи больше не находятся и вычищаются при следующем
+открытии кэша. Варианты одной таксономии с разной пре-обработкой (--resize-*) живут рядом,
+а ненужные со временем уходят по LRU.
+"""
+import hashlib, json, sqlite3, threading, time
+from pathlib import Path
+from typing import Dict, Any, Optional
+
+DEFAULT_CACHE_PATH = Path("results") / "cache.sqlite"
+DEFAULT_MAX_BYTES = 256 * 1024 * 1024
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS results (
+    image_hash  TEXT NOT NULL,
+    version     TEXT NOT NULL,
+    taxonomy    TEXT NOT NULL DEFAULT '',
+    payload     TEXT NOT NULL,
+    size_bytes  INTEGER NOT NULL,
+    created_at  REAL NOT NULL,
+    last_access REAL NOT NULL,
+    PRIMARY KEY (image_hash, version)
+);
+CREATE INDEX IF NOT EXISTS idx_results_last_access ON results(last_access);
+CREATE TABLE IF NOT EXISTS counters (
+    name  TEXT PRIMARY KEY,
+    value INTEGER NOT NULL
+);
+"""
+
+def content_hash(data: bytes) -> str:
+    return hashlib.sha256(data).hexdigest()
+
+def version_hash(*parts: Any) -> str:
+    """Хэш от всего, что влияет на ответ модели (схема, глоссарий, модель и т.п.)."""
+    h = hashlib.sha256()
+    for p in parts:
+        if not isinstance(p, str):
+            p = json.dumps(p, ensure_ascii=False, sort_keys=True)
+        h.update(p.encode("utf-8"))
+        h.update(b"\0")
+    return h.hexdigest()[:16]
+
+class ResultCache:
+    """
+    Кэш attrs/debug по содержимому картинки.
+    Одно соединение на процесс, доступ из потоков batch-режима — под локом.
+    Размер ограничен max_bytes: при переполнении выкидываем давно не читанные записи (LRU).
+    """
+
+    def __init__(self, path: Path = DEFAULT_CACHE_PATH, version: str = "", max_bytes: int = DEFAULT_MAX_BYTES,
+                 taxonomy: Optional[str] = None):
+        """taxonomy — часть версии без пре-обработки; по умолчанию совпадает с version."""
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.version = version
+        self.taxonomy = version if taxonomy is None else taxonomy
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(str(self.path), timeout=30, check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.executescript(_SCHEMA)
+        with self._lock, self._db:
+            columns = [r[1] for r in self._db.execute("PRAGMA table_info(results)")]
+            if "taxonomy" not in columns:  # кэш, созданный до колонки taxonomy
+                self._db.execute("ALTER TABLE results ADD COLUMN taxonomy TEXT NOT NULL DEFAULT ''")
+            self._db.execute("UPDATE results SET taxonomy = ? WHERE taxonomy = '' AND version = ?",
+                             (self.taxonomy, self.version))
+            # Записи под другую таксономию уже никогда не совпадут — удаляем.
+            # Другие версии той же таксономии (другой --resize-*) не трогаем: их читают другие запуски
+            self._db.execute("DELETE FROM results WHERE taxonomy != ?", (self.taxonomy,))
+
+    def get(self, image_hash: str) -> Optional[Dict[str, Any]]:
+        with self._lock, self._db:
+            row = self._db.execute(
+                "SELECT payload FROM results WHERE image_hash = ? AND version = ?",
+                (image_hash, self.version),
+            ).fetchone()
+            if row is None:
+                self.misses += 1
+                self._bump("misses")
+                return None
+            self.hits += 1
+            self._bump("hits")
+            self._db.execute(
+                "UPDATE results SET last_access = ? WHERE image_hash = ? AND version = ?",
+                (time.time(), image_hash, self.version),
+            )
+        return json.loads(row[0])
+
+    def put(self, image_hash: str, payload: Dict[str, Any]) -> None:
+        text = json.dumps(payload, ensure_ascii=False)
+        now = time.time()
+        with self._lock, self._db:
+            self._db.execute(
+                "INSERT OR REPLACE INTO results "
+                "(image_hash, version, taxonomy, payload, size_bytes, created_at, last_access) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (image_hash, self.version, self.taxonomy, text, len(text.encode("utf-8")), now, now),
+            )
+            self._evict()
+
+    def _bump(self, name: str) -> None:
+        self._db.execute(
+            "INSERT INTO counters (name, value) VALUES (?, 1) "
+            "ON CONFLICT(name) DO UPDATE SET value = value + 1",
+            (name,),
+        )
+
+    def _size(self) -> int:
+        return self._db.execute("SELECT COALESCE(SUM(size_bytes), 0) FROM results").fetchone()[0]
+
+    def _evict(self) -> None:
+        """Выкидываем LRU-записи, пока не уложимся в 90% лимита (чтобы не чистить на каждом put)."""
+        if self.max_bytes <= 0 or self._size() <= self.max_bytes:
+            return
+        target = int(self.max_bytes * 0.9)
+        rows = self._db.execute("SELECT image_hash, version, size_bytes FROM results ORDER BY last_access").fetchall()
+        size = sum(r[2] for r in rows)
+        for image_hash, version, nbytes in rows:
+            if size <= target:
+                break
+            self._db.execute("DELETE FROM results WHERE image_hash = ? AND version = ?", (image_hash, version))
+            size -= nbytes
+            self.evictions += 1
+            self._bump("evictions")
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            entries, size = self._db.execute(
+                "SELECT COUNT(*), COALESCE(SUM(size_bytes), 0) FROM results"
+            ).fetchone()
+            totals = dict(self._db.execute("SELECT name, value FROM counters").fetchall())
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 3) if lookups else None,
+            "evictions": self.evictions,
+            "entries": entries,
+            "size_bytes": size,
+            "max_bytes": self.max_bytes,
+            "total_hits": totals.get("hits", 0),
+            "total_misses": totals.get("misses", 0),
+            "total_evictions": totals.get("evictions", 0),
+        }
+
+    def close(self) -> None:
+        with self._lock:
+            self._db.close()
@@ -0,0 +1,195 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Хранилище результатов классификации (SQLite, только добавление).
+
+Вместо results/<stem>_<ts>.json на каждую картинку — одна база с индексами
+по coarse_category, fine_category, pattern и analysis_date.
+Пишут в неё и потоки одного batch-прогона, и несколько процессов сразу:
+WAL + busy_timeout, каждая запись — короткая отдельная транзакция.
+
+CLI:
+    python results_store.py import results/                       # перенести старые *.json
+    python results_store.py query --coarse bottom --pant-length cropped
+    python results_store.py query --fine jeans --since 2025-11-01 --format paths
+    python results_store.py stats
+"""
+import argparse, json, sqlite3, sys, threading, time
+from pathlib import Path
+from typing import Any, Dict, Iterable, List, Optional
+
+DEFAULT_STORE_PATH = Path("results") / "results.sqlite"
+
+# Колонки итогового JSON из classify_garment.build_result (по ним можно фильтровать)
+RESULT_COLUMNS = [
+    "analysis_date", "input_image_path", "coarse_category", "fine_category",
+    "pattern", "sleeve_length", "neckline", "material_guess",
+    "pant_length", "hem_finish", "notes", "elapsed_seconds",
+]
+FILTER_COLUMNS = ["coarse_category", "fine_category", "pattern", "sleeve_length",
+                  "neckline", "pant_length", "hem_finish"]
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS results (
+    id               INTEGER PRIMARY KEY AUTOINCREMENT,
+    analysis_date    TEXT,
+    input_image_path TEXT,
+    coarse_category  TEXT,
+    fine_category    TEXT,
+    pattern          TEXT,
+    sleeve_length    TEXT,
+    neckline         TEXT,
+    material_guess   TEXT,
+    pant_length      TEXT,
+    hem_finish       TEXT,
+    notes            TEXT,
+    elapsed_seconds  REAL,
+    source_file      TEXT UNIQUE,   -- для импортированных *.json: повторный импорт не дублирует
+    created_at       REAL NOT NULL,
+    payload          TEXT NOT NULL  -- полный JSON результата как есть
+);
+CREATE INDEX IF NOT EXISTS idx_results_coarse ON results(coarse_category);
+CREATE INDEX IF NOT EXISTS idx_results_fine ON results(fine_category);
+CREATE INDEX IF NOT EXISTS idx_results_pattern ON results(pattern);
+CREATE INDEX IF NOT EXISTS idx_results_date ON results(analysis_date);
+"""
+
+class ResultsStore:
+    def __init__(self, path: Path = DEFAULT_STORE_PATH):
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(str(self.path), timeout=30, check_same_thread=False)
+        self._db.row_factory = sqlite3.Row
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA busy_timeout=30000")
+        self._db.executescript(_SCHEMA)
+
+    def add(self, result: Dict[str, Any], source_file: Optional[str] = None) -> Optional[int]:
+        """Добавить результат. Возвращает id (None — такой source_file уже импортирован)."""
+        values = [result.get(c) for c in RESULT_COLUMNS]
+        with self._lock, self._db:
+            cur = self._db.execute(
+                f"INSERT OR IGNORE INTO results ({', '.join(RESULT_COLUMNS)}, source_file, created_at, payload) "
+                f"VALUES ({', '.join('?' * len(RESULT_COLUMNS))}, ?, ?, ?)",
+                (*values, source_file, time.time(), json.dumps(result, ensure_ascii=False)),
+            )
+            return cur.lastrowid if cur.rowcount else None
+
+    def location(self, row_id: Optional[int]) -> str:
+        return f"{self.path}#{row_id}"
+
+    def query(self, since: Optional[str] = None, until: Optional[str] = None,
+              limit: Optional[int] = None, **filters: Optional[str]) -> List[Dict[str, Any]]:
+        """
+        Результаты по фильтрам-равенствам (coarse_category=..., pant_length=... из FILTER_COLUMNS)
+        и диапазону analysis_date (YYYY-MM-DD, включительно). Новые — первыми.
+        """
+        where, params = [], []
+        for col, value in filters.items():
+            if value is None:
+                continue
+            if col not in FILTER_COLUMNS:
+                raise ValueError(f"Нельзя фильтровать по '{col}'. Доступно: {', '.join(FILTER_COLUMNS)}")
+            where.append(f"{col} = ?")
+            params.append(value)
+        if since:
+            where.append("analysis_date >= ?")
+            params.append(since)
+        if until:
+            where.append("analysis_date <= ?")
+            params.append(until)
+        sql = "SELECT id, payload FROM results"
+        if where:
+            sql += " WHERE " + " AND ".join(where)
+        sql += " ORDER BY analysis_date DESC, id DESC"
+        if limit:
+            sql += f" LIMIT {int(limit)}"
+        with self._lock:
+            rows = self._db.execute(sql, params).fetchall()
+        return [dict(json.loads(r["payload"]), id=r["id"]) for r in rows]
+
+    def counts(self, column: str = "fine_category") -> List[Dict[str, Any]]:
+        if column not in FILTER_COLUMNS:
+            raise ValueError(f"Нельзя группировать по '{column}'")
+        with self._lock:
+            rows = self._db.execute(
+                f"SELECT {column} AS value, COUNT(*) AS n FROM results GROUP BY {column} ORDER BY n DESC"
+            ).fetchall()
+        return [dict(r) for r in rows]
+
+    def import_json_files(self, files: Iterable[Path]) -> Dict[str, int]:
+        """Перенос старых results/*.json. Файлы без coarse/fine (не результаты) пропускаем."""
+        stats = {"imported": 0, "duplicates": 0, "skipped": 0}
+        for f in files:
+            try:
+                data = json.loads(f.read_text(encoding="utf-8"))
+            except (OSError, ValueError) as e:
+                print(f"[warn] {f}: не читается ({e})", file=sys.stderr)
+                stats["skipped"] += 1
+                continue
+            if not isinstance(data, dict) or "coarse_category" not in data or "fine_category" not in data:
+                stats["skipped"] += 1
+                continue
+            row_id = self.add(data, source_file=str(f.resolve()))
+            stats["imported" if row_id is not None else "duplicates"] += 1
+        return stats
+
+    def close(self) -> None:
+        with self._lock:
+            self._db.close()
+
+# =======================
+# CLI
+# =======================
+def _print_rows(rows: List[Dict[str, Any]], fmt: str) -> None:
+    if fmt == "json":
+        print(json.dumps(rows, ensure_ascii=False, indent=2))
+    elif fmt == "paths":
+        for r in rows:
+            print(r.get("input_image_path"))
+    else:
+        for r in rows:
+            extra = "  ".join(f"{c}={r[c]}" for c in ("pattern", "pant_length", "hem_finish") if r.get(c))
+            print(f"{r['id']:>6}  {r.get('analysis_date')}  {r.get('coarse_category')}/{r.get('fine_category')}  "
+                  f"{extra}  {r.get('input_image_path')}")
+        print(f"\n{len(rows)} row(s)", file=sys.stderr)
+
+def main():
+    ap = argparse.ArgumentParser(description="Хранилище результатов classify_garment: импорт, запросы, статистика")
+    ap.add_argument("--store", type=Path, default=DEFAULT_STORE_PATH, help=f"Путь к базе (по умолчанию {DEFAULT_STORE_PATH})")
+    sub = ap.add_subparsers(dest="cmd", required=True)
+
+    imp = sub.add_parser("import", help="Перенести старые results/<stem>_<ts>.json в базу")
+    imp.add_argument("paths", nargs="+", type=Path, help="Папки и/или отдельные .json")
+
+    q = sub.add_parser("query", help="Найти результаты по атрибутам")
+    for col in FILTER_COLUMNS:
+        flag = "--" + col.replace("_category", "").replace("_", "-")
+        q.add_argument(flag, dest=col)
+    q.add_argument("--since", help="analysis_date >= YYYY-MM-DD")
+    q.add_argument("--until", help="analysis_date <= YYYY-MM-DD")
+    q.add_argument("--limit", type=int)
+    q.add_argument("--format", choices=["table", "json", "paths"], default="table")
+
+    st = sub.add_parser("stats", help="Сколько результатов по каждому значению")
+    st.add_argument("--by", choices=FILTER_COLUMNS, default="fine_category")
+
+    args = ap.parse_args()
+    store = ResultsStore(args.store)
+
+    if args.cmd == "import":
+        files: List[Path] = []
+        for p in args.paths:
+            files.extend(sorted(p.glob("*.json")) if p.is_dir() else [p])
+        stats = store.import_json_files(files)
+        print(f"imported: {stats['imported']}  already there: {stats['duplicates']}  skipped: {stats['skipped']}")
+    elif args.cmd == "query":
+        filters = {col: getattr(args, col) for col in FILTER_COLUMNS}
+        _print_rows(store.query(since=args.since, until=args.until, limit=args.limit, **filters), args.format)
+    else:
+        for row in store.counts(args.by):
+            print(f"{row['n']:>6}  {row['value']}")
+
+if __name__ == "__main__":
+    main()
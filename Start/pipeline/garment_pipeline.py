@@ -0,0 +1,209 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Единый пайплайн в памяти: удаление фона -> crop -> flatten -> downscale -> классификация.
+
+Раньше remover_resize.py писал PNG (optimize=True, compress_level=9), а classify_garment.py
+читал его обратно и отправлял в Gemini: дорогой PNG-encode и диск — только чтобы передать
+картинку между скриптами. Здесь PIL-картинка живёт в памяти от segment() до запроса,
+в Gemini уходит один быстрый JPEG/WebP, а архивная копия (если нужна) пишется в фоновом
+потоке, пока мы ждём модель.
+
+Пример:
+    python garment_pipeline.py photo.jpg --archive
+    python garment_pipeline.py "../Vertex AI test" --no-remove-bg --upload-format webp
+"""
+import argparse, os, sys, time
+from concurrent.futures import Future, ThreadPoolExecutor
+from io import BytesIO
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+
+START_DIR = Path(__file__).resolve().parent.parent
+for _d in (START_DIR / "gemini", START_DIR / "remover_resize", START_DIR / "common"):
+    if str(_d) not in sys.path:
+        sys.path.insert(0, str(_d))
+
+import classify_garment as cg
+from image_loader import load_image
+from remover_resize import (OUTPUT_PROFILES, crop_and_flatten_np, downscale_pil_to_max_edge, output_path, save_output,
+                            segment, segment_proxy)
+
+STAGES = ["read", "segment", "crop_flatten", "downscale", "encode", "classify", "validate", "save"]
+
+class BackgroundArchiver:
+    """Архивные копии пишутся одним фоновым потоком (кодеки отпускают GIL) и не задерживают классификацию."""
+
+    def __init__(self, out_dir: Path, profile: str = "archive"):
+        self.out_dir = out_dir
+        self.profile = profile
+        self._pool = ThreadPoolExecutor(max_workers=1, thread_name_prefix="archive")
+        self._futures: List[Future] = []
+        self.seconds = 0.0
+
+    def submit(self, im: Any, input_path: str) -> Path:
+        out = output_path(input_path, self.out_dir, profile=self.profile)
+        self._futures.append(self._pool.submit(self._write, im, out))
+        return out
+
+    def _write(self, im: Any, out: Path) -> Path:
+        t = time.perf_counter()
+        save_output(im, out, profile=self.profile)
+        self.seconds += time.perf_counter() - t  # один поток — без лока
+        return out
+
+    def close(self) -> int:
+        """Дождаться всех записей. Возвращает число ошибок."""
+        self._pool.shutdown(wait=True)
+        errors = 0
+        for f in self._futures:
+            if f.exception() is not None:
+                errors += 1
+                print(f"[error] архив: {f.exception()}", file=sys.stderr)
+        return errors
+
+def encode_upload(im: Any, fmt: str = "jpeg", quality: int = 90) -> Tuple[bytes, str]:
+    """Кодирование для запроса к модели: быстро, в память (не архивный PNG)."""
+    pil_format, mime = cg.PREPROCESS_FORMATS[fmt]
+    buf = BytesIO()
+    if pil_format == "PNG":
+        im.save(buf, format="PNG", compress_level=1)
+    else:
+        im.save(buf, format=pil_format, quality=quality)
+    return buf.getvalue(), mime
+
+def run_pipeline(image_path: str, client: Any, max_edge: int = 1536, remove_background: bool = True,
+                 upload_format: str = "jpeg", quality: int = 90, prefix: Any = None,
+                 archiver: Optional[BackgroundArchiver] = None,
+                 store: Optional[cg.ResultsStore] = None,
+                 proxy_edge: int = 0) -> Tuple[Dict[str, Any], Dict[str, Any], str, Dict[str, float]]:
+    """
+    Один файл целиком. Возвращает (result, debug, куда сохранён результат, время по этапам в секундах).
+    remove_background=False — картинка уже без фона (этап segment пропускается, crop/flatten работают по альфе, если она есть).
+    proxy_edge — сегментация по уменьшенной копии (remover_resize.segment_proxy).
+    """
+    timings: Dict[str, float] = {}
+    t0 = time.perf_counter()
+
+    def _lap(stage: str, since: float) -> float:
+        now = time.perf_counter()
+        timings[stage] = round(now - since, 4)
+        return now
+
+    with open(image_path, "rb") as f:
+        img_bytes = f.read()
+    t = _lap("read", t0)
+
+    if remove_background and proxy_edge:
+        im = segment_proxy(img_bytes, proxy_edge=proxy_edge, max_edge=max_edge)
+    elif remove_background:
+        im = segment(img_bytes)
+    else:
+        # Без сегментации полный кадр не нужен: JPEG сразу в масштабе >= max_edge, альфа сохраняется для crop
+        im = load_image(img_bytes, max_edge=max_edge, mode=None, exact=False)
+    t = _lap("segment", t)
+
+    im = crop_and_flatten_np(im, alpha_threshold=0, bg_color=(255, 255, 255))
+    t = _lap("crop_flatten", t)
+    im = downscale_pil_to_max_edge(im, max_edge=max_edge)
+    t = _lap("downscale", t)
+
+    archived_to = archiver.submit(im, image_path) if archiver is not None else None
+
+    upload_bytes, mime = encode_upload(im, upload_format, quality)
+    t = _lap("encode", t)
+
+    attrs, dbg = cg.analyze_with_gemini(image_path, mime, project="", location="",
+                                        client=client, image_bytes=upload_bytes, prefix=prefix)
+    t = _lap("classify", t)
+    attrs = cg.validate_and_fix(attrs)
+    t = _lap("validate", t)
+
+    result = cg.build_result(image_path, attrs, round(t - t0, 3))
+    if store is not None:
+        saved_to = store.location(store.add(result))
+    else:
+        saved_to = str(cg.save_result(result, image_path).resolve())
+    _lap("save", t)
+
+    dbg.update(image_bytes_original=len(img_bytes), stage_seconds=timings)
+    if archived_to is not None:
+        dbg["archived_to"] = str(archived_to)
+    return result, dbg, saved_to, timings
+
+def print_timings(rows: List[Dict[str, float]]) -> None:
+    print("\n--- Stage wall time (avg / max, s) ---")
+    for stage in STAGES:
+        xs = [r[stage] for r in rows if stage in r]
+        if xs:
+            print(f"{stage:10s} {sum(xs) / len(xs):8.4f} {max(xs):8.4f}")
+    total = [sum(r.values()) for r in rows]
+    if total:
+        print(f"{'total':10s} {sum(total) / len(total):8.4f} {max(total):8.4f}")
+
+def main():
+    ap = argparse.ArgumentParser(description="Удаление фона -> crop -> downscale -> классификация Gemini, без промежуточных файлов")
+    ap.add_argument("source", help="Файл, папка, glob-шаблон или манифест (.txt/.json)")
+    ap.add_argument("--max-edge", type=int, default=1536, help="Длинная сторона после даунскейла (по умолчанию 1536)")
+    ap.add_argument("--no-remove-bg", action="store_true", help="Фон уже удалён — пропустить сегментацию")
+    ap.add_argument("--proxy-edge", type=int, default=0,
+                    help="Сегментировать уменьшенную копию (длинная сторона N px, например 640); 0 — по полному кадру")
+    ap.add_argument("--upload-format", choices=sorted(cg.PREPROCESS_FORMATS), default="jpeg",
+                    help="В каком формате отправлять в Gemini (по умолчанию jpeg)")
+    ap.add_argument("--quality", type=int, default=90, help="Качество jpeg/webp для отправки (по умолчанию 90)")
+    ap.add_argument("--archive", nargs="?", type=Path, const=Path("results"), default=None, metavar="DIR",
+                    help="Дополнительно сохранить <stem>_no_bg.<ext> в фоне; по умолчанию — results/")
+    ap.add_argument("--archive-profile", choices=list(OUTPUT_PROFILES), default="archive",
+                    help="Кодирование архивной копии (remover_resize.OUTPUT_PROFILES; по умолчанию archive — PNG compress_level=9)")
+    ap.add_argument("--store", type=Path, default=cg.DEFAULT_STORE_PATH,
+                    help=f"SQLite-хранилище результатов (по умолчанию {cg.DEFAULT_STORE_PATH})")
+    ap.add_argument("--no-store", action="store_true", help="Каждый результат в отдельный results/<stem>_<ts>.json")
+    ap.add_argument("--project",  default=os.getenv("GOOGLE_CLOUD_PROJECT"), help="GCP project id")
+    ap.add_argument("--location", default=os.getenv("GOOGLE_CLOUD_LOCATION", "us-central1"), help="Vertex AI location")
+    args = ap.parse_args()
+
+    if not args.project:
+        raise SystemExit("Не задан project. Передайте --project или установите переменную GOOGLE_CLOUD_PROJECT.")
+
+    images = [args.source] if Path(args.source).is_file() and Path(args.source).suffix.lower() in cg.IMAGE_EXTS \
+        else cg.collect_images(args.source)
+    if not images:
+        raise SystemExit(f"В источнике нет изображений: {args.source}")
+
+    client = cg.make_client(args.project, args.location)
+    store = None if args.no_store else cg.ResultsStore(args.store)
+    archiver = BackgroundArchiver(args.archive, profile=args.archive_profile) if args.archive else None
+
+    rows: List[Dict[str, float]] = []
+    errors = 0
+    t0 = time.perf_counter()
+    for path in images:
+        try:
+            result, dbg, saved_to, timings = run_pipeline(
+                path, client, max_edge=args.max_edge, remove_background=not args.no_remove_bg,
+                upload_format=args.upload_format, quality=args.quality, archiver=archiver, store=store,
+                proxy_edge=args.proxy_edge)
+        except Exception as e:
+            errors += 1
+            print(f"[error] {path}: {e}", file=sys.stderr)
+            continue
+        rows.append(timings)
+        stages = "  ".join(f"{k}={v:.3f}" for k, v in timings.items())
+        print(f"{result['coarse_category']}/{result['fine_category']}  {path} -> {saved_to}\n    {stages}")
+    wall = time.perf_counter() - t0
+
+    archive_wait = 0.0
+    if archiver is not None:
+        ta = time.perf_counter()
+        errors += archiver.close()
+        archive_wait = time.perf_counter() - ta
+
+    print_timings(rows)
+    print(f"\nimages: {len(images)}  ok: {len(rows)}  errors: {errors}  wall: {wall:.3f}s")
+    if archiver is not None:
+        print(f"archive (в фоне): {archiver.seconds:.3f}s, ожидание после последней картинки: "
+              f"{archive_wait:.3f}s -> {args.archive}")
+    sys.exit(1 if errors else 0)
+
+if __name__ == "__main__":
+    main()
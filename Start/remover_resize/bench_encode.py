@@ -0,0 +1,90 @@
+# bench_encode.py
+# pip install pillow
+"""
+Бенчмарк профилей сохранения (OUTPUT_PROFILES): время encode и размер файла.
+
+Картинки корпуса доводятся до того вида, в каком их сохраняет remove_bg
+(crop + flatten + downscale до --max-edge), потом каждая кодируется всеми профилями
+в память. Сегментация не запускается — меряем только кодирование.
+
+    python bench_encode.py results/
+    python bench_encode.py "../Vertex AI test" --profiles archive,png-fast,webp,jpeg --quality 85
+"""
+
+from io import BytesIO
+from pathlib import Path
+from typing import Dict, List
+import argparse
+import time
+
+from PIL import Image, ImageOps
+
+from remover_resize import LOSSY_PROFILES, OUTPUT_PROFILES, encode, postprocess
+
+IMAGE_EXTS = {".jpg", ".jpeg", ".png", ".webp", ".avif", ".bmp", ".gif", ".tif", ".tiff"}
+
+
+def load_corpus(source: Path, max_edge: int, limit: int) -> List[Image.Image]:
+    files = sorted(p for p in source.iterdir() if p.suffix.lower() in IMAGE_EXTS) if source.is_dir() else [source]
+    images = []
+    for f in files:
+        try:
+            im = ImageOps.exif_transpose(Image.open(BytesIO(f.read_bytes())))
+            im.load()
+        except OSError as e:
+            print(f"[skip] {f.name}: {e}")
+            continue
+        images.append(postprocess(im, max_edge=max_edge))
+        if limit and len(images) >= limit:
+            break
+    return images
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Encode time and size for each output profile of remover_resize.")
+    parser.add_argument("source", type=Path, help="Directory with sample images (or one image)")
+    parser.add_argument("--profiles", default=",".join(OUTPUT_PROFILES),
+                        help=f"Comma-separated profiles (default: all: {', '.join(OUTPUT_PROFILES)})")
+    parser.add_argument("--quality", type=int, default=None, help="Quality for lossy profiles (default: profile's own)")
+    parser.add_argument("--max-edge", type=int, default=1536, help="Downscale like remove_bg does (default: 1536)")
+    parser.add_argument("--repeat", type=int, default=1, help="Encode each image N times, best time is kept")
+    parser.add_argument("--limit", type=int, default=0, help="Use only the first N images (0 = all)")
+    args = parser.parse_args()
+
+    profiles = [p.strip() for p in args.profiles.split(",") if p.strip()]
+    unknown = [p for p in profiles if p not in OUTPUT_PROFILES]
+    if unknown:
+        raise SystemExit(f"Unknown profiles: {', '.join(unknown)}. Known: {', '.join(OUTPUT_PROFILES)}")
+
+    images = load_corpus(args.source, args.max_edge, args.limit)
+    if not images:
+        raise SystemExit(f"No images in {args.source}")
+    mpx = sum(im.width * im.height for im in images) / 1e6
+
+    rows: Dict[str, Dict[str, float]] = {}
+    for profile in profiles:
+        seconds = 0.0
+        size = 0
+        for im in images:
+            best = float("inf")
+            for _ in range(max(1, args.repeat)):
+                t = time.perf_counter()
+                data = encode(im, profile, quality=args.quality)
+                best = min(best, time.perf_counter() - t)
+            seconds += best
+            size += len(data)
+        rows[profile] = {"seconds": seconds, "bytes": size}
+
+    base = rows.get("archive")
+    print(f"\nimages: {len(images)}  ({mpx:.1f} MP total, max edge {args.max_edge})")
+    print(f"{'profile':14s} {'lossy':>5s} {'ms/img':>8s} {'MP/s':>7s} {'KB/img':>8s} {'size vs archive':>16s} {'time vs archive':>16s}")
+    for profile, r in rows.items():
+        n = len(images)
+        rel_size = f"{r['bytes'] / base['bytes']:.2f}x" if base else "-"
+        rel_time = f"{r['seconds'] / base['seconds']:.3f}x" if base and base["seconds"] else "-"
+        print(f"{profile:14s} {'yes' if profile in LOSSY_PROFILES else 'no':>5s} {1000 * r['seconds'] / n:>8.1f} "
+              f"{mpx / r['seconds']:>7.1f} {r['bytes'] / n / 1024:>8.1f} {rel_size:>16s} {rel_time:>16s}")
+
+
+if __name__ == "__main__":
+    main()
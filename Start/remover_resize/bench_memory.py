@@ -0,0 +1,180 @@
+# bench_memory.py
+# pip install backgroundremover pillow numpy
+"""
+Пик памяти на картинку: обычный путь remove_bg (segment + postprocess) против --mem-budget-mb (segment_bounded).
+
+Каждый режим — в отдельном процессе с уже загруженной моделью; перед каждой картинкой VmHWM
+сбрасывается (/proc/self/clear_refs), так что «peak MB» — пик RSS процесса именно на этой картинке.
+Для bounded дополнительно: масштаб декода, degraded (итог меньше max_edge ради бюджета) и
+максимальное расхождение пикселей с обычным путём (если размеры совпали).
+
+    python bench_memory.py photos/ --budget-mb 800
+    python bench_memory.py --synthetic 12,48 --budget-mb 700 --enforce     # проверка бюджета, код выхода 1
+    python bench_memory.py --synthetic 48 --budget-mb 300 --enforce --stub-model   # то же без torch и весов
+
+--enforce: падать, если пик любой картинки в bounded-режиме выше --budget-mb
+(MemoryBudgetError — не провал: режим честно отказался, а не съел память).
+--stub-model: вместо сети — синтетическая маска (эллипс) того же размера, что отдаёт detect.predict;
+проверяется только bounded-режим (декод, полосы, crop) — для CI без модели.
+"""
+
+from concurrent.futures import ProcessPoolExecutor
+from io import BytesIO
+from pathlib import Path
+from typing import Dict, List, Optional
+import argparse
+import sys
+import tempfile
+import time
+
+IMAGE_EXTS = {".jpg", ".jpeg", ".png", ".webp", ".avif", ".bmp", ".gif", ".tif", ".tiff"}
+
+
+def make_synthetic(out_dir: Path, megapixels: List[float]) -> List[str]:
+    """JPEG-«фото» 4:3 нужного размера: вещь (эллипс) на светлом фоне с шумом, чтобы JPEG не был вырожденным."""
+    import numpy as np
+    from PIL import Image, ImageDraw
+
+    paths = []
+    rng = np.random.default_rng(0)
+    for mp in megapixels:
+        w = int((mp * 1e6 * 4 / 3) ** 0.5)
+        h = int(w * 3 / 4)
+        im = Image.new("RGB", (w, h), (235, 235, 230))
+        ImageDraw.Draw(im).ellipse((w // 4, h // 6, 3 * w // 4, 5 * h // 6), fill=(40, 60, 150))
+        noise = Image.fromarray(rng.integers(0, 24, (h // 8, w // 8, 3), dtype=np.uint8)).resize((w, h))
+        im = Image.blend(im, noise, 0.15)
+        path = out_dir / f"synthetic_{mp:g}mp.jpg"
+        im.save(path, quality=92)
+        paths.append(str(path))
+    return paths
+
+
+def _stub_mask(img, model_name: str = "u2net"):
+    """Замена predict_mask для --stub-model: маска-эллипс в разрешении сети, растянутая на кадр."""
+    from PIL import Image, ImageDraw
+
+    mask = Image.new("L", (320, 320), 0)
+    ImageDraw.Draw(mask).ellipse((80, 53, 240, 267), fill=255)
+    return mask.resize(img.size, Image.BILINEAR)
+
+
+def _run_mode(paths: List[str], max_edge: int, budget_mb: Optional[float], model_name: str,
+              stub_model: bool = False) -> Dict:
+    """В отдельном процессе: budget_mb=None — обычный путь, иначе segment_bounded. Итоги — в памяти (PNG-байты)."""
+    import remover_resize
+    from remover_pool import _peak_rss_mb, _reset_peak_rss
+    from remover_resize import (MemoryBudgetError, current_rss_mb, load_model, postprocess, segment,
+                                segment_bounded)
+
+    if stub_model:
+        remover_resize.predict_mask = _stub_mask  # segment_bounded берёт её из модуля
+    else:
+        load_model(model_name)
+    base_rss = current_rss_mb()
+    rows = []
+    for path in paths:
+        reset = _reset_peak_rss()
+        t = time.perf_counter()
+        row = {"path": path, "reset": reset}
+        try:
+            if budget_mb is None:
+                with open(path, "rb") as f:
+                    im = postprocess(segment(f.read(), model_name=model_name), max_edge=max_edge)
+            else:
+                im, info = segment_bounded(path, max_edge=max_edge, mem_budget_mb=budget_mb, model_name=model_name)
+                row.update(info)
+            row["seconds"] = time.perf_counter() - t
+            row["peak_rss_mb"] = _peak_rss_mb()
+            buf = BytesIO()
+            im.save(buf, format="PNG", compress_level=1)
+            row["png"] = buf.getvalue()
+            del im
+        except MemoryBudgetError as e:
+            row.update(seconds=time.perf_counter() - t, peak_rss_mb=_peak_rss_mb(), error=str(e))
+        rows.append(row)
+    return {"base_rss_mb": base_rss, "rows": rows}
+
+
+def _max_diff(a: bytes, b: bytes) -> Optional[int]:
+    import numpy as np
+    from PIL import Image
+
+    ia, ib = Image.open(BytesIO(a)), Image.open(BytesIO(b))
+    if ia.size != ib.size:
+        return None
+    return int(np.abs(np.asarray(ia, dtype=np.int16) - np.asarray(ib, dtype=np.int16)).max())
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Per-image peak RSS: default remove_bg path vs --mem-budget-mb.")
+    parser.add_argument("source", type=Path, nargs="?", help="Directory with photos (or one photo)")
+    parser.add_argument("--synthetic", metavar="MP_LIST", help="Generate JPEGs of these megapixels, e.g. 12,48")
+    parser.add_argument("--budget-mb", type=float, required=True, help="Peak RSS budget for the bounded mode, MB")
+    parser.add_argument("--max-edge", type=int, default=1536, help="Output max edge, as in remove_bg (default: 1536)")
+    parser.add_argument("--model", default="u2net", choices=["u2net", "u2netp", "u2net_human_seg"])
+    parser.add_argument("--skip-default", action="store_true", help="Run only the bounded mode (default path may OOM)")
+    parser.add_argument("--enforce", action="store_true", help="Exit 1 if any bounded image peaks above --budget-mb")
+    parser.add_argument("--stub-model", action="store_true",
+                        help="Synthetic mask instead of the network: no torch/weights needed; bounded mode only")
+    args = parser.parse_args()
+    if args.source is None and not args.synthetic:
+        parser.error("give a source directory or --synthetic")
+    if args.stub_model:
+        args.skip_default = True  # обычный путь (segment) без backgroundremover не работает
+
+    with tempfile.TemporaryDirectory(prefix="bench_memory_") as tmp:
+        paths = []
+        if args.source is not None:
+            src = args.source
+            paths += [str(p) for p in (sorted(src.iterdir()) if src.is_dir() else [src])
+                      if p.suffix.lower() in IMAGE_EXTS]
+        if args.synthetic:
+            print("-> generating synthetic photos ...", file=sys.stderr)
+            paths += make_synthetic(Path(tmp), [float(x) for x in args.synthetic.split(",") if x.strip()])
+        if not paths:
+            raise SystemExit("No images")
+
+        runs = {}
+        for name, budget in ([] if args.skip_default else [("default", None)]) + [("bounded", args.budget_mb)]:
+            print(f"-> {name} ...", file=sys.stderr)
+            with ProcessPoolExecutor(max_workers=1) as pool:  # новый процесс на режим
+                runs[name] = pool.submit(_run_mode, paths, args.max_edge, budget, args.model, args.stub_model).result()
+
+    from PIL import Image
+
+    if not all(r["reset"] for run in runs.values() for r in run["rows"]):
+        print("[warn] /proc/self/clear_refs unavailable: peak is per process, not per image", file=sys.stderr)
+
+    print(f"\nbudget: {args.budget_mb:.0f} MB  max edge: {args.max_edge}  "
+          + "  ".join(f"{n} base RSS: {r['base_rss_mb']:.0f} MB" for n, r in runs.items()
+                      if r["base_rss_mb"] is not None))
+    print(f"{'image':28s} {'mode':8s} {'peak MB':>8s} {'s':>7s} {'decode':>6s} {'out':>11s} {'diff':>5s}  note")
+    over = []
+    for i, path in enumerate(paths):
+        ref = runs.get("default", {}).get("rows", [None] * len(paths))[i]
+        for name, run in runs.items():
+            r = run["rows"][i]
+            out = diff = "-"
+            if "png" in r:
+                out = "x".join(map(str, Image.open(BytesIO(r["png"])).size))
+                if name == "bounded" and ref is not None and "png" in ref:
+                    d = _max_diff(ref["png"], r["png"])
+                    diff = "size" if d is None else str(d)
+            decode = f"1/{round(1 / r['decode_scale'])}" if "decode_scale" in r else "-"
+            note = r.get("error", "degraded" if r.get("degraded") else "")
+            if name == "bounded" and "error" not in r and r["peak_rss_mb"] > args.budget_mb:
+                over.append(Path(path).name)
+                note = (note + " OVER BUDGET").strip()
+            print(f"{Path(path).name[:28]:28s} {name:8s} {r['peak_rss_mb']:>8.0f} {r['seconds']:>7.2f} {decode:>6s} "
+                  f"{out:>11s} {diff:>5s}  {note}")
+
+    if args.enforce and over:
+        print(f"\nFAILED: {len(over)} image(s) over {args.budget_mb:.0f} MB: {', '.join(over)}")
+        sys.exit(1)
+    if args.enforce:
+        print(f"\nOK: every bounded image peaked within {args.budget_mb:.0f} MB or was refused (MemoryBudgetError)")
+
+
+if __name__ == "__main__":
+    main()
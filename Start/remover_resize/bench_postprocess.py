@@ -0,0 +1,91 @@
+# bench_postprocess.py
+# pip install pillow numpy
+"""
+Микро-бенчмарк пост-обработки после удаления фона: crop + flatten (+ downscale)
+на синтетическом RGBA 12 MP и 48 MP (вещь-эллипс с мягким краем на прозрачном поле).
+
+Сравниваем:
+    pil    crop_to_content -> flatten_alpha (как было)
+    numpy  crop_and_flatten_np
+и проверяем, что результат совпадает байт в байт.
+
+    python bench_postprocess.py
+    python bench_postprocess.py --sizes 12,48 --repeat 5 --max-edge 1536
+"""
+
+from typing import Callable, List
+import argparse
+import sys
+import time
+
+import numpy as np
+from PIL import Image
+
+from remover_resize import crop_and_flatten_np, crop_to_content, downscale_pil_to_max_edge, flatten_alpha
+
+SIZES = {12: (4000, 3000), 48: (8000, 6000)}
+
+
+def synthetic_cutout(w: int, h: int, seed: int = 0) -> Image.Image:
+    """RGBA как после segment(): шум внутри эллипса, альфа 0 снаружи и плавный переход на краю."""
+    rng = np.random.default_rng(seed)
+    yy, xx = np.ogrid[:h, :w]
+    # эллипс ~60% кадра, смещён от центра, чтобы crop что-то отрезал со всех сторон по-разному
+    d = ((xx - 0.45 * w) / (0.3 * w)) ** 2 + ((yy - 0.55 * h) / (0.35 * h)) ** 2
+    alpha = np.clip((1.0 - d) * 40.0, 0, 1) * 255
+    rgba = np.empty((h, w, 4), dtype=np.uint8)
+    rgba[..., :3] = rng.integers(0, 256, size=(h, w, 3), dtype=np.uint8)
+    rgba[..., 3] = alpha.astype(np.uint8)
+    return Image.fromarray(rgba, "RGBA")
+
+
+def _pil(im: Image.Image) -> Image.Image:
+    return flatten_alpha(crop_to_content(im, alpha_threshold=0))
+
+
+def _numpy(im: Image.Image) -> Image.Image:
+    return crop_and_flatten_np(im, alpha_threshold=0)
+
+
+def _best_of(fn: Callable[[], Image.Image], repeat: int) -> float:
+    best = float("inf")
+    for _ in range(repeat):
+        t = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - t)
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser(description="crop/flatten: PIL vs NumPy on synthetic 12/48 MP cutouts.")
+    parser.add_argument("--sizes", default="12,48", help="Megapixels, comma-separated (known: 12, 48)")
+    parser.add_argument("--repeat", type=int, default=3, help="Runs per variant, best time is reported (default: 3)")
+    parser.add_argument("--max-edge", type=int, default=1536, help="Also time downscale after crop+flatten")
+    args = parser.parse_args()
+
+    sizes: List[int] = [int(x) for x in args.sizes.split(",") if x.strip()]
+    print(f"{'MP':>3s} {'size':>10s} {'pil ms':>8s} {'numpy ms':>9s} {'speedup':>7s} {'+down ms':>9s}  same")
+    mismatches = 0
+    for mp in sizes:
+        if mp not in SIZES:
+            raise SystemExit(f"Unknown size {mp} MP, known: {sorted(SIZES)}")
+        w, h = SIZES[mp]
+        im = synthetic_cutout(w, h)
+
+        ref, out = _pil(im), _numpy(im)
+        same = ref.size == out.size and ref.tobytes() == out.tobytes()
+        mismatches += not same
+
+        t_pil = _best_of(lambda: _pil(im), args.repeat)
+        t_np = _best_of(lambda: _numpy(im), args.repeat)
+        t_down = _best_of(lambda: downscale_pil_to_max_edge(out, max_edge=args.max_edge), args.repeat)
+        print(f"{mp:>3d} {w}x{h:<5d} {1000 * t_pil:>8.1f} {1000 * t_np:>9.1f} {t_pil / t_np:>6.1f}x "
+              f"{1000 * t_down:>9.1f}  {'yes' if same else 'NO'}")
+
+    if mismatches:
+        print("❌ NumPy path differs from PIL", file=sys.stderr)
+        raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    main()
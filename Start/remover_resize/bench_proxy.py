@@ -0,0 +1,122 @@
+# bench_proxy.py
+# pip install backgroundremover pillow numpy
+"""
+Бенчмарк сегментации по уменьшенной копии (segment_proxy) против full-res (segment).
+
+Каждый режим запускается в отдельном процессе, чтобы пик RSS был честным:
+    full        segment() + postprocess()        — как сейчас
+    proxy@E     segment_proxy(proxy_edge=E) + postprocess()
+Для каждого режима: латентность на картинку, пик RSS сверх уже загруженной модели
+и качество маски — IoU бинарной маски (>127) на полном кадре против маски full-res пути.
+
+    python bench_proxy.py "../Vertex AI test" --proxy-edges 320,640,1024 --max-edge 1536
+"""
+
+from concurrent.futures import ProcessPoolExecutor
+from io import BytesIO
+from pathlib import Path
+from typing import Dict, List
+import argparse
+import tempfile
+import time
+
+IMAGE_EXTS = {".jpg", ".jpeg", ".png", ".webp", ".avif", ".bmp", ".gif", ".tif", ".tiff"}
+
+
+def _full_mask(mask, size):
+    """Маска сети, растянутая на кадр так же, как в naive_cutout, и бинаризованная (bool np.ndarray)."""
+    import numpy as np
+    from PIL import Image
+    return np.asarray(mask.resize(size, Image.LANCZOS)) > 127
+
+
+def _run_mode(edge: int, paths: List[str], max_edge: int, model_name: str, out_dir: str) -> Dict:
+    """В отдельном процессе: edge=0 — full-res, иначе proxy. Маски для IoU — в out_dir."""
+    import numpy as np
+    from PIL import Image, ImageOps
+    from remover_pool import _peak_rss_mb
+    from remover_resize import load_model, postprocess, predict_mask, segment, segment_proxy
+
+    load_model(model_name)
+    base_rss = _peak_rss_mb()
+    seconds = []
+    for i, path in enumerate(paths):
+        img_bytes = Path(path).read_bytes()
+        t = time.perf_counter()
+        if edge:
+            im = segment_proxy(img_bytes, model_name=model_name, proxy_edge=edge, max_edge=max_edge)
+        else:
+            im = segment(img_bytes, model_name=model_name)
+        postprocess(im, max_edge=max_edge)
+        seconds.append(time.perf_counter() - t)
+
+        # Маска для IoU (вне замера времени)
+        img = ImageOps.exif_transpose(Image.open(BytesIO(img_bytes))).convert("RGB")
+        src = img
+        if edge:
+            src = img.copy()
+            src.thumbnail((edge, edge), Image.BILINEAR)
+        mask = _full_mask(predict_mask(src, model_name), img.size)
+        np.save(Path(out_dir) / f"{edge}_{i}.npy", np.packbits(mask), allow_pickle=False)
+        np.save(Path(out_dir) / f"{edge}_{i}.shape.npy", np.array(mask.shape), allow_pickle=False)
+    return {"edge": edge, "seconds": seconds, "peak_rss_mb": _peak_rss_mb(), "base_rss_mb": base_rss}
+
+
+def _load_mask(out_dir: Path, edge: int, i: int):
+    import numpy as np
+    shape = tuple(np.load(out_dir / f"{edge}_{i}.shape.npy"))
+    bits = np.load(out_dir / f"{edge}_{i}.npy")
+    return np.unpackbits(bits, count=shape[0] * shape[1]).reshape(shape).astype(bool)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Full-res vs proxy segmentation: latency, peak RSS, mask IoU.")
+    parser.add_argument("source", type=Path, help="Directory with sample photos")
+    parser.add_argument("--proxy-edges", default="320,640,1024", help="Proxy long edges to try (default: 320,640,1024)")
+    parser.add_argument("--max-edge", type=int, default=1536, help="Output max edge, as in remove_bg (default: 1536)")
+    parser.add_argument("--model", default="u2net", choices=["u2net", "u2netp", "u2net_human_seg"])
+    parser.add_argument("--limit", type=int, default=0, help="Use only the first N images (0 = all)")
+    args = parser.parse_args()
+
+    from PIL import Image
+    paths = []
+    for p in sorted(args.source.iterdir()) if args.source.is_dir() else [args.source]:
+        if p.suffix.lower() not in IMAGE_EXTS:
+            continue
+        try:
+            Image.open(p).verify()
+        except Exception as e:
+            print(f"[skip] {p.name}: {e}")
+            continue
+        paths.append(str(p))
+        if args.limit and len(paths) >= args.limit:
+            break
+    if not paths:
+        raise SystemExit(f"No images in {args.source}")
+
+    edges = [0] + [int(x) for x in args.proxy_edges.split(",") if x.strip()]
+    with tempfile.TemporaryDirectory(prefix="bench_proxy_") as tmp:
+        runs = []
+        for edge in edges:
+            print(f"-> {'full' if edge == 0 else f'proxy@{edge}'} ...")
+            with ProcessPoolExecutor(max_workers=1) as pool:  # новый процесс — свой пик RSS
+                runs.append(pool.submit(_run_mode, edge, paths, args.max_edge, args.model, tmp).result())
+
+        tmp_dir = Path(tmp)
+        print(f"\nimages: {len(paths)}  max edge: {args.max_edge}")
+        print(f"{'mode':11s} {'avg s':>7s} {'max s':>7s} {'speedup':>7s} {'RSS +MB':>8s} {'IoU avg':>8s} {'IoU min':>8s}")
+        base_avg = sum(runs[0]["seconds"]) / len(paths)
+        for r in runs:
+            avg = sum(r["seconds"]) / len(paths)
+            ious = []
+            for i in range(len(paths)):
+                ref, m = _load_mask(tmp_dir, 0, i), _load_mask(tmp_dir, r["edge"], i)
+                union = (ref | m).sum()
+                ious.append((ref & m).sum() / union if union else 1.0)
+            name = "full" if r["edge"] == 0 else f"proxy@{r['edge']}"
+            print(f"{name:11s} {avg:>7.3f} {max(r['seconds']):>7.3f} {base_avg / avg:>6.1f}x "
+                  f"{r['peak_rss_mb'] - r['base_rss_mb']:>8.0f} {sum(ious) / len(ious):>8.4f} {min(ious):>8.4f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,219 @@
+# manifest.py
+"""
+Инкрементальный режим remover_resize.py / back-remove/remover.py: манифест обработанных картинок.
+
+На каждый вход манифест помнит size + mtime, sha256 содержимого, ключ параметров обработки
+(max_edge, фон, профиль, quality, proxy_edge, raw, модель) и путь результата.
+Картинка уходит в работу, только если она новая, изменилась, параметры другие или результат удалён.
+
+Проверка «ничего не поменялось» — один stat входа и один stat результата, без чтения файла:
+sha256 считается, только когда size/mtime разошлись (touch, копирование — содержимое то же,
+перерабатывать не надо). Поэтому повторный прогон по папке в 10k фото занимает секунды.
+
+    python remover_resize.py photos/ --incremental
+    python remover_resize.py photos/ --watch               # опрос папки, новые файлы — по мере появления
+    python ../back-remove/remover.py photos/ --incremental
+
+Манифест — JSON рядом с результатами (results/.manifest.json), пишется атомарно (tmp + os.replace)
+каждые flush_every записей и в конце прогона — прерванный прогон не теряет сделанное.
+"""
+
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional, Tuple
+import hashlib
+import json
+import os
+import sys
+import time
+
+DEFAULT_MANIFEST_PATH = Path("results") / ".manifest.json"
+MANIFEST_VERSION = 1
+
+
+def params_key(params: Dict[str, Any]) -> str:
+    """Ключ набора параметров: поменялся любой — результат уже не тот."""
+    return hashlib.sha256(json.dumps(params, sort_keys=True, default=str).encode("utf-8")).hexdigest()[:16]
+
+
+def file_hash(path: str, chunk_size: int = 1 << 20) -> str:
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(chunk_size), b""):
+            h.update(block)
+    return h.hexdigest()
+
+
+class Manifest:
+    """
+    Манифест одного набора параметров. Ключ записи — абсолютный путь входа.
+    Не потокобезопасен: pending/done/fail зовутся из основного потока (run / run_via_service).
+    """
+
+    def __init__(self, path: Path = DEFAULT_MANIFEST_PATH, params: Optional[Dict[str, Any]] = None,
+                 flush_every: int = 200):
+        self.path = Path(path)
+        self.params = dict(params or {})
+        self.key = params_key(self.params)
+        self.flush_every = flush_every
+        self._entries: Dict[str, Dict[str, Any]] = self._load()
+        self._planned: Dict[str, Tuple[int, int]] = {}  # path -> (size, mtime_ns) на момент pending()
+        self._failed: Dict[str, Tuple[int, int]] = {}   # упавшие: не повторять, пока файл не поменяется
+        self._dirty = 0
+        self.last_counts: Dict[str, int] = {}
+
+    def _load(self) -> Dict[str, Dict[str, Any]]:
+        try:
+            data = json.loads(self.path.read_text(encoding="utf-8"))
+        except FileNotFoundError:
+            return {}
+        except (OSError, ValueError) as e:
+            print(f"[manifest] {self.path} не читается ({e}) — начинаем с пустого", file=sys.stderr)
+            return {}
+        if data.get("version") != MANIFEST_VERSION:
+            return {}
+        return data.get("entries", {})
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    @staticmethod
+    def _fingerprint(path: str) -> Tuple[int, int]:
+        st = os.stat(path)
+        return st.st_size, st.st_mtime_ns
+
+    def _reason(self, key: str, fp: Tuple[int, int]) -> Optional[str]:
+        """Почему вход надо обработать (new / params / missing_output / changed) или None — результат актуален."""
+        entry = self._entries.get(key)
+        if entry is None:
+            return "new"
+        if entry.get("params") != self.key:
+            return "params"
+        if not os.path.exists(entry.get("output", "")):
+            return "missing_output"
+        if (entry["size"], entry["mtime_ns"]) == fp:
+            return None
+        # size/mtime разошлись — сверяем содержимое
+        if entry["size"] == fp[0] and entry.get("sha256") == file_hash(key):
+            entry["mtime_ns"] = fp[1]  # touch/копия: запоминаем новый mtime, чтобы не хэшировать снова
+            self._touch()
+            return None
+        return "changed"
+
+    def pending(self, paths: List[str]) -> List[str]:
+        """
+        Входы, которые надо (пере)обработать, в исходном порядке.
+        Счётчики по причинам (и unchanged) — в self.last_counts.
+        """
+        counts: Dict[str, int] = {"unchanged": 0}
+        todo = []
+        for p in paths:
+            key = os.path.abspath(p)
+            try:
+                fp = self._fingerprint(key)
+            except FileNotFoundError:
+                continue  # удалили между листингом и stat
+            if self._failed.get(key) == fp:
+                counts["failed_before"] = counts.get("failed_before", 0) + 1
+                continue
+            reason = self._reason(key, fp)
+            if reason is None:
+                counts["unchanged"] += 1
+                continue
+            counts[reason] = counts.get(reason, 0) + 1
+            self._planned[key] = fp
+            todo.append(p)
+        self.last_counts = counts
+        return todo
+
+    def planned(self, path: str) -> Optional[Tuple[int, int]]:
+        """(size, mtime_ns), с которыми path попал в последний pending()."""
+        return self._planned.get(os.path.abspath(path))
+
+    def done(self, path: str, output: str) -> None:
+        """Результат для path записан в output. Если вход поменялся, пока шла обработка, — не запоминаем."""
+        key = os.path.abspath(path)
+        planned = self._planned.pop(key, None)
+        try:
+            fp = self._fingerprint(key)
+        except FileNotFoundError:
+            return
+        if planned is not None and planned != fp:
+            return  # следующий прогон переработает
+        self._failed.pop(key, None)
+        self._entries[key] = {
+            "size": fp[0], "mtime_ns": fp[1], "sha256": file_hash(key),
+            "params": self.key, "output": os.path.abspath(output), "processed_at": time.time(),
+        }
+        self._touch()
+
+    def fail(self, path: str) -> None:
+        key = os.path.abspath(path)
+        fp = self._planned.pop(key, None)
+        if fp is not None:
+            self._failed[key] = fp
+
+    def _touch(self) -> None:
+        self._dirty += 1
+        if self.flush_every and self._dirty >= self.flush_every:
+            self.save()
+
+    def save(self) -> None:
+        if not self._dirty:
+            return
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = self.path.with_name(self.path.name + ".tmp")
+        tmp.write_text(json.dumps({"version": MANIFEST_VERSION, "entries": self._entries}, ensure_ascii=False), encoding="utf-8")
+        os.replace(tmp, self.path)
+        self._dirty = 0
+
+    def describe(self) -> str:
+        c = self.last_counts
+        parts = [f"{n} {reason}" for reason, n in sorted(c.items()) if n and reason != "unchanged"]
+        return f"manifest: {c.get('unchanged', 0)} unchanged" + (", " + ", ".join(parts) if parts else "")
+
+
+def run_incremental(list_paths: Callable[[], List[str]], manifest: Manifest,
+                    process: Callable[[List[str]], Dict]) -> Dict:
+    """
+    Один проход: отсеять по манифесту, обработать остальное через process (run / run_via_service
+    с manifest=...), сохранить манифест. Возвращает сводку process (или пустую, если делать нечего).
+    """
+    t0 = time.perf_counter()
+    todo = manifest.pending(list_paths())
+    print(f"{manifest.describe()}  ->  {len(todo)} to process  ({time.perf_counter() - t0:.2f}s)", flush=True)
+    summary = {"ok": 0, "errors": 0, "wall": 0.0, "images_per_sec": 0.0}
+    try:
+        if todo:
+            summary = process(todo)
+    finally:
+        manifest.save()
+    return summary
+
+
+def watch(list_paths: Callable[[], List[str]], manifest: Manifest, process: Callable[[List[str]], Dict],
+          interval: float = 2.0) -> None:
+    """
+    Опрос источника раз в interval секунд до Ctrl+C (без inotify-зависимостей: неизменённые файлы
+    манифест отсекает по stat, так что опрос дешёвый и на больших папках).
+    Файл берётся в работу, когда его size/mtime не поменялись между двумя опросами — значит, докопирован.
+    Упавшие файлы не повторяются, пока их не перезапишут.
+    """
+    seen: Dict[str, Tuple[int, int]] = {}
+    print(f"watching every {interval:g}s, Ctrl+C to stop", flush=True)
+    try:
+        while True:
+            ready, current = [], {}
+            for p in manifest.pending(list_paths()):
+                fp = manifest.planned(p)
+                current[p] = fp
+                if seen.get(p) == fp:
+                    ready.append(p)
+            seen = current
+            if ready:
+                process(ready)
+                manifest.save()
+            time.sleep(interval)
+    except KeyboardInterrupt:
+        print("\nstopped", flush=True)
+    finally:
+        manifest.save()
@@ -0,0 +1,227 @@
+# remover_pool.py
+# pip install backgroundremover pillow
+"""
+Пакетное удаление фона пулом процессов.
+
+Каждый процесс-воркер один раз импортирует torch и загружает модель (initializer),
+дальше только segment() на картинку. Картинки раздаются по воркерам, результат
+печатается сразу, как готов (не в порядке входа).
+
+    python remover_pool.py photos/                     # папка
+    find photos -name '*.jpg' | python remover_pool.py -   # список путей со stdin
+    python remover_pool.py photos/ --raw               # как back-remove/remover.py: RGBA без crop/resize
+    python remover_pool.py photos/ --bench 1,2,4       # images/sec и пик RSS на 1, 2, 4 и N воркерах
+"""
+
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from pathlib import Path
+from typing import Dict, Iterator, List, Optional
+import argparse
+import os
+import sys
+import time
+
+from remover_resize import OUTPUT_PROFILES
+
+IMAGE_EXTS = {".jpg", ".jpeg", ".png", ".webp", ".avif", ".bmp", ".gif", ".tif", ".tiff"}
+
+
+def _peak_rss_mb() -> float:
+    """
+    Пик RSS текущего процесса, МБ: VmHWM из /proc (сбрасывается _reset_peak_rss — пик на картинку),
+    без /proc — ru_maxrss за всю жизнь процесса (Linux — КБ, macOS — байты).
+    """
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith("VmHWM:"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    import resource
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+
+
+def _reset_peak_rss() -> bool:
+    """Сбросить VmHWM до текущего RSS (Linux 4.0+), чтобы _peak_rss_mb() мерил пик одной картинки."""
+    try:
+        with open("/proc/self/clear_refs", "w") as f:
+            f.write("5")
+        return True
+    except OSError:
+        return False
+
+
+def _init_worker(model_name: str, torch_threads: int) -> None:
+    """Один раз на процесс: torch, число потоков на воркер, модель."""
+    import torch
+    torch.set_num_threads(torch_threads)  # иначе N воркеров x все ядра = переподписка CPU
+    from remover_resize import load_model
+    load_model(model_name)
+
+
+def _work(input_path: str, out_dir: str, max_edge: int, raw: bool, model_name: str,
+          profile: str, quality: Optional[int], proxy_edge: int, mem_budget_mb: Optional[float] = None) -> Dict:
+    from remover_resize import output_path, postprocess, save_output, segment, segment_bounded, segment_proxy
+
+    t = time.perf_counter()
+    bounded = None
+    if mem_budget_mb:
+        _reset_peak_rss()
+    try:
+        if mem_budget_mb and not raw:
+            # Файл читается с диска по мере декода, без img_bytes целиком; crop/flatten/downscale уже внутри
+            im, bounded = segment_bounded(input_path, max_edge=max_edge, mem_budget_mb=mem_budget_mb,
+                                          model_name=model_name, proxy_edge=proxy_edge or 640)
+            out = output_path(input_path, Path(out_dir), profile=profile)
+            save_output(im, out, profile=profile, quality=quality)
+        else:
+            with open(input_path, "rb") as f:
+                img_bytes = f.read()
+            if proxy_edge:
+                im = segment_proxy(img_bytes, model_name=model_name, proxy_edge=proxy_edge,
+                                   max_edge=None if raw else max_edge)
+            else:
+                im = segment(img_bytes, model_name=model_name)
+            if raw:
+                out = output_path(input_path, Path(out_dir))
+                out.parent.mkdir(parents=True, exist_ok=True)
+                im.save(out, format="PNG")
+            else:
+                out = output_path(input_path, Path(out_dir), profile=profile)
+                save_output(postprocess(im, max_edge=max_edge), out, profile=profile, quality=quality)
+        result = {"saved_to": str(out)}
+        if bounded is not None:
+            result["bounded"] = bounded
+    except Exception as e:
+        result = {"error": f"{type(e).__name__}: {e}"}
+    result.update(path=input_path, seconds=round(time.perf_counter() - t, 3),
+                  pid=os.getpid(), peak_rss_mb=round(_peak_rss_mb(), 1))
+    return result
+
+
+def iter_remove_bg(paths: List[str], workers: Optional[int] = None, out_dir: Path = Path("results"),
+                   max_edge: int = 1536, raw: bool = False, model_name: str = "u2net",
+                   profile: str = "archive", quality: Optional[int] = None,
+                   proxy_edge: int = 0, inline: bool = False, mem_budget_mb: Optional[float] = None) -> Iterator[Dict]:
+    """
+    Удаляет фон у всех paths пулом из `workers` процессов (по умолчанию — число ядер).
+    Отдаёт dict на картинку по мере готовности: path, saved_to или error, seconds, pid, peak_rss_mb.
+    inline=True — в текущем процессе по очереди, модель остаётся загруженной между вызовами
+    (watch-режим: файлы приходят по одному, поднимать пул на каждый — дороже самой работы).
+    mem_budget_mb — пик RSS на воркер (segment_bounded); peak_rss_mb тогда — пик этой картинки.
+    """
+    if inline:
+        from remover_resize import load_model
+        load_model(model_name)
+        for p in paths:
+            yield _work(p, str(out_dir), max_edge, raw, model_name, profile, quality, proxy_edge, mem_budget_mb)
+        return
+    workers = max(1, workers or os.cpu_count() or 1)
+    torch_threads = max(1, (os.cpu_count() or 1) // workers)
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker,
+                             initargs=(model_name, torch_threads)) as pool:
+        futures = [pool.submit(_work, p, str(out_dir), max_edge, raw, model_name, profile, quality, proxy_edge,
+                               mem_budget_mb) for p in paths]
+        for fut in as_completed(futures):
+            yield fut.result()
+
+
+def collect_paths(source: str) -> List[str]:
+    """Папка (картинки по расширению) или '-' — список путей со stdin, по одному на строку."""
+    if source == "-":
+        return [line.strip() for line in sys.stdin if line.strip()]
+    src = Path(source)
+    if src.is_dir():
+        return [str(p) for p in sorted(src.iterdir()) if p.suffix.lower() in IMAGE_EXTS]
+    if src.is_file():
+        return [str(src)]
+    raise SystemExit(f"Not found: {source}")
+
+
+def run(paths: List[str], workers: Optional[int], quiet: bool = False, manifest=None, **kwargs) -> Dict:
+    """
+    Прогон с потоковым выводом. Возвращает сводку: images/sec, ошибки, пик RSS по воркерам.
+    manifest (manifest.Manifest) — отмечать в нём готовые и упавшие картинки (инкрементальный режим).
+    """
+    t0 = time.perf_counter()
+    ok = errors = 0
+    rss: Dict[int, float] = {}
+    for r in iter_remove_bg(paths, workers=workers, **kwargs):
+        rss[r["pid"]] = max(rss.get(r["pid"], 0.0), r["peak_rss_mb"])
+        if "error" in r:
+            errors += 1
+            if manifest is not None:
+                manifest.fail(r["path"])
+            print(f"[error] {r['path']}: {r['error']}", file=sys.stderr)
+            continue
+        ok += 1
+        if manifest is not None:
+            manifest.done(r["path"], r["saved_to"])
+        if not quiet:
+            extra = ""
+            if "bounded" in r:  # --mem-budget-mb: пик именно этой картинки и масштаб декода
+                b = r["bounded"]
+                extra = (f", peak {r['peak_rss_mb']:.0f} MB, decode 1/{round(1 / b['decode_scale'])}"
+                         f"{', degraded' if b['degraded'] else ''}")
+            print(f"✅ {r['path']} -> {r['saved_to']}  {r['seconds']}s  (pid {r['pid']}{extra})", flush=True)
+    wall = time.perf_counter() - t0
+    return {"workers": workers or os.cpu_count(), "ok": ok, "errors": errors, "wall": wall,
+            "images_per_sec": ok / wall if wall > 0 else 0.0,
+            "peak_rss_mb_max": max(rss.values(), default=0.0),
+            "peak_rss_mb_avg": sum(rss.values()) / len(rss) if rss else 0.0}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Remove background for many images with a pool of preloaded workers.")
+    parser.add_argument("source", help="Directory with images, a single image, or '-' to read paths from stdin")
+    parser.add_argument("--workers", type=int, default=os.cpu_count(),
+                        help=f"Worker processes, each with its own model (default: CPU cores = {os.cpu_count()})")
+    parser.add_argument("--max-edge", type=int, default=1536,
+                        help="Max size of the long edge in pixels (default: 1536). Ignored with --raw.")
+    parser.add_argument("--raw", action="store_true",
+                        help="Save the RGBA cutout as is (like back-remove/remover.py): no crop/flatten/downscale")
+    parser.add_argument("--profile", choices=list(OUTPUT_PROFILES), default="archive",
+                        help="Output encoding, see remover_resize.OUTPUT_PROFILES (default: archive). Ignored with --raw.")
+    parser.add_argument("--quality", type=int, default=None, help="Quality for lossy profiles (webp, jpeg)")
+    parser.add_argument("--proxy-edge", type=int, default=0,
+                        help="Segment a downscaled copy with this long edge (e.g. 640), see segment_proxy. 0 = off.")
+    parser.add_argument("--model", default="u2net", choices=["u2net", "u2netp", "u2net_human_seg"])
+    parser.add_argument("--mem-budget-mb", type=float, default=None,
+                        help="Peak RSS budget per worker, MB: reduced decode + strip-wise flatten (see segment_bounded). "
+                             "Not with --raw.")
+    parser.add_argument("--out-dir", type=Path, default=Path("results"))
+    parser.add_argument("--bench", metavar="LIST",
+                        help="Benchmark: comma-separated worker counts, e.g. 1,2,4 (N = CPU cores is always added)")
+    args = parser.parse_args()
+    if args.raw and args.mem_budget_mb:
+        parser.error("--mem-budget-mb needs the crop/flatten/downscale path; it does not apply to --raw")
+
+    paths = collect_paths(args.source)
+    if not paths:
+        raise SystemExit(f"No images in {args.source}")
+    kwargs = dict(out_dir=args.out_dir, max_edge=args.max_edge, raw=args.raw, model_name=args.model,
+                  profile=args.profile, quality=args.quality, proxy_edge=args.proxy_edge, mem_budget_mb=args.mem_budget_mb)
+
+    if args.bench:
+        counts = sorted({int(x) for x in args.bench.split(",") if x.strip()} | {os.cpu_count() or 1})
+        rows = []
+        for n in counts:
+            print(f"-> workers={n} ...", file=sys.stderr)
+            rows.append(run(paths, n, quiet=True, **kwargs))
+        print(f"\nimages: {len(paths)}  (время включает старт воркеров и загрузку модели)")
+        print(f"{'workers':>7s} {'ok':>5s} {'err':>4s} {'wall s':>8s} {'img/s':>7s} {'RSS max MB':>10s} {'RSS avg MB':>10s}")
+        for r in rows:
+            print(f"{r['workers']:>7d} {r['ok']:>5d} {r['errors']:>4d} {r['wall']:>8.2f} {r['images_per_sec']:>7.2f} "
+                  f"{r['peak_rss_mb_max']:>10.0f} {r['peak_rss_mb_avg']:>10.0f}")
+        return
+
+    s = run(paths, args.workers, **kwargs)
+    print(f"\nimages: {len(paths)}  ok: {s['ok']}  errors: {s['errors']}  workers: {s['workers']}  "
+          f"wall: {s['wall']:.2f}s  {s['images_per_sec']:.2f} img/s  peak RSS per worker: {s['peak_rss_mb_max']:.0f} MB")
+    sys.exit(1 if s["errors"] else 0)
+
+
+if __name__ == "__main__":
+    main()
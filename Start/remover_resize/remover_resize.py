@@ -1,11 +1,19 @@
 # remover_resize.py
 # pip install backgroundremover pillow
 
-from backgroundremover.bg import remove
 from pathlib import Path
 from io import BytesIO
-from PIL import Image
+from typing import Optional
+from PIL import Image, ImageOps
 import argparse
+import os
+import sys
+
+# Общий декод (draft до нужного размера, EXIF, AVIF/HEIC-плагины) — Start/common/image_loader.py
+COMMON_DIR = Path(__file__).resolve().parent.parent / "common"
+if str(COMMON_DIR) not in sys.path:
+    sys.path.insert(0, str(COMMON_DIR))
+from image_loader import draft_to_edge, load_image, open_image, oriented_size
 
 
 def crop_to_content(im: Image.Image, alpha_threshold: int = 0) -> Image.Image:
@@ -76,59 +84,494 @@ def downscale_pil_to_max_edge(im: Image.Image, max_edge: int = 1536) -> Image.Im
     return im.resize((new_w, new_h), resample=Image.LANCZOS)
 
 
-def remove_bg(input_path: str, max_edge: int = 1536) -> str:
+def crop_and_flatten_np(im: Image.Image, alpha_threshold: int = 0, bg_color=(255, 255, 255)) -> Image.Image:
+    """
+    crop_to_content + flatten_alpha за один проход, результат байт в байт тот же.
+    - bbox: NumPy-максимумы альфы по строкам/столбцам (одна плоскость альфы, без point(lambda) и split());
+    - обрезаем до композитинга — смешиваем только пиксели внутри bbox;
+    - композит: один paste() с самой RGBA-картинкой в роли маски (без split() на 4 канала и лишнего convert).
+      Смешивание в NumPy (uint16) проверяли — в 3–5 раз медленнее C-цикла paste(), см. bench_postprocess.py.
+    """
+    import numpy as np
+
+    if im.mode == "P" and "transparency" in im.info:
+        im = im.convert("RGBA")
+    if im.mode == "LA":
+        im = im.convert("RGBA")
+    if im.mode != "RGBA":
+        # Альфы нет — обрезать нечем, остаётся только привести к RGB
+        return flatten_alpha(im, bg_color=bg_color)
+
+    alpha = np.asarray(im.getchannel("A"))
+    rows = np.flatnonzero(alpha.max(axis=1) > alpha_threshold)
+    if rows.size:
+        cols = np.flatnonzero(alpha.max(axis=0) > alpha_threshold)
+        im = im.crop((int(cols[0]), int(rows[0]), int(cols[-1]) + 1, int(rows[-1]) + 1))
+
+    bg = Image.new("RGB", im.size, bg_color)
+    bg.paste(im, mask=im)
+    return bg
+
+
+_MODELS = {}  # model_name -> загруженная сеть; одна на процесс
+
+
+def load_model(model_name: str = "u2net"):
+    """
+    Загружаем сеть сегментации один раз на процесс.
+    backgroundremover.bg.remove() зовёт detect.load_model() на каждый вызов — здесь этого нет.
+    """
+    if model_name not in _MODELS:
+        # Импорт здесь: тянет torch, а crop/flatten/downscale переиспользуются без него (gemini/classify_garment.py)
+        from backgroundremover.u2net import detect
+        _MODELS[model_name] = detect.load_model(model_name=model_name)
+    return _MODELS[model_name]
+
+
+def predict_mask(img: Image.Image, model_name: str = "u2net") -> Image.Image:
+    """
+    Маска (L) от сети для RGB-картинки. U2Net смотрит на вход 320x320, так что маска —
+    в разрешении сети, растянутая на весь кадр; к размеру картинки её приводит naive_cutout.
+    """
+    import numpy as np
+    from backgroundremover.u2net import detect
+
+    return detect.predict(load_model(model_name), np.array(img)).convert("L")
+
+
+def predict_masks(images, model_name: str = "u2net"):
+    """
+    Маски для нескольких картинок одним прогоном сети (батч).
+    Нормализация — по каждой маске отдельно, как в detect.predict, так что результат тот же, что поштучно.
+    """
+    import numpy as np
+    import torch
+    from backgroundremover.u2net import detect
+
+    net = load_model(model_name)
+    batch = torch.stack([detect.preprocess(np.array(img))["image"] for img in images]).float()
+    if torch.cuda.is_available():
+        batch = batch.cuda()
+    with torch.no_grad():
+        pred = net(batch)[0][:, 0, :, :]
+    masks = []
+    for p in pred:
+        p = (p - p.min()) / (p.max() - p.min())
+        masks.append(Image.fromarray(p.cpu().numpy() * 255).convert("L"))
+    return masks
+
+
+def segment(img_bytes: bytes, model_name: str = "u2net") -> Image.Image:
+    """
+    Удаляем фон: тот же naive_cutout, что в backgroundremover.bg.remove(), но с закэшированной моделью,
+    без промежуточного PNG (encode/decode) — RGBA остаётся в памяти — и с поворотом по EXIF
+    (bg.remove() кадр не поворачивает). Этим путём идут все режимы back-remove/remover.py.
+    """
+    from backgroundremover.bg import naive_cutout
+
+    img = load_image(img_bytes)
+    return naive_cutout(img, predict_mask(img, model_name))
+
+
+def segment_proxy(img_bytes: bytes, model_name: str = "u2net", proxy_edge: int = 640, max_edge=None) -> Image.Image:
+    """
+    Удаление фона через уменьшенную копию (proxy):
+    1) декодируем картинку до ~proxy_edge (для JPEG — draft, полный кадр вообще не раскладывается);
+    2) маска от сети по proxy — сеть всё равно смотрит на 320x320, а full-res путь
+       backgroundremover гоняет через skimage float64-копию всего кадра;
+    3) bbox вещи — по маске; если max_edge задан, итог всё равно будет не больше max_edge,
+       поэтому исходник декодируем только в том масштабе, который нужен вырезанной области;
+    4) маску растягиваем только на эту область и вырезаем как naive_cutout.
+    Возвращает RGBA-вырезку (уже обрезанную по bbox маски) — дальше postprocess().
+    """
+    from backgroundremover.bg import naive_cutout
+
+    src = open_image(img_bytes)
+    full_w, full_h = oriented_size(src)
+    raw_w, raw_h = src.size
+    is_jpeg = src.format == "JPEG"
+
+    # 1–2) proxy и маска. Не-JPEG без draft: декодируем один раз и переиспользуем кадр в шаге 3
+    full = None if is_jpeg else load_image(img_bytes)
+    proxy = full.copy() if full is not None else load_image(img_bytes, max_edge=proxy_edge, exact=False)
+    proxy.thumbnail((proxy_edge, proxy_edge), Image.BILINEAR)
+    mask = predict_mask(proxy, model_name)
+    mw, mh = mask.size
+
+    # 3) bbox в координатах маски (+1 px запаса на размытие при растяжении), затем в долях кадра
+    box = mask.getbbox() or (0, 0, mw, mh)
+    fx0, fy0 = max(0, box[0] - 1) / mw, max(0, box[1] - 1) / mh
+    fx1, fy1 = min(mw, box[2] + 1) / mw, min(mh, box[3] + 1) / mh
+
+    scale = 1.0
+    if max_edge:
+        crop_long = max((fx1 - fx0) * full_w, (fy1 - fy0) * full_h)
+        scale = min(1.0, max_edge / crop_long) if crop_long else 1.0
+    if full is None:
+        # draft до масштаба, в котором длинная сторона не меньше нужной (полный кадр при scale == 1)
+        full = load_image(img_bytes, max_edge=max(1, int(max(raw_w, raw_h) * scale + 0.5)) if scale < 1.0 else None,
+                          exact=False)
+    dw, dh = full.size
+
+    # 4) вырезаем область и растягиваем на неё только соответствующий кусок маски
+    crop_box = (int(fx0 * dw), int(fy0 * dh), max(int(fx0 * dw) + 1, int(fx1 * dw + 0.999)),
+                max(int(fy0 * dh) + 1, int(fy1 * dh + 0.999)))
+    crop = full.crop(crop_box)
+    mask_box = (crop_box[0] * mw / dw, crop_box[1] * mh / dh, crop_box[2] * mw / dw, crop_box[3] * mh / dh)
+    crop_mask = mask.resize(crop.size, Image.LANCZOS, box=mask_box)
+    return naive_cutout(crop, crop_mask)
+
+
+class MemoryBudgetError(RuntimeError):
+    """Картинка не помещается в --mem-budget-mb даже в самом мелком допустимом масштабе декода."""
+
+
+# EXIF Orientation -> transpose, как в ImageOps.exif_transpose, и обратная операция (кадр -> сырые координаты)
+_EXIF_TRANSPOSE = {2: Image.FLIP_LEFT_RIGHT, 3: Image.ROTATE_180, 4: Image.FLIP_TOP_BOTTOM,
+                   5: Image.TRANSPOSE, 6: Image.ROTATE_270, 7: Image.TRANSVERSE, 8: Image.ROTATE_90}
+_EXIF_INVERSE = {**_EXIF_TRANSPOSE, 6: Image.ROTATE_90, 8: Image.ROTATE_270}
+
+
+def current_rss_mb() -> Optional[float]:
+    """Текущий RSS процесса, МБ (/proc/self/statm); без /proc — None: пик ru_maxrss за текущий не выдаём."""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / (1024 * 1024)
+    except (OSError, ValueError, IndexError):
+        return None
+
+
+def _pixel_bytes(mode: str) -> int:
+    """Байт на пиксель в памяти PIL: 3–4 канала хранятся по 4 байта (RGB — как RGBX)."""
+    bands = len(Image.getmodebands(mode))
+    return 4 if bands >= 3 else bands
+
+
+def _bounded_peak_bytes(size, mode: str, crop_frac: float) -> int:
+    """
+    Оценка пика памяти на картинку в segment_bounded: декодированный кадр (+ копия при convert в RGB)
+    и обрезанная по вещи копия. Маска целиком в полном разрешении не живёт — только полосами.
+    """
+    px = size[0] * size[1]
+    decoded = px * (_pixel_bytes(mode) if mode != "RGB" else 0)
+    return decoded + px * 4 + int(px * crop_frac) * 4
+
+
+def segment_bounded(source, max_edge: int = 1536, mem_budget_mb: float = 1024, model_name: str = "u2net",
+                    proxy_edge: int = 640, bg_color=(255, 255, 255), strip_rows: int = 256):
+    """
+    segment_proxy + postprocess с ограничением пика памяти процесса (RSS) mem_budget_mb:
+    1) маска — по proxy, как в segment_proxy (файл читается с диска, img_bytes целиком не держим);
+    2) масштаб декода: JPEG draft 1, 1/2, 1/4, 1/8 — самый мелкий, которого хватает на max_edge;
+       если оценка пика (_bounded_peak_bytes) не влезает в бюджет минус текущий RSS (без /proc — весь бюджет) — ещё мельче
+       (итог тогда меньше max_edge, degraded=True); не влезает и 1/8 (или не-JPEG) — MemoryBudgetError;
+    3) кадр не поворачиваем по EXIF (exif_transpose — это ещё одна полная копия): маску переводим
+       в сырые координаты, а поворачиваем уже уменьшенный итог;
+    4) вырезка + flatten на месте, полосами по strip_rows строк: маска растягивается только на полосу,
+       смешивание — те же два paste(), что naive_cutout + crop_and_flatten_np, поэтому без поворота
+       результат байт в байт как у segment_proxy + postprocess;
+    5) crop по маске, кадр отпускаем, downscale.
+    Возвращает (RGB-картинку, info: decode_scale, degraded, estimate_mb).
+    """
+    budget = mem_budget_mb * 1024 * 1024
+    with open_image(source) as src:
+        raw_w, raw_h = src.size
+        orientation = src.getexif().get(0x0112, 1)
+        is_jpeg = src.format == "JPEG"
+
+        # 1) proxy и маска (в ориентированных координатах — как у segment_proxy), потом — в сырые
+        if is_jpeg:
+            draft_to_edge(src, proxy_edge)
+        else:
+            # Без draft полный декод неизбежен: сначала проверяем, что кадр вообще влезает,
+            # и уменьшаем его на месте — без копий полного размера (маска та же с точностью до округления)
+            need_mb = _bounded_peak_bytes(src.size, src.mode, 0) / 2**20
+            if need_mb > mem_budget_mb - (current_rss_mb() or 0):
+                raise MemoryBudgetError(f"{raw_w}x{raw_h} {src.format}: full decode needs ~{need_mb:.0f} MB, "
+                                        f"over the {mem_budget_mb:.0f} MB budget (no reduced decode for this format)")
+            src.thumbnail((proxy_edge, proxy_edge), Image.BILINEAR)
+        proxy = ImageOps.exif_transpose(src).convert("RGB")
+        proxy.thumbnail((proxy_edge, proxy_edge), Image.BILINEAR)
+        mask = predict_mask(proxy, model_name)
+        del proxy
+    if orientation in _EXIF_INVERSE:
+        mask = mask.transpose(_EXIF_INVERSE[orientation])
+    mw, mh = mask.size
+
+    box = mask.getbbox() or (0, 0, mw, mh)
+    fx0, fy0 = max(0, box[0] - 1) / mw, max(0, box[1] - 1) / mh
+    fx1, fy1 = min(mw, box[2] + 1) / mw, min(mh, box[3] + 1) / mh
+    crop_frac = (fx1 - fx0) * (fy1 - fy0)
+
+    # 2) масштаб декода
+    need = 1.0
+    if max_edge:
+        crop_long = max((fx1 - fx0) * raw_w, (fy1 - fy0) * raw_h)
+        need = min(1.0, max_edge / crop_long) if crop_long else 1.0
+    factors = [f for f in (1, 2, 4, 8) if is_jpeg or f == 1]
+    fits_quality = [f for f in factors if 1 / f >= need]
+    factor = max(fits_quality) if fits_quality else 1
+    allowance = budget - (current_rss_mb() or 0) * 1024 * 1024
+
+    def size_at(f):
+        return (raw_w + f - 1) // f, (raw_h + f - 1) // f
+
+    src = open_image(source)
+    estimate = _bounded_peak_bytes(size_at(factor), src.mode, crop_frac)
+    degraded = False
+    while estimate > allowance and factor < factors[-1]:
+        factor = factors[factors.index(factor) + 1]
+        estimate = _bounded_peak_bytes(size_at(factor), src.mode, crop_frac)
+        degraded = True
+    if estimate > allowance:
+        src.close()
+        raise MemoryBudgetError(
+            f"{raw_w}x{raw_h} {src.format}: needs ~{estimate / 2**20:.0f} MB at 1/{factor}, "
+            f"only {max(0, allowance) / 2**20:.0f} MB left of {mem_budget_mb:.0f} MB budget")
+    if factor > 1:
+        src.draft("RGB", size_at(factor))
+    src.load()  # декод; файл закрывается сам
+    frame = src.convert("RGB") if src.mode != "RGB" else src
+    del src
+    fw, fh = frame.size
+
+    # 4) вырезка + flatten полосами, прямо в кадре
+    crop_box = (int(fx0 * fw), int(fy0 * fh), max(int(fx0 * fw) + 1, int(fx1 * fw + 0.999)),
+                max(int(fy0 * fh) + 1, int(fy1 * fh + 0.999)))
+    x0, y0, x1, y1 = crop_box
+    sx, sy = mw / fw, mh / fh
+    content = None  # bbox альфы > 0 в координатах кадра, как у crop_and_flatten_np
+    for top in range(y0, y1, max(1, strip_rows)):
+        bottom = min(y1, top + max(1, strip_rows))
+        region = (x0, top, x1, bottom)
+        m = mask.resize((x1 - x0, bottom - top), Image.LANCZOS, box=(x0 * sx, top * sy, x1 * sx, bottom * sy))
+        cut = Image.new("RGB", m.size, 0)
+        cut.paste(frame.crop(region), mask=m)      # naive_cutout: композит на прозрачный
+        flat = Image.new("RGB", m.size, bg_color)
+        flat.paste(cut, mask=m)                    # flatten по альфе
+        frame.paste(flat, region)
+        b = m.getbbox()
+        if b is not None:
+            b = (b[0] + x0, b[1] + top, b[2] + x0, b[3] + top)
+            content = b if content is None else (min(content[0], b[0]), min(content[1], b[1]),
+                                                 max(content[2], b[2]), max(content[3], b[3]))
+
+    # 5) crop, кадр больше не нужен, downscale и поворот уже маленькой картинки
+    im = frame.crop(content or crop_box)
+    del frame
+    im = downscale_pil_to_max_edge(im, max_edge=max_edge)
+    if orientation in _EXIF_TRANSPOSE:
+        im = im.transpose(_EXIF_TRANSPOSE[orientation])
+    return im, {"decode_scale": 1 / factor, "degraded": degraded, "estimate_mb": round(estimate / 2**20, 1)}
+
+
+def postprocess(im: Image.Image, max_edge: int = 1536, bg_color=(255, 255, 255), engine: str = "numpy") -> Image.Image:
+    """
+    crop_to_content -> flatten_alpha -> downscale_pil_to_max_edge.
+    engine="numpy" — crop и flatten за один проход (crop_and_flatten_np), "pil" — по отдельности, как раньше.
+    """
+    if engine == "numpy":
+        im = crop_and_flatten_np(im, alpha_threshold=0, bg_color=bg_color)
+    else:
+        # обрезаем по альфе, чтобы не было лишнего
+        im = crop_to_content(im, alpha_threshold=0)
+
+        # убираем альфа-канал (делаем обычное RGB)
+        im = flatten_alpha(im, bg_color=bg_color)
+
+    # даунскейлим результат
+    return downscale_pil_to_max_edge(im, max_edge=max_edge)
+
+
+# Профили сохранения результата: name -> (PIL format, расширение, параметры save()).
+# После flatten_alpha альфы нет, так что lossless PNG на максимальном сжатии — не всегда то, что нужно.
+OUTPUT_PROFILES = {
+    "archive":       ("PNG",  ".png",  {"optimize": True, "compress_level": 9}),  # как было: медленно, без потерь
+    "png-fast":      ("PNG",  ".png",  {"compress_level": 1}),
+    "webp-lossless": ("WEBP", ".webp", {"lossless": True, "quality": 80, "method": 4}),
+    "webp":          ("WEBP", ".webp", {"quality": 90, "method": 4}),
+    "jpeg":          ("JPEG", ".jpg",  {"quality": 90}),
+}
+LOSSY_PROFILES = {"webp", "jpeg"}  # у них quality — качество; у остальных --quality игнорируется
+
+
+def _save_kwargs(profile: str, quality=None) -> dict:
+    if profile not in OUTPUT_PROFILES:
+        raise ValueError(f"Unknown output profile '{profile}', known: {', '.join(OUTPUT_PROFILES)}")
+    kwargs = dict(OUTPUT_PROFILES[profile][2])
+    if quality is not None and profile in LOSSY_PROFILES:
+        kwargs["quality"] = quality
+    return kwargs
+
+
+def output_path(input_path: str, out_dir: Path = Path("results"), profile: str = "archive") -> Path:
+    return out_dir / f"{Path(input_path).stem}_no_bg{OUTPUT_PROFILES[profile][1]}"
+
+
+def encode(im: Image.Image, profile: str = "archive", quality=None) -> bytes:
+    """Кодируем в память по профилю (для бенчмарка и тех, кому не нужен файл)."""
+    buf = BytesIO()
+    im.save(buf, format=OUTPUT_PROFILES[profile][0], **_save_kwargs(profile, quality))
+    return buf.getvalue()
+
+
+def save_output(im: Image.Image, out_path: Path, profile: str = "archive", quality=None) -> Path:
+    out_path.parent.mkdir(parents=True, exist_ok=True)
+    im.save(out_path, format=OUTPUT_PROFILES[profile][0], **_save_kwargs(profile, quality))
+    return out_path
+
+
+def save_archive(im: Image.Image, out_path: Path) -> Path:
+    """
+    Архивная копия: PNG с максимальным сжатием (медленно — не для горячего пути).
+    """
+    return save_output(im, out_path, profile="archive")
+
+
+def remove_bg(input_path: str, max_edge: int = 1536, profile: str = "archive", quality=None,
+              proxy_edge=None, mem_budget_mb=None) -> str:
     """
     Пайплайн:
     1) читаем исходное изображение
-    2) удаляем фон (backgroundremover.remove) -> PNG с альфой
+    2) удаляем фон (segment) -> RGBA
     3) обрезаем по непрозрачным пикселям (crop_to_content)
     4) убираем альфу (flatten_alpha)
     5) даунскейлим (downscale_pil_to_max_edge)
-    6) сохраняем в results/<stem>_no_bg.png
+    6) сохраняем в results/<stem>_no_bg.<ext> по профилю (OUTPUT_PROFILES; по умолчанию archive — PNG как раньше)
+
+    proxy_edge — сегментировать по уменьшенной копии (segment_proxy), full-res не декодируется.
+    mem_budget_mb — шаги 1–5 через segment_bounded: пик RSS процесса не выше бюджета (или MemoryBudgetError).
+
+    Без записи на диск (картинка остаётся в памяти) — segment() + postprocess(),
+    см. Start/pipeline/garment_pipeline.py.
     """
     inp = Path(input_path)
     if not inp.exists():
         raise FileNotFoundError(f"Input not found: {inp}")
 
+    if mem_budget_mb:
+        im, _ = segment_bounded(str(inp), max_edge=max_edge, mem_budget_mb=mem_budget_mb, proxy_edge=proxy_edge or 640)
+        return str(save_output(im, output_path(input_path, profile=profile), profile=profile, quality=quality))
+
     # 1) читаем исходник
     with open(inp, "rb") as f:
         img_bytes = f.read()
 
     # 2) удаляем фон (на вход подаём bytes)
-    out_png_bytes = remove(img_bytes)
-
-    # 3) открываем результат через PIL
-    im = Image.open(BytesIO(out_png_bytes))
-    im.load()
-
-    # обрезаем по альфе, чтобы не было лишнего
-    im = crop_to_content(im, alpha_threshold=0)
-
-    # 4) убираем альфа-канал (делаем обычное RGB)
-    im = flatten_alpha(im, bg_color=(255, 255, 255))  # фон — белый
+    if proxy_edge:
+        im = segment_proxy(img_bytes, proxy_edge=proxy_edge, max_edge=max_edge)
+    else:
+        im = segment(img_bytes)
 
-    # 5) даунскейлим результат
-    im = downscale_pil_to_max_edge(im, max_edge=max_edge)
+    # 3–5) crop -> flatten -> downscale
+    im = postprocess(im, max_edge=max_edge)
 
     # 6) сохраняем результат
-    out_dir = Path("results")
-    out_dir.mkdir(parents=True, exist_ok=True)
-    out_path = out_dir / f"{inp.stem}_no_bg.png"
-    im.save(out_path, format="PNG", optimize=True, compress_level=9)
-
-    return str(out_path)
+    return str(save_output(im, output_path(input_path, profile=profile), profile=profile, quality=quality))
 
 
 if __name__ == "__main__":
     parser = argparse.ArgumentParser(description="Remove background, crop, drop alpha, then downscale.")
-    parser.add_argument("image", help="Path to input image (jpg/png/webp...)")
+    parser.add_argument("image", help="Path to input image (jpg/png/webp...), a directory, or '-' for a list of paths on stdin")
     parser.add_argument(
         "--max-edge",
         type=int,
         default=1536,
         help="Max size of the long edge in pixels (default: 1536). Only downscales, never upscales.",
     )
+    parser.add_argument(
+        "--profile",
+        choices=list(OUTPUT_PROFILES),
+        default="archive",
+        help="Output encoding (default: archive = PNG optimize, compress_level=9). Compare with bench_encode.py.",
+    )
+    parser.add_argument("--quality", type=int, default=None, help="Quality for lossy profiles (webp, jpeg)")
+    parser.add_argument(
+        "--proxy-edge",
+        type=int,
+        default=0,
+        help="Segment a downscaled copy (long edge N px, e.g. 640) and decode only what max-edge needs. 0 = off.",
+    )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=None,
+        help="Directory/stdin mode: worker processes with a preloaded model (default: CPU cores). See remover_pool.py.",
+    )
+    parser.add_argument(
+        "--service",
+        default=os.environ.get("REMOVER_SERVICE"),
+        help="Send work to a running remover_service.py (http://host:port or unix:/path.sock; env REMOVER_SERVICE)",
+    )
+    parser.add_argument(
+        "--incremental",
+        action="store_true",
+        help="Skip inputs whose content and parameters match the manifest (see manifest.py); process only new/changed",
+    )
+    parser.add_argument(
+        "--watch",
+        action="store_true",
+        help="Keep polling the directory and process files as they land (implies --incremental; Ctrl+C to stop)",
+    )
+    parser.add_argument("--watch-interval", type=float, default=2.0, help="Seconds between polls in --watch (default: 2)")
+    parser.add_argument("--manifest", type=Path, default=None, help="Manifest file (default: results/.manifest.json)")
+    parser.add_argument(
+        "--mem-budget-mb",
+        type=float,
+        default=None,
+        help="Peak RSS budget per process (per worker), MB: reduced decode + strip-wise flatten, see segment_bounded",
+    )
     args = parser.parse_args()
+    if args.service and args.mem_budget_mb:
+        parser.error("--mem-budget-mb applies to local processing; the service has its own memory")
+    from remover_pool import collect_paths, run  # без torch: модель грузят воркеры
+
+    if args.incremental or args.watch:
+        from manifest import DEFAULT_MANIFEST_PATH, Manifest, run_incremental, watch
+        if args.watch and not Path(args.image).is_dir():
+            parser.error("--watch needs a directory")
+        manifest = Manifest(args.manifest or DEFAULT_MANIFEST_PATH, params=dict(
+            max_edge=args.max_edge, bg="ffffff", profile=args.profile,
+            quality=args.quality if args.profile in LOSSY_PROFILES else None,
+            proxy_edge=args.proxy_edge, raw=False, model="u2net", mem_budget_mb=args.mem_budget_mb))
+
+        def process(paths):
+            if args.service:
+                from remover_service import run_via_service
+                return run_via_service(paths, args.service, concurrency=args.workers or 4, manifest=manifest,
+                                       max_edge=args.max_edge, profile=args.profile, quality=args.quality,
+                                       proxy_edge=args.proxy_edge or None)
+            # watch и одиночный файл — в этом процессе (модель одна на весь цикл), пакет — пулом
+            return run(paths, args.workers, inline=args.watch or len(paths) == 1, manifest=manifest,
+                       max_edge=args.max_edge, profile=args.profile, quality=args.quality, proxy_edge=args.proxy_edge,
+                       mem_budget_mb=args.mem_budget_mb)
+
+        if args.watch:
+            watch(lambda: collect_paths(args.image), manifest, process, interval=args.watch_interval)
+            raise SystemExit(0)
+        summary = run_incremental(lambda: collect_paths(args.image), manifest, process)
+        print(f"\nok: {summary['ok']}  errors: {summary['errors']}  {summary['images_per_sec']:.2f} img/s")
+        raise SystemExit(1 if summary["errors"] else 0)
+
+    if args.service:
+        # Тонкий клиент: модель уже тёплая в сервисе
+        from remover_service import remove_bg_via_service, run_via_service
+        params = dict(max_edge=args.max_edge, profile=args.profile, quality=args.quality,
+                      proxy_edge=args.proxy_edge or None)
+        if args.image == "-" or Path(args.image).is_dir():
+            summary = run_via_service(collect_paths(args.image), args.service, concurrency=args.workers or 4, **params)
+            print(f"\nok: {summary['ok']}  errors: {summary['errors']}  {summary['images_per_sec']:.2f} img/s")
+            raise SystemExit(1 if summary["errors"] else 0)
+        print(f"✅ Saved: {remove_bg_via_service(args.service, args.image, **params)}")
+        raise SystemExit(0)
+
+    if args.image == "-" or Path(args.image).is_dir():
+        summary = run(collect_paths(args.image), args.workers, max_edge=args.max_edge,
+                      profile=args.profile, quality=args.quality, proxy_edge=args.proxy_edge,
+                      mem_budget_mb=args.mem_budget_mb)
+        print(f"\nok: {summary['ok']}  errors: {summary['errors']}  {summary['images_per_sec']:.2f} img/s")
+        raise SystemExit(1 if summary["errors"] else 0)
 
-    saved_to = remove_bg(args.image, max_edge=args.max_edge)
+    saved_to = remove_bg(args.image, max_edge=args.max_edge, profile=args.profile, quality=args.quality,
+                         proxy_edge=args.proxy_edge, mem_budget_mb=args.mem_budget_mb)
     print(f"✅ Saved: {saved_to}")
@@ -0,0 +1,497 @@
+# remover_service.py
+# pip install backgroundremover pillow
+"""
+Локальный сервис удаления фона: модель загружена один раз и остаётся тёплой.
+
+Вместо запуска remover.py / remover_resize.py на каждую картинку (импорт torch + загрузка
+модели — секунды) бэкенд шлёт байты картинки сюда и получает готовый результат.
+
+    python remover_service.py --port 8765
+    python remover_service.py --unix /tmp/remover.sock
+
+    POST /remove?max_edge=1536&bg=ffffff&profile=png-fast   тело — картинка, ответ — результат
+         параметры: max_edge, bg (hex или 'none' — RGBA без заливки), profile, quality,
+                    proxy_edge, raw=1 (вырезка как есть, без crop/resize — как back-remove/remover.py)
+    GET  /health    JSON: модель, глубина очереди
+    GET  /metrics   Prometheus text: очередь, запросы по статусам, время по этапам, размер батчей
+
+Декод, вырезка, postprocess и encode идут в потоках HTTP-обработчиков (не больше --cpu-workers
+одновременно; PIL отпускает GIL). В ограниченную очередь (полная — 503 + Retry-After) попадает
+уже готовый вход сети; поток инференса берёт из неё до --batch-size запросов (ждёт добора не дольше
+--batch-wait-ms) и делает только одно — прогоняет сеть одним батчем.
+
+Клиент: call_service() ниже; remover.py и remover_resize.py используют его с --service ADDR
+или переменной окружения REMOVER_SERVICE (http://host:port или unix:/path.sock).
+"""
+
+from collections import defaultdict, deque
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from socketserver import ThreadingMixIn, UnixStreamServer
+from typing import Dict, List, Optional, Tuple
+from urllib.parse import parse_qs, urlencode, urlparse
+import argparse
+import http.client
+import json
+import os
+import queue
+import socket
+import sys
+import threading
+import time
+
+from remover_resize import OUTPUT_PROFILES
+
+SERVICE_ENV = "REMOVER_SERVICE"
+STAGES = ["queue_wait", "decode", "segment", "postprocess", "encode"]
+_MIME = {"PNG": "image/png", "WEBP": "image/webp", "JPEG": "image/jpeg"}
+
+
+class Job:
+    def __init__(self, img_bytes: bytes, params: Dict):
+        self.img_bytes = img_bytes
+        self.params = params
+        self.enqueued = time.perf_counter()
+        self.stages: Dict[str, float] = {}
+        self.img = None          # декодированный кадр (RGB)
+        self.net_input = None    # то, что уходит в сеть: кадр или его уменьшенная копия (proxy_edge)
+        self.mask = None         # маска от потока инференса
+        self.done = threading.Event()
+        self.result: Optional[Tuple[bytes, str]] = None
+        self.error: Optional[str] = None
+        self.cancelled = False   # клиент уже получил 504 — в сеть не отдаём
+
+
+class StageStats:
+    """Скользящее окно латентностей по этапам + счётчики для /metrics."""
+
+    def __init__(self, window: int = 1024):
+        self._lock = threading.Lock()
+        self._recent: Dict[str, deque] = defaultdict(lambda: deque(maxlen=window))
+        self._sum: Dict[str, float] = defaultdict(float)
+        self._count: Dict[str, int] = defaultdict(int)
+        self.requests: Dict[str, int] = defaultdict(int)
+        self.batch_sizes: Dict[int, int] = defaultdict(int)
+
+    def observe(self, stages: Dict[str, float]) -> None:
+        with self._lock:
+            for name, sec in stages.items():
+                self._recent[name].append(sec)
+                self._sum[name] += sec
+                self._count[name] += 1
+
+    def count(self, status: str) -> None:
+        with self._lock:
+            self.requests[status] += 1
+
+    def batch(self, size: int) -> None:
+        with self._lock:
+            self.batch_sizes[size] += 1
+
+    def prometheus(self, queue_depth: int, queue_max: int) -> str:
+        out = [
+            "# HELP remover_queue_depth Requests waiting for the inference thread.",
+            "# TYPE remover_queue_depth gauge",
+            f"remover_queue_depth {queue_depth}",
+            "# HELP remover_queue_capacity Maximum queue depth before 503.",
+            "# TYPE remover_queue_capacity gauge",
+            f"remover_queue_capacity {queue_max}",
+            "# HELP remover_requests_total Requests by outcome.",
+            "# TYPE remover_requests_total counter",
+        ]
+        with self._lock:
+            for status, n in sorted(self.requests.items()):
+                out.append(f'remover_requests_total{{status="{status}"}} {n}')
+            out += ["# HELP remover_stage_seconds Per-request time by stage (rolling window quantiles).",
+                    "# TYPE remover_stage_seconds summary"]
+            for name in [*STAGES, "total"]:
+                xs = sorted(self._recent.get(name, ()))
+                for q in (0.5, 0.95, 0.99):
+                    if xs:
+                        out.append(f'remover_stage_seconds{{stage="{name}",quantile="{q}"}} '
+                                   f'{xs[min(len(xs) - 1, int(q * len(xs)))]:.4f}')
+                out.append(f'remover_stage_seconds_sum{{stage="{name}"}} {self._sum.get(name, 0.0):.4f}')
+                out.append(f'remover_stage_seconds_count{{stage="{name}"}} {self._count.get(name, 0)}')
+            out += ["# HELP remover_batches_total Inference batches by size.",
+                    "# TYPE remover_batches_total counter"]
+            for size, n in sorted(self.batch_sizes.items()):
+                out.append(f'remover_batches_total{{size="{size}"}} {n}')
+        return "\n".join(out) + "\n"
+
+
+def _parse_bg(value: str):
+    if value.lower() in ("none", "transparent"):
+        return None
+    value = value.lstrip("#")
+    if len(value) != 6:
+        raise ValueError(f"bg must be RRGGBB hex or 'none', got '{value}'")
+    return tuple(int(value[i:i + 2], 16) for i in (0, 2, 4))
+
+
+def parse_params(query: str) -> Dict:
+    q = {k: v[-1] for k, v in parse_qs(query).items()}
+    profile = q.get("profile", "png-fast")
+    if profile not in OUTPUT_PROFILES:
+        raise ValueError(f"unknown profile '{profile}', known: {', '.join(OUTPUT_PROFILES)}")
+    params = {
+        "max_edge": int(q.get("max_edge", 1536)),
+        "bg": _parse_bg(q.get("bg", "ffffff")),
+        "profile": profile,
+        "quality": int(q["quality"]) if "quality" in q else None,
+        "proxy_edge": int(q.get("proxy_edge", 0)),
+        "raw": q.get("raw", "0") in ("1", "true", "yes"),
+    }
+    if (params["raw"] or params["bg"] is None) and OUTPUT_PROFILES[profile][0] == "JPEG":
+        raise ValueError("jpeg has no alpha: use bg=RRGGBB or a png/webp profile")
+    return params
+
+
+class RemoverService:
+    """
+    Очередь + один поток инференса с микро-батчами. Модель загружается в start().
+    CPU-работа (submit: декод; finish: вырезка, postprocess, encode) — в потоке вызывающего,
+    не больше cpu_workers одновременно; поток инференса занят только сетью.
+    """
+
+    def __init__(self, model_name: str = "u2net", queue_size: int = 32, batch_size: int = 4, batch_wait_ms: float = 10.0,
+                 cpu_workers: Optional[int] = None):
+        self.model_name = model_name
+        self.queue: "queue.Queue[Job]" = queue.Queue(maxsize=queue_size)
+        self.batch_size = max(1, batch_size)
+        self.batch_wait = batch_wait_ms / 1000
+        self.cpu_workers = max(1, cpu_workers or os.cpu_count() or 1)
+        self._cpu = threading.BoundedSemaphore(self.cpu_workers)
+        self.stats = StageStats()
+        self.model_loaded = False
+        self.started = time.time()
+        self._thread = threading.Thread(target=self._loop, name="inference", daemon=True)
+
+    def start(self) -> None:
+        from remover_resize import load_model
+        t = time.perf_counter()
+        load_model(self.model_name)
+        self.model_loaded = True
+        print(f"model '{self.model_name}' loaded in {time.perf_counter() - t:.1f}s", file=sys.stderr)
+        self._thread.start()
+
+    def submit(self, img_bytes: bytes, params: Dict) -> Job:
+        """
+        Декодировать и поставить в очередь к сети.
+        queue.Full — очередь переполнена; ValueError — картинка не декодируется.
+        """
+        if self.queue.full():  # отказ сразу, не тратя декод на запрос, который всё равно не влезет
+            raise queue.Full
+        from PIL import Image
+        from remover_resize import load_image
+
+        job = Job(img_bytes, params)
+        with self._cpu:
+            t = time.perf_counter()
+            try:
+                job.img = load_image(img_bytes)
+            except Exception as e:
+                raise ValueError(f"cannot decode image: {e}") from e
+            job.img_bytes = None  # исходник больше не нужен — не держим его в очереди
+            job.net_input = job.img
+            if params["proxy_edge"]:
+                # маска нормирована на весь кадр — сети хватает уменьшенной копии
+                job.net_input = job.img.copy()
+                job.net_input.thumbnail((params["proxy_edge"],) * 2, Image.BILINEAR)
+            job.stages["decode"] = time.perf_counter() - t
+        job.enqueued = time.perf_counter()
+        self.queue.put_nowait(job)
+        return job
+
+    def finish(self, job: Job) -> None:
+        """После маски: вырезка, postprocess, encode -> job.result (или job.error)."""
+        from backgroundremover.bg import naive_cutout
+        from remover_resize import crop_to_content, downscale_pil_to_max_edge, encode, postprocess
+
+        p = job.params
+        with self._cpu:
+            try:
+                t = time.perf_counter()
+                im = naive_cutout(job.img, job.mask)
+                job.img = job.mask = None
+                if not p["raw"]:
+                    if p["bg"] is None:
+                        im = downscale_pil_to_max_edge(crop_to_content(im), max_edge=p["max_edge"])
+                    else:
+                        im = postprocess(im, max_edge=p["max_edge"], bg_color=p["bg"])
+                job.stages["postprocess"] = time.perf_counter() - t
+                t = time.perf_counter()
+                data = encode(im, p["profile"], quality=p["quality"])
+                job.stages["encode"] = time.perf_counter() - t
+                job.result = (data, _MIME[OUTPUT_PROFILES[p["profile"]][0]])
+            except Exception as e:
+                job.error = f"{type(e).__name__}: {e}"
+
+    def _next_batch(self) -> List[Job]:
+        batch = [self.queue.get()]
+        deadline = time.perf_counter() + self.batch_wait
+        while len(batch) < self.batch_size:
+            left = deadline - time.perf_counter()
+            if left <= 0:
+                break
+            try:
+                batch.append(self.queue.get(timeout=left))
+            except queue.Empty:
+                break
+        return batch
+
+    def _loop(self) -> None:
+        while True:
+            batch = self._next_batch()
+            try:
+                self._process(batch)
+            except Exception as e:  # сеть упала на батче — отвечаем ошибкой всем, сервис живёт дальше
+                for job in batch:
+                    if not job.done.is_set():
+                        job.error = f"{type(e).__name__}: {e}"
+                        job.done.set()
+
+    def _process(self, batch: List[Job]) -> None:
+        from remover_resize import predict_masks
+
+        live = []
+        for job in batch:
+            if job.cancelled:
+                job.img = job.net_input = None
+            else:
+                live.append(job)
+        batch = live
+        if not batch:
+            return
+        start = time.perf_counter()
+        for job in batch:
+            job.stages["queue_wait"] = start - job.enqueued
+        masks = predict_masks([job.net_input for job in batch], self.model_name)
+        seg = time.perf_counter() - start
+        self.stats.batch(len(batch))
+        for job, mask in zip(batch, masks):
+            job.stages["segment"] = seg  # общий прогон сети на весь батч
+            job.mask, job.net_input = mask, None
+            job.done.set()
+
+
+class _Handler(BaseHTTPRequestHandler):
+    server_version = "remover/1"
+    service: RemoverService = None
+    max_body = 40 * 1024 * 1024
+    timeout_s = 60.0
+
+    def address_string(self) -> str:
+        # У Unix-сокета client_address — пустая строка
+        return self.client_address[0] if isinstance(self.client_address, tuple) else "unix"
+
+    def log_message(self, fmt, *args) -> None:
+        pass  # доступ-лог не нужен: всё видно в /metrics
+
+    def _send(self, code: int, body: bytes, ctype: str, headers: Optional[Dict[str, str]] = None) -> None:
+        self.send_response(code)
+        self.send_header("Content-Type", ctype)
+        self.send_header("Content-Length", str(len(body)))
+        for k, v in (headers or {}).items():
+            self.send_header(k, v)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _json(self, code: int, obj: Dict) -> None:
+        self._send(code, json.dumps(obj).encode("utf-8"), "application/json")
+
+    def do_GET(self) -> None:
+        svc = self.service
+        path = urlparse(self.path).path
+        if path == "/health":
+            self._json(200 if svc.model_loaded else 503, {
+                "status": "ok" if svc.model_loaded else "loading", "model": svc.model_name,
+                "queue_depth": svc.queue.qsize(), "queue_max": svc.queue.maxsize,
+                "uptime_seconds": round(time.time() - svc.started, 1),
+            })
+        elif path == "/metrics":
+            text = svc.stats.prometheus(svc.queue.qsize(), svc.queue.maxsize)
+            self._send(200, text.encode("utf-8"), "text/plain; version=0.0.4")
+        else:
+            self._json(404, {"error": "not found"})
+
+    def do_POST(self) -> None:
+        svc = self.service
+        url = urlparse(self.path)
+        if url.path != "/remove":
+            self._json(404, {"error": "not found"})
+            return
+        length = int(self.headers.get("Content-Length") or 0)
+        if length <= 0:
+            svc.stats.count("bad_request")
+            self._json(400, {"error": "empty body"})
+            return
+        if length > self.max_body:
+            svc.stats.count("too_large")
+            self._json(413, {"error": f"body larger than {self.max_body} bytes"})
+            return
+        body = self.rfile.read(length)
+        try:
+            params = parse_params(url.query)
+        except ValueError as e:
+            svc.stats.count("bad_request")
+            self._json(400, {"error": str(e)})
+            return
+
+        t0 = time.perf_counter()
+        try:
+            job = svc.submit(body, params)
+        except queue.Full:
+            svc.stats.count("rejected")
+            self._send(503, b'{"error": "queue full"}', "application/json", {"Retry-After": "1"})
+            return
+        except ValueError as e:
+            svc.stats.count("error")
+            self._json(422, {"error": str(e)})
+            return
+        if not job.done.wait(self.timeout_s):
+            job.cancelled = True
+            svc.stats.count("timeout")
+            self._json(504, {"error": "timed out in queue"})
+            return
+        if not job.error:
+            svc.finish(job)
+        if job.error:
+            svc.stats.count("error")
+            self._json(422, {"error": job.error})
+            return
+        job.stages["total"] = time.perf_counter() - t0
+        svc.stats.observe(job.stages)
+        svc.stats.count("ok")
+        data, ctype = job.result
+        self._send(200, data, ctype, {"X-Stage-Seconds": json.dumps({k: round(v, 4) for k, v in job.stages.items()})})
+
+
+class _ThreadingUnixHTTPServer(ThreadingMixIn, UnixStreamServer):
+    daemon_threads = True
+
+    def server_bind(self):
+        UnixStreamServer.server_bind(self)
+        self.server_name, self.server_port = "localhost", 0
+
+
+# =======================
+# Клиент
+# =======================
+class _UnixHTTPConnection(http.client.HTTPConnection):
+    def __init__(self, path: str, timeout: float):
+        super().__init__("localhost", timeout=timeout)
+        self._path = path
+
+    def connect(self):
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.sock.settimeout(self.timeout)
+        self.sock.connect(self._path)
+
+
+def _connection(address: str, timeout: float) -> http.client.HTTPConnection:
+    if address.startswith("unix:"):
+        return _UnixHTTPConnection(address[len("unix:"):], timeout)
+    url = urlparse(address if "://" in address else f"http://{address}")
+    return http.client.HTTPConnection(url.hostname, url.port or 80, timeout=timeout)
+
+
+def call_service(address: str, img_bytes: bytes, timeout: float = 120.0, **params) -> Tuple[bytes, Dict]:
+    """
+    Отправить картинку сервису, вернуть (байты результата, X-Stage-Seconds).
+    params — max_edge, bg ('ffffff' / 'none'), profile, quality, proxy_edge, raw.
+    """
+    query = urlencode({k: (int(v) if isinstance(v, bool) else v) for k, v in params.items() if v is not None})
+    conn = _connection(address, timeout)
+    try:
+        conn.request("POST", f"/remove?{query}", body=img_bytes,
+                     headers={"Content-Type": "application/octet-stream"})
+        resp = conn.getresponse()
+        data = resp.read()
+        if resp.status != 200:
+            raise RuntimeError(f"remover service {resp.status}: {data.decode('utf-8', 'replace')}")
+        return data, json.loads(resp.getheader("X-Stage-Seconds") or "{}")
+    finally:
+        conn.close()
+
+
+def remove_bg_via_service(address: str, input_path: str, out_dir: Path = Path("results"), raw: bool = False,
+                          profile: str = "archive", **params) -> str:
+    """Как remove_bg(): results/<stem>_no_bg.<ext>, только работу делает сервис."""
+    from remover_resize import output_path
+    data, _ = call_service(address, Path(input_path).read_bytes(), raw=raw, profile=profile, **params)
+    out = output_path(input_path, out_dir, profile="archive" if raw else profile)
+    out.parent.mkdir(parents=True, exist_ok=True)
+    out.write_bytes(data)
+    return str(out)
+
+
+def run_via_service(paths: List[str], address: str, concurrency: int = 4, manifest=None, **kwargs) -> Dict:
+    """
+    Пакет через сервис: до `concurrency` запросов в полёте (сервис сам соберёт их в батчи).
+    manifest — как в remover_pool.run: готовые/упавшие отмечаются в основном потоке.
+    """
+    t0 = time.perf_counter()
+    ok = errors = 0
+    with ThreadPoolExecutor(max_workers=max(1, concurrency)) as pool:
+        futures = {pool.submit(remove_bg_via_service, address, p, **kwargs): p for p in paths}
+        for fut in as_completed(futures):
+            try:
+                saved_to = fut.result()
+            except Exception as e:
+                errors += 1
+                if manifest is not None:
+                    manifest.fail(futures[fut])
+                print(f"[error] {futures[fut]}: {e}", file=sys.stderr)
+                continue
+            ok += 1
+            if manifest is not None:
+                manifest.done(futures[fut], saved_to)
+            print(f"✅ {futures[fut]} -> {saved_to}", flush=True)
+    wall = time.perf_counter() - t0
+    return {"ok": ok, "errors": errors, "wall": wall, "images_per_sec": ok / wall if wall > 0 else 0.0}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Background removal service with a warm model.")
+    where = parser.add_mutually_exclusive_group()
+    where.add_argument("--port", type=int, default=8765, help="TCP port on --host (default: 8765)")
+    where.add_argument("--unix", metavar="PATH", help="Listen on a Unix socket instead of TCP")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--model", default="u2net", choices=["u2net", "u2netp", "u2net_human_seg"])
+    parser.add_argument("--queue-size", type=int, default=32, help="Max waiting requests before 503 (default: 32)")
+    parser.add_argument("--batch-size", type=int, default=4, help="Max images per network run (default: 4)")
+    parser.add_argument("--batch-wait-ms", type=float, default=10.0,
+                        help="How long to wait for more requests to fill a batch (default: 10 ms)")
+    parser.add_argument("--cpu-workers", type=int, default=None,
+                        help="Max requests decoding/encoding at once in handler threads (default: CPU cores)")
+    parser.add_argument("--timeout", type=float, default=60.0, help="Max seconds a request may wait (default: 60)")
+    parser.add_argument("--max-body-mb", type=float, default=40.0)
+    args = parser.parse_args()
+
+    service = RemoverService(args.model, queue_size=args.queue_size, batch_size=args.batch_size,
+                             batch_wait_ms=args.batch_wait_ms, cpu_workers=args.cpu_workers)
+    service.start()
+    handler = type("Handler", (_Handler,), {"service": service, "timeout_s": args.timeout,
+                                            "max_body": int(args.max_body_mb * 1024 * 1024)})
+    if args.unix:
+        if os.path.exists(args.unix):
+            os.unlink(args.unix)
+        server = _ThreadingUnixHTTPServer(args.unix, handler)
+        where = f"unix:{args.unix}"
+    else:
+        server = ThreadingHTTPServer((args.host, args.port), handler)
+        where = f"http://{args.host}:{args.port}"
+    print(f"listening on {where}  (set {SERVICE_ENV}={where} for remover.py / remover_resize.py)", file=sys.stderr)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        if args.unix and os.path.exists(args.unix):
+            os.unlink(args.unix)
+
+
+if __name__ == "__main__":
+    main()